@@ -1,8 +1,22 @@
+import os
 import streamlit as st
 import pandas as pd
 from datetime import date, datetime, timedelta
-from reloj_circular import generar_reloj
+from reloj_circular import (calcular_reloj, dibujar_reloj, dibujar_reloj_multiple, dibujar_relojes_grilla,
+                            calcular_indicadores_lote, sensibilidad_umbral, IndiceEventos)
 import matplotlib.pyplot as plt
+from datos import (SHEET_EXPORT_URL, MACHINE_NAME_TO_ID, SnapshotEventos,
+                   compactar_eventos, filtrar_eventos, leer_snapshot, snapshot_a_pandas)
+from fuentes import cargar_registro
+from cubo_kpis import actualizar_cubo, fechas_en_cubo, leer_cubo, leer_tendencia
+import diagnostico
+from diagnostico import etapa
+from exportar import MIME_XLSX, excel_consolidado, excel_detalle_dia
+from imagenes_reloj import (CacheRelojes, crear_pool_render, figura_a_bytes, memoria_por_reloj,
+                            procesos_render, renderizar_relojes)
+from simultaneidad import analizar_linea, perfil_dia
+from turnos import cargar_calendario
+from vivo import MonitorVivo
 
 # =========================================================
 # Configuración general
@@ -10,71 +24,148 @@ import matplotlib.pyplot as plt
 st.set_page_config(page_title="Reloj de Tiempos Muertos", layout="wide")
 st.title("📊 Reloj Circular de Tiempos Muertos")
 
-# =========================================================
-# CONFIGURACIÓN GOOGLE SHEETS (XLSX export)
-# =========================================================
-SHEET_EXPORT_URL = (
-    "https://docs.google.com/spreadsheets/d/"
-    "1clzNg0YblSQVvpWlWqeAwHKYiTyKcv-meWaI1RILAFo/export?format=xlsx"
-)
-
-# =========================================================
-# Mapeo nombre ↔ ID de máquina (para UI amigable)
-# =========================================================
-MACHINE_NAME_TO_ID = {
-    "Seccionadora": "4C4F686CDDA0",
-    "Centro de Mecanizado 1": "84EA676CDDA0",
-    "Centro de Mecanizado 2": "98D1676CDDA0",
-    "Pegadora 1": "3C75A0C964EC",
-    "Pegadora 2": "8C6EA51FB608",
-}
-ID_TO_MACHINE_NAME = {v: k for k, v in MACHINE_NAME_TO_ID.items()}
+# Diagnóstico opcional: tiempos por etapa + contadores de caché (también como logs JSON)
+diagnostico.activar(st.sidebar.toggle("🩺 Diagnóstico de rendimiento", value=False))
 
 # =========================================================
 # Carga de datos
 # =========================================================
-@st.cache_data(show_spinner=False)
-def cargar_excel_desde_sheet(url: str) -> pd.DataFrame:
-    df = pd.read_excel(url, sheet_name=0, engine="openpyxl", header=1)
-    return df
-
-def normalizar_columnas(df: pd.DataFrame) -> pd.DataFrame:
-    df.columns = [str(c).strip() for c in df.columns]
-    rename_map = {}
-    for c in df.columns:
-        cl = (
-            str(c)
-            .strip()
-            .lower()
-            .replace("í", "i").replace("á", "a").replace("é", "e")
-            .replace("ó", "o").replace("ú", "u")
-        )
-        if cl in ["fecha", "fecha y hora", "fecha/hora", "timestamp", "date", "datetime"]:
-            rename_map[c] = "Fecha"
-        if cl in ["id equipo", "id_equipo", "id maquina", "id máquina", "equipo", "machineid", "idequipo"]:
-            rename_map[c] = "Id Equipo"
-    df = df.rename(columns=rename_map)
-    if "Fecha" not in df.columns or "Id Equipo" not in df.columns:
-        raise ValueError("No se encuentran las columnas requeridas: 'Fecha' y 'Id Equipo'.")
-    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce", infer_datetime_format=True)
-    df["Id Equipo"] = df["Id Equipo"].astype(str).str.strip()
-    return df
-
+# Snapshot local de la hoja (Arrow IPC). RELOJ_FUENTE permite usar un archivo
+# local en lugar del sheet; RELOJ_SNAPSHOT_TTL es la vigencia en segundos.
+# Varias plantas: RELOJ_FUENTES apunta a un JSON con el sheet (o archivo) y el mapa
+# de máquinas de cada una (ver fuentes.py); se leen en paralelo y se unen en el snapshot.
+FUENTES_CONFIG = os.environ.get("RELOJ_FUENTES")
+FUENTE_DATOS = FUENTES_CONFIG or os.environ.get("RELOJ_FUENTE", SHEET_EXPORT_URL)
+SNAPSHOT_PATH = os.environ.get("RELOJ_SNAPSHOT", "eventos_snapshot.arrow")
+SNAPSHOT_TTL = float(os.environ.get("RELOJ_SNAPSHOT_TTL", "600"))
+# Modo compacto: solo Fecha / Id Equipo / Parcial con tipos chicos (RELOJ_COMPACTO=0 lo desactiva)
+MODO_COMPACTO = os.environ.get("RELOJ_COMPACTO", "1") != "0"
+# Cubo diario de KPIs precalculado por cubo_kpis.py (si existe, el resumen lo lee de ahí)
+CUBO_PATH = os.environ.get("RELOJ_CUBO", "kpi_cubo")
+# Calendario de turnos (JSON, ver turnos.py); sin RELOJ_CALENDARIO rige el de planta
+CALENDARIO = cargar_calendario(os.environ.get("RELOJ_CALENDARIO"))
+# Con turnos noche los eventos del día siguiente también alimentan el reloj del día
+DIAS_HUELLA = 2 if CALENDARIO.cruza_medianoche() else 1
+# Modo en vivo: sondea RELOJ_VIVO_FUENTE (por defecto la misma fuente; sirve un CSV
+# local al que se le agregan filas) cada RELOJ_VIVO_INTERVALO segundos
+FUENTE_VIVO = os.environ.get("RELOJ_VIVO_FUENTE", FUENTE_DATOS)
+INTERVALO_VIVO = float(os.environ.get("RELOJ_VIVO_INTERVALO", "60"))
+# Máximo que se espera a una planta lenta antes de seguir con sus últimos datos
+# (RELOJ_ESPERA_PLANTAS; la clave "espera" del JSON de plantas tiene prioridad)
+ESPERA_PLANTAS = float(os.environ.get("RELOJ_ESPERA_PLANTAS", "15"))
+
+@st.cache_resource(show_spinner=False)
+def obtener_registro(config: str, ttl: float):
+    # Registro de plantas con su pool de hilos y conexiones HTTP (se reutilizan entre refrescos)
+    return cargar_registro(config, ttl_segundos=ttl, espera_segundos=ESPERA_PLANTAS)
+
+def origen_de(origen: str, ttl: float):
+    """El registro de plantas si `origen` es el JSON de RELOJ_FUENTES; si no, la URL / archivo."""
+    return obtener_registro(origen, ttl) if FUENTES_CONFIG and origen == FUENTES_CONFIG else origen
+
+@st.cache_resource(show_spinner=False)
+def obtener_snapshot(origen: str, ruta: str, ttl: float) -> SnapshotEventos:
+    return SnapshotEventos(origen_de(origen, ttl), ruta, ttl_segundos=ttl)
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def cargar_datos(origen: str, ruta: str, version: str, compacto: bool):
+    # `version` (filas y huella del snapshot) invalida la caché solo cuando cambian los datos
+    df = snapshot_a_pandas(leer_snapshot(ruta))
+    if not compacto:
+        return df, None
+    with etapa("compactar") as e:
+        df, informe = compactar_eventos(df)
+        e.anotar(**informe)
+    return df, informe
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def obtener_indice(ruta: str, version: str, _df: pd.DataFrame) -> IndiceEventos:
+    # Un índice por carga de datos (misma clave de versión que cargar_datos)
+    with etapa("indice", filas=len(_df)):
+        return IndiceEventos(_df)
+
+@st.cache_resource(show_spinner=False)
+def obtener_cache_relojes() -> CacheRelojes:
+    # RELOJ_CACHE_DIR (opcional) persiste los relojes renderizados en disco,
+    # hasta RELOJ_CACHE_DISCO_MB (por defecto 512 MB)
+    return CacheRelojes(directorio=os.environ.get("RELOJ_CACHE_DIR") or None,
+                        max_bytes_disco=int(os.environ.get("RELOJ_CACHE_DISCO_MB", "512")) * 1024 * 1024)
+
+@st.cache_resource(show_spinner=False)
+def obtener_monitor(origen: str, umbral_min: int) -> MonitorVivo:
+    # Un monitor por fuente y umbral: guarda el estado incremental entre sondeos
+    # (con varias plantas, su propio registro sin vigencia: cada sondeo relee las fuentes)
+    return MonitorVivo(origen_de(origen, 0.0), umbral_minutos=umbral_min, calendario=CALENDARIO)
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def plantas_por_maquina(ruta: str, version: str, _df: pd.DataFrame) -> dict:
+    # Id Equipo -> planta, según las filas de cada fuente
+    return _df.groupby("Id Equipo", observed=True)["Planta"].first().astype(str).to_dict()
+
+# RELOJ_PROCESOS_RENDER fija la cantidad de procesos de render (por defecto hasta 4)
+PROCESOS_RENDER = procesos_render(int(os.environ.get("RELOJ_PROCESOS_RENDER", "0")) or None)
+
+@st.cache_resource(show_spinner=False)
+def obtener_pool_render():
+    return crear_pool_render(PROCESOS_RENDER)
+
+snapshot = obtener_snapshot(FUENTE_DATOS, SNAPSHOT_PATH, SNAPSHOT_TTL)
 with st.spinner("Cargando datos de Google Sheets..."):
-    raw = cargar_excel_desde_sheet(SHEET_EXPORT_URL)
-df = normalizar_columnas(raw)
+    if not snapshot.version():
+        snapshot.refrescar()
+    elif snapshot.vencido():
+        snapshot.refrescar_en_segundo_plano()
+    version_datos = snapshot.version()
+    df, informe_memoria = cargar_datos(FUENTE_DATOS, SNAPSHOT_PATH, version_datos, MODO_COMPACTO)
+    indice = obtener_indice(SNAPSHOT_PATH, version_datos, df)
+informe_fechas = snapshot.informe_fechas
+if informe_fechas and informe_fechas["nat"] > informe_fechas["vacias"]:
+    st.warning(
+        f"{informe_fechas['nat'] - informe_fechas['vacias']} fila(s) con 'Fecha' no interpretable "
+        f"quedaron fuera del análisis (formatos detectados: {informe_fechas['por_formato']})."
+    )
+if snapshot.ultimo_error is not None:
+    st.warning(f"No se pudo actualizar la fuente; se muestran datos del snapshot local. ({snapshot.ultimo_error})")
+
+# Mapa nombre ↔ ID: el de cada planta del registro, o el de datos.py con una sola fuente
+NOMBRE_A_ID = MACHINE_NAME_TO_ID
+if FUENTES_CONFIG:
+    registro = obtener_registro(FUENTES_CONFIG, SNAPSHOT_TTL)
+    NOMBRE_A_ID = registro.nombre_a_id()
+    fallidas = registro.fallidas()
+    if fallidas:
+        st.warning("No se pudieron leer algunas plantas; se usan sus últimos datos: "
+                   + "; ".join(f"{p} ({e})" for p, e in fallidas.items()))
+        if st.button("Reintentar plantas con error"):
+            with st.spinner("Reintentando..."):
+                registro.refrescar_fallidas()
+                snapshot.refrescar_en_segundo_plano()
+            st.rerun()
+    demoradas = registro.demoradas()
+    if demoradas:
+        st.info("Plantas que todavía se están leyendo; se usan sus últimos datos: " + ", ".join(demoradas))
+ID_A_NOMBRE = {v: k for k, v in NOMBRE_A_ID.items()}
 
 # =========================================================
 # Interfaz
 # =========================================================
 # IDs que realmente existen en los datos
-ids_en_datos = sorted(df["Id Equipo"].dropna().unique())
+ids_en_datos = indice.maquinas()
+
+# Con varias plantas, se elige una (o todas) antes que las máquinas
+if "Planta" in df.columns:
+    planta_de = plantas_por_maquina(SNAPSHOT_PATH, version_datos, df)
+    plantas = sorted(set(planta_de.values()))
+    if len(plantas) > 1:
+        planta_sel = st.sidebar.selectbox("Planta", ["Todas"] + plantas)
+        if planta_sel != "Todas":
+            ids_en_datos = [m for m in ids_en_datos if planta_de.get(m) == planta_sel]
 
 # Construimos lista visible de nombres:
 # 1) Primero los nombres mapeados que estén en los datos
-nombres_disponibles = [name for name, mid in MACHINE_NAME_TO_ID.items() if mid in ids_en_datos]
+nombres_disponibles = [name for name, mid in NOMBRE_A_ID.items() if mid in ids_en_datos]
 # 2) Si hay IDs en los datos que no estén en el mapeo, los agregamos como “Código: <id>”
-extras = [f"Código: {mid}" for mid in ids_en_datos if mid not in MACHINE_NAME_TO_ID.values()]
+extras = [f"Código: {mid}" for mid in ids_en_datos if mid not in NOMBRE_A_ID.values()]
 opciones_maquina = nombres_disponibles + extras
 
 col_top1, col_top2, col_top3 = st.columns([1, 1, 1])
@@ -87,9 +178,9 @@ if not modo_multiple_maquinas:
     maquina_vis = col_top1.selectbox("Máquina", opciones_maquina, index=0)
     if maquina_vis.startswith("Código: "):
         maquina_id_unica = maquina_vis.replace("Código: ", "").strip()
-        maquina_nombre_unica = ID_TO_MACHINE_NAME.get(maquina_id_unica, maquina_id_unica)
+        maquina_nombre_unica = ID_A_NOMBRE.get(maquina_id_unica, maquina_id_unica)
     else:
-        maquina_id_unica = MACHINE_NAME_TO_ID.get(maquina_vis, maquina_vis)
+        maquina_id_unica = NOMBRE_A_ID.get(maquina_vis, maquina_vis)
         maquina_nombre_unica = maquina_vis
     maquinas_seleccionadas = [(maquina_nombre_unica, maquina_id_unica)]
 else:
@@ -101,13 +192,13 @@ else:
     for mv in maquinas_pick:
         if mv.startswith("Código: "):
             mid = mv.replace("Código: ", "").strip()
-            mname = ID_TO_MACHINE_NAME.get(mid, mid)
+            mname = ID_A_NOMBRE.get(mid, mid)
         else:
-            mid = MACHINE_NAME_TO_ID.get(mv, mv)
+            mid = NOMBRE_A_ID.get(mv, mv)
             mname = mv
         maquinas_seleccionadas.append((mname, mid))
 
-fechas_disponibles = sorted(pd.Series(df["Fecha"].dt.date.dropna().unique()).tolist())
+fechas_disponibles = indice.fechas()
 modo_multiple_fechas = col_top2.toggle("Seleccionar múltiples fechas", value=False)
 
 # Toggle para mostrar o no los gráficos individuales (solo aplica en múltiple de fechas)
@@ -119,6 +210,12 @@ if modo_multiple_fechas:
         help="Si lo desactivás, solo verás el Resumen y el gráfico histórico."
     )
 
+# Grilla compacta: todos los relojes (máquinas × fechas) en una sola imagen, sin el detalle por día
+vista_grilla = False
+if modo_multiple_fechas and not mostrar_detalle:
+    vista_grilla = col_top3.toggle("Grilla compacta de relojes", value=False,
+                                   help="Todos los relojes en una sola imagen (una fila por máquina).")
+
 if not modo_multiple_fechas:
     fecha_sel = col_top3.selectbox("Fecha", fechas_disponibles)
     fechas_seleccionadas = [fecha_sel]
@@ -136,46 +233,102 @@ umbral_min = st.number_input(
     min_value=1, max_value=30, value=3, step=1
 )
 
+# 🔴 En vivo: el turno en curso se actualiza solo, sin recargar toda la hoja
+modo_vivo = st.sidebar.toggle("🔴 En vivo (turno en curso)", value=False)
+intervalo_vivo = INTERVALO_VIVO
+if modo_vivo:
+    intervalo_vivo = st.sidebar.number_input("Actualizar cada (s)", min_value=5.0,
+                                             value=INTERVALO_VIVO, step=5.0)
+
 def fmt_hms(td: pd.Timedelta):
     total = int(td.total_seconds())
     h, m, s = total // 3600, (total % 3600) // 60, total % 60
     return f"{h:02d}:{m:02d}:{s:02d}"
 
-# ===== Helper: suma del contador (Parcial > 0) en el turno seleccionado =====
-def contador_total_utilizado(df_base: pd.DataFrame, maquina_id: str, fecha_dia) -> float:
-    # límites del turno
-    weekday = fecha_dia.weekday()  # 0=lunes ... 4=viernes
-    inicio = datetime.combine(fecha_dia, datetime.strptime("06:00", "%H:%M").time())
-    fin = datetime.combine(fecha_dia, datetime.strptime("16:00", "%H:%M").time()) if weekday < 4 else \
-          datetime.combine(fecha_dia, datetime.strptime("15:00", "%H:%M").time())
-
-    d = df_base[(df_base["Id Equipo"] == maquina_id) &
-                (df_base["Fecha"].dt.date == fecha_dia)].copy()
-    if d.empty:
-        return 0.0
-
-    # recorte estricto al turno
-    d = d[(d["Fecha"] >= inicio) & (d["Fecha"] <= fin)]
-
-    # localizar columna 'Parcial' de forma robusta
-    parcial_col = None
-    for c in d.columns:
-        if "parcial" in str(c).strip().lower():
-            parcial_col = c
-            break
-    if parcial_col is None:
-        return 0.0
-
-    parc = pd.to_numeric(d[parcial_col], errors="coerce").fillna(0)
-    return float(parc[parc > 0].sum())
-
-def render_dia(df_base: pd.DataFrame, maquina_id: str, maquina_nombre: str, fecha_dia: date, umbral_min: int):
-    # generar_reloj recibe el ID de equipo
-    fig, indicadores, lista_gaps = generar_reloj(
-        df_base, maquina_id, fecha_dia, umbral_minutos=umbral_min
-    )
-    st.pyplot(fig, use_container_width=True)
-
+@st.cache_data(show_spinner=False, max_entries=256)
+def excel_dia(maquina_id: str, fecha_dia: date, umbral_min: int, huella: str, _lista_gaps) -> bytes:
+    # La huella identifica el contenido del día: misma clave ⇒ mismos gaps
+    return excel_detalle_dia(_lista_gaps)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def excel_seleccion(maquinas, fechas, umbral_min: int, version: str, _df, _resumen) -> bytes:
+    """Consolidado de la selección: una hoja por máquina con todas las fechas + resumen."""
+    ids = [mid for _, mid in maquinas]
+    d = filtrar_eventos(_df, ids, CALENDARIO.fechas_fuente(fechas))
+    _, gaps = calcular_indicadores_lote(d, umbral_minutos=umbral_min, calendario=CALENDARIO)
+    gaps = gaps[gaps["Fecha"].isin(fechas)]
+    por_maquina = {nombre: gaps[gaps["Id Equipo"] == mid] for nombre, mid in maquinas}
+    return excel_consolidado(por_maquina, _resumen)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def curva_sensibilidad(maquina_id: str, fechas, version: str, _df) -> pd.DataFrame:
+    """% Perdido agregado de los días elegidos para cada umbral 1–30 (una sola pasada)."""
+    d = filtrar_eventos(_df, [maquina_id], CALENDARIO.fechas_fuente(fechas))
+    sens = sensibilidad_umbral(d, umbrales=range(1, 31), calendario=CALENDARIO)
+    sens = sens[sens["Fecha"].isin(fechas)]
+    curva = sens.groupby("umbral")[["perdido_no_programado", "neto"]].sum().reset_index()
+    curva["%_Perdido"] = (curva["perdido_no_programado"] / curva["neto"] * 100.0).where(curva["neto"] > 0, 0.0)
+    return curva
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def analisis_linea(maquinas_ids, fechas, umbral_min: int, version: str, _df):
+    """Paradas simultáneas de las máquinas elegidas (barrido sobre todos sus gaps)."""
+    d = filtrar_eventos(_df, maquinas_ids, CALENDARIO.fechas_fuente(fechas))
+    r = analizar_linea(d, umbral_minutos=umbral_min, calendario=CALENDARIO)
+    return {k: v[v["Fecha"].isin(fechas)] for k, v in r.items()}
+
+def huella_dia(df_base, maquina_id: str, fecha_dia: date) -> str:
+    # Contenido de los días que alimentan los turnos de la fecha + calendario vigente
+    return f"{CALENDARIO.huella()}:{df_base.huella(maquina_id, fecha_dia, dias=DIAS_HUELLA)}"
+
+def reloj_del_dia(df_base, maquina_id: str, fecha_dia: date, umbral_min: int, calculados=None):
+    """(huella, resultado de calcular_reloj) del día; reutiliza lo ya calculado si viene en `calculados`."""
+    if calculados and (maquina_id, fecha_dia) in calculados:
+        return calculados[(maquina_id, fecha_dia)]
+    with etapa("calcular_reloj", maquina=maquina_id, fecha=fecha_dia):
+        resultado = calcular_reloj(df_base, maquina_id, fecha_dia, umbral_minutos=umbral_min,
+                                   calendario=CALENDARIO)
+    return huella_dia(df_base, maquina_id, fecha_dia), resultado
+
+def prerenderizar_relojes(df_base, maquinas_ids, fechas, umbral_min: int, minimo_pool: int = 4) -> dict:
+    """
+    Dibuja en paralelo (pool de procesos) los relojes que todavía no están en caché.
+    Devuelve {(maquina_id, fecha): (huella, resultado)} para que render_dia y la
+    grilla no vuelvan a calcular cada día.
+    """
+    cache = obtener_cache_relojes()
+    calculados, faltantes = {}, {}
+    for mid in maquinas_ids:
+        for f in fechas:
+            huella, resultado = calculados[(mid, f)] = reloj_del_dia(df_base, mid, f, umbral_min)
+            clave = (mid, f, umbral_min, huella)
+            if clave not in cache:
+                faltantes[clave] = resultado
+    if len(faltantes) < minimo_pool:
+        return calculados  # pocos relojes: se dibujan en render_dia sin pagar el pool
+    imagenes = renderizar_relojes(faltantes.values(), pool=obtener_pool_render())
+    for clave, imagen in zip(faltantes, imagenes):
+        cache.put(clave, imagen)
+    return calculados
+
+def grilla_relojes(df_base, maquinas, fechas, umbral_min: int, calculados=None) -> bytes:
+    """Imagen única con un reloj por (máquina, fecha); cada máquina empieza una fila nueva."""
+    columnas = min(len(fechas), 7)
+    resultados, titulos, claves = [], [], []
+    for nombre, mid in maquinas:
+        for f in fechas:
+            huella, resultado = reloj_del_dia(df_base, mid, f, umbral_min, calculados)
+            resultados.append(resultado)
+            titulos.append(f"{nombre} – {f}")
+            claves.append((mid, f, huella))
+        relleno = -len(fechas) % columnas
+        resultados += [None] * relleno
+        titulos += [None] * relleno
+    clave = ("grilla", umbral_min, columnas, tuple(claves))
+    return obtener_cache_relojes().obtener(
+        clave, lambda: dibujar_relojes_grilla(resultados, titulos, columnas=columnas))
+
+def mostrar_indicadores(indicadores: dict):
     c1, c2, c3, c4, c5 = st.columns(5)
     c1.metric("Total disponible (min)", f"{indicadores['total_disponible']:.2f}")
     c2.metric("Inutilizado (pausas, min)", f"{indicadores['inutilizado_programado']:.2f}")
@@ -183,47 +336,35 @@ def render_dia(df_base: pd.DataFrame, maquina_id: str, maquina_nombre: str, fech
     c4.metric("Perdido no programado (min)", f"{indicadores['perdido_no_programado']:.2f}")
     c5.metric("% Perdido", f"{indicadores['porcentaje_perdido']:.2f}")
 
+def render_dia(df_base, maquina_id: str, maquina_nombre: str, fecha_dia: date, umbral_min: int,
+               calculados=None):
+    # calcular_reloj recibe el ID de equipo; el dibujo es un paso aparte
+    huella, resultado = reloj_del_dia(df_base, maquina_id, fecha_dia, umbral_min, calculados)
+    indicadores, lista_gaps = resultado["indicadores"], resultado["lista_gaps"]
+    # El reloj se sirve desde la caché; solo se dibuja si cambió el día o el umbral
+    clave = (maquina_id, fecha_dia, umbral_min, huella)
+    imagen = obtener_cache_relojes().obtener(clave, lambda: dibujar_reloj(resultado))
+    st.image(imagen, use_container_width=True)
+
+    mostrar_indicadores(indicadores)
+
     df_gaps = pd.DataFrame(lista_gaps)
     if not df_gaps.empty:
         df_gaps["Duracion"] = pd.to_timedelta(df_gaps["Duracion_min"], unit="m").apply(fmt_hms)
         st.dataframe(df_gaps[["Inicio", "Fin", "Duracion"]], use_container_width=True)
 
-    # === EXPORTAR A EXCEL (descarga garantizada con xlsxwriter) ===
-    from io import BytesIO
-    output = BytesIO()
-
-    if not df_gaps.empty:
-        dur_seconds = pd.to_timedelta(df_gaps["Duracion_min"], unit="m").dt.total_seconds()
-        df_xlsx = pd.DataFrame({
-            "Inicio": df_gaps["Inicio"],
-            "Fin": df_gaps["Fin"],
-            "Duracion": (dur_seconds / 86400.0)  # Excel: fracción del día
-        })
-    else:
-        df_xlsx = pd.DataFrame(columns=["Inicio", "Fin", "Duracion"])
-
-    # Forzamos xlsxwriter para evitar problemas de entorno
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df_xlsx.to_excel(writer, index=False, sheet_name="TiemposMuertos")
-        workbook  = writer.book
-        worksheet = writer.sheets["TiemposMuertos"]
-        time_fmt = workbook.add_format({"num_format": "[h]:mm:ss"})
-        worksheet.set_column(0, 0, 10)             # A: Inicio
-        worksheet.set_column(1, 1, 10)             # B: Fin
-        worksheet.set_column(2, 2, 12, time_fmt)   # C: Duracion
-    excel_bytes = output.getvalue()
-
+    # === EXPORTAR A EXCEL (se genera recién al hacer clic, y queda cacheado) ===
     st.download_button(
         "📥 Descargar detalle (Excel)",
-        data=excel_bytes,
+        data=lambda: excel_dia(maquina_id, fecha_dia, umbral_min, huella, lista_gaps),
         file_name=f"tiempos_muertos_{maquina_nombre}_{fecha_dia}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        mime=MIME_XLSX,
         use_container_width=True,
     )
     # === FIN EXPORTAR A EXCEL ===
 
-    # 🔢 Contador total utilizado (Parcial > 0)
-    total_contador = contador_total_utilizado(df_base, maquina_id, fecha_dia)
+    # 🔢 Contador total utilizado (Parcial > 0): viene del mismo cálculo del reloj
+    total_contador = resultado["contador_total"]
 
     # Devolvemos todos los campos para el resumen consolidado
     return {
@@ -235,11 +376,39 @@ def render_dia(df_base: pd.DataFrame, maquina_id: str, maquina_nombre: str, fech
         "Contador total (parcial>0)": total_contador,
     }
 
-def resumen_solo(df_base: pd.DataFrame, maquina_id: str, fecha_dia: date, umbral_min: int):
-    _, indicadores, _ = generar_reloj(
-        df_base, maquina_id, fecha_dia, umbral_minutos=umbral_min
-    )
-    total_contador = contador_total_utilizado(df_base, maquina_id, fecha_dia)
+def indicadores_lote(df_base: pd.DataFrame, maquinas_ids, fechas, umbral_min: int) -> dict:
+    """
+    Indicadores de todas las (máquina, fecha) pedidas. Los pares que el cubo
+    precalculado (cubo_kpis.py) tiene en fechas cerradas se leen de ahí; el resto
+    (máquinas que la CLI no procesa, días sin eventos, fechas recientes) se
+    calcula en una sola pasada vectorizada.
+    """
+    lote = {}
+    cubiertas = set()
+    if os.path.isdir(CUBO_PATH):
+        with etapa("lectura_cubo") as e:
+            ind, cubiertas = leer_cubo(CUBO_PATH, umbral_min, maquinas_ids, fechas)
+            e.anotar(filas=len(ind))
+        diagnostico.contar("cubo_kpis", bool(cubiertas))
+        lote.update({(r["Id Equipo"], r["Fecha"]): r for r in ind.to_dict("records")})
+    faltantes = [(m, f) for m in maquinas_ids for f in fechas if (m, f) not in cubiertas]
+    if faltantes:
+        maquinas = sorted({m for m, _ in faltantes})
+        pendientes = sorted({f for _, f in faltantes})
+        d = filtrar_eventos(df_base, maquinas, CALENDARIO.fechas_fuente(pendientes))
+        with etapa("calcular_lote", filas=len(d)):
+            ind, _ = calcular_indicadores_lote(d, umbral_minutos=umbral_min, calendario=CALENDARIO)
+        ind = ind[ind["Fecha"].isin(pendientes)]
+        lote.update({(r["Id Equipo"], r["Fecha"]): r for r in ind.to_dict("records")
+                     if (r["Id Equipo"], r["Fecha"]) not in cubiertas})
+    return lote
+
+INDICADORES_VACIOS = dict(total_disponible=0, inutilizado_programado=0, neto=0,
+                          perdido_no_programado=0, porcentaje_perdido=0, contador_total=0.0)
+
+def resumen_solo(maquina_id: str, fecha_dia: date, lote: dict):
+    indicadores = lote.get((maquina_id, fecha_dia), INDICADORES_VACIOS)
+    total_contador = indicadores["contador_total"]
     return {
         "Fecha": fecha_dia,
         "Total disponible (min)": indicadores["total_disponible"],
@@ -249,8 +418,51 @@ def resumen_solo(df_base: pd.DataFrame, maquina_id: str, fecha_dia: date, umbral
         "Contador total (parcial>0)": total_contador,
     }
 
-if st.button("Generar gráfico(s)", type="primary", use_container_width=True):
+@st.fragment(run_every=intervalo_vivo if modo_vivo else None)
+def panel_vivo(maquinas, umbral_min: int):
+    """Turno en curso: cada sondeo incorpora solo las filas nuevas y redibuja."""
+    monitor = obtener_monitor(FUENTE_VIVO, umbral_min)
+    ahora = datetime.now()
+    with etapa("vivo_sondeo") as e:
+        nuevas = monitor.actualizar(ahora)
+        e.anotar(filas=nuevas)
+    if monitor.ultimo_error is not None:
+        st.warning(f"No se pudo leer la fuente; se muestra el último estado. ({monitor.ultimo_error})")
+    st.caption(f"Actualizado {ahora:%H:%M:%S} · {nuevas} fila(s) nueva(s) · "
+               f"se actualiza cada {intervalo_vivo:.0f} s")
+    for maquina_nombre, maquina_id in maquinas:
+        resultado = monitor.resultado(maquina_id, ahora)
+        st.subheader(f"🔴 {maquina_nombre} – turno en curso ({resultado['inicio'].date()})")
+        st.image(figura_a_bytes(dibujar_reloj(resultado)), use_container_width=True)
+        mostrar_indicadores(resultado["indicadores"])
+        abierto = resultado.get("gap_abierto")
+        if abierto is not None:
+            a, b = abierto
+            st.caption(f"Sin eventos desde {a:%H:%M:%S} ({(b - a).total_seconds() / 60.0:.1f} min)")
+        st.divider()
+
+if modo_vivo:
+    panel_vivo(tuple(maquinas_seleccionadas), umbral_min)
+elif st.button("Generar gráfico(s)", type="primary", use_container_width=True):
+    # Modo solo resumen: todos los indicadores se calculan juntos, sin gráficos
+    lote, calculados = {}, {}
+    if modo_multiple_fechas and not mostrar_detalle:
+        lote = indicadores_lote(df, [mid for _, mid in maquinas_seleccionadas],
+                                fechas_seleccionadas, umbral_min)
+    else:
+        with st.spinner("Dibujando relojes..."):
+            calculados = prerenderizar_relojes(indice, [mid for _, mid in maquinas_seleccionadas],
+                                               fechas_seleccionadas, umbral_min)
+
+    if vista_grilla:
+        n_relojes = len(maquinas_seleccionadas) * len(fechas_seleccionadas)
+        with st.spinner("Dibujando grilla..."), etapa("grilla", relojes=n_relojes):
+            st.image(grilla_relojes(indice, maquinas_seleccionadas, sorted(fechas_seleccionadas),
+                                    umbral_min, calculados),
+                     use_container_width=True)
+
     # Recorremos cada máquina seleccionada
+    filas_resumen = []
     for maquina_nombre, maquina_id in maquinas_seleccionadas:
         st.caption(f"Máquina seleccionada: **{maquina_nombre}**  ·  ID: `{maquina_id}`")
         resumen = []
@@ -259,13 +471,15 @@ if st.button("Generar gráfico(s)", type="primary", use_container_width=True):
         for f in fechas_seleccionadas:
             if (not modo_multiple_fechas) or mostrar_detalle:
                 st.subheader(f"📅 {maquina_nombre} – Día {f}")
-                res = render_dia(df, maquina_id, maquina_nombre, f, umbral_min)
+                res = render_dia(indice, maquina_id, maquina_nombre, f, umbral_min, calculados)
                 resumen.append(res)
                 st.divider()
             else:
-                res = resumen_solo(df, maquina_id, f, umbral_min)
+                res = resumen_solo(maquina_id, f, lote)
                 resumen.append(res)
 
+        filas_resumen.extend({"Máquina": maquina_nombre, **r} for r in resumen)
+
         # Resumen y gráfico histórico por máquina
         if len(resumen) > 1:
             st.subheader(f"📈 Resumen de días seleccionados – {maquina_nombre}")
@@ -297,3 +511,147 @@ if st.button("Generar gráfico(s)", type="primary", use_container_width=True):
                 )
 
             st.pyplot(fig, use_container_width=True)
+            plt.close(fig)
+
+        # 🎚️ Sensibilidad: % Perdido para todos los umbrales, sin recalcular por cada valor
+        with st.expander(f"🎚️ Sensibilidad al umbral – {maquina_nombre}"):
+            curva = curva_sensibilidad(maquina_id, tuple(fechas_seleccionadas), version_datos, df)
+            fig, ax = plt.subplots(figsize=(8, 3))
+            ax.plot(curva["umbral"], curva["%_Perdido"], marker="o", linewidth=2)
+            ax.axvline(umbral_min, color="red", linestyle="--", linewidth=1,
+                       label=f"Umbral actual ({umbral_min} min)")
+            ax.set_xlabel("Umbral (min)")
+            ax.set_ylabel("% Perdido")
+            ax.set_ylim(bottom=0)
+            ax.set_xticks(list(curva["umbral"].astype(int)))
+            ax.grid(True, alpha=0.3)
+            ax.legend(fontsize=8)
+            st.pyplot(fig, use_container_width=True)
+            plt.close(fig)
+
+    # 🏭 Vista de línea: cuántas máquinas estuvieron paradas a la vez
+    if len(maquinas_seleccionadas) > 1:
+        st.subheader("🏭 Paradas simultáneas (línea)")
+        ids = tuple(mid for _, mid in maquinas_seleccionadas)
+        linea = analisis_linea(ids, tuple(fechas_seleccionadas), umbral_min, version_datos, df)
+        al_menos = linea["al_menos"].pivot(index="Fecha", columns="N", values="minutos")
+        al_menos.columns = [f"≥{n} paradas (min)" for n in al_menos.columns]
+        st.dataframe(al_menos, use_container_width=True)
+        if (not modo_multiple_fechas) or mostrar_detalle:
+            for f in fechas_seleccionadas:
+                resultados = [calcular_reloj(indice, mid, f, umbral_minutos=umbral_min, calendario=CALENDARIO)
+                              for _, mid in maquinas_seleccionadas]
+                fig = dibujar_reloj_multiple(resultados, perfil_dia(linea["perfil"], f),
+                                             nombres=[nombre for nombre, _ in maquinas_seleccionadas])
+                st.image(figura_a_bytes(fig), use_container_width=True)
+        mas_largas = linea["mas_largas"].copy()
+        if not mas_largas.empty:
+            st.markdown("#### ⏱️ Paradas simultáneas más largas")
+            mas_largas["Desde"] = mas_largas["Desde"].dt.strftime("%H:%M:%S")
+            mas_largas["Hasta"] = mas_largas["Hasta"].dt.strftime("%H:%M:%S")
+            mas_largas["Maquinas"] = mas_largas["Maquinas"].map(
+                lambda s: ", ".join(ID_A_NOMBRE.get(m, m) for m in s.split(", ")))
+            st.dataframe(mas_largas, use_container_width=True)
+
+    # 📥 Consolidado: una hoja por máquina con todas las fechas + resumen (se arma al hacer clic)
+    df_resumen_total = pd.DataFrame(filas_resumen)
+    st.download_button(
+        "📥 Descargar consolidado (Excel)",
+        data=lambda: excel_seleccion(tuple(maquinas_seleccionadas), tuple(fechas_seleccionadas),
+                                     umbral_min, version_datos, df, df_resumen_total),
+        file_name=f"tiempos_muertos_consolidado_{min(fechas_seleccionadas)}_{max(fechas_seleccionadas)}.xlsx",
+        mime=MIME_XLSX,
+        use_container_width=True,
+    )
+
+# =========================================================
+# Tendencia de largo plazo (resúmenes del cubo)
+# =========================================================
+with st.expander("📈 Tendencia de largo plazo (semanal / mensual)"):
+    fechas_cubo = fechas_en_cubo(CUBO_PATH, umbral_min)
+    col_t1, col_t2, col_t3 = st.columns([1, 1, 1])
+    granularidad = col_t1.radio("Agrupar por", ["semana", "mes"], horizontal=True,
+                                format_func=str.capitalize)
+    ventana = col_t2.number_input("Media móvil (períodos)", min_value=1, max_value=24,
+                                  value=4 if granularidad == "semana" else 3, step=1)
+    if col_t3.button("Actualizar cubo", help="Procesa solo las fechas nuevas (igual que cubo_kpis.py)"):
+        with st.spinner("Actualizando cubo..."), etapa("actualizar_cubo"):
+            actualizar_cubo(df, CUBO_PATH, umbrales=[umbral_min], calendario=CALENDARIO)
+        fechas_cubo = fechas_en_cubo(CUBO_PATH, umbral_min)
+    if not fechas_cubo:
+        st.info(f"No hay cubo para umbral {umbral_min} min en '{CUBO_PATH}'. "
+                "Usá 'Actualizar cubo' o corré `python cubo_kpis.py`.")
+    else:
+        rango = st.date_input("Rango", value=(max(fechas_cubo[0], fechas_cubo[-1] - timedelta(days=365)),
+                                              fechas_cubo[-1]),
+                              min_value=fechas_cubo[0], max_value=fechas_cubo[-1])
+        desde, hasta = (rango[0], rango[-1]) if rango else (fechas_cubo[0], fechas_cubo[-1])
+        with etapa("lectura_tendencia") as e:
+            tendencia = leer_tendencia(CUBO_PATH, umbral_min, granularidad,
+                                       [mid for _, mid in maquinas_seleccionadas], desde, hasta, ventana)
+            e.anotar(filas=len(tendencia))
+        if tendencia.empty:
+            st.caption("Sin datos en el rango elegido.")
+        else:
+            fig, ax = plt.subplots(figsize=(10, 3.5))
+            for k, (mid, t) in enumerate(tendencia.groupby("Id Equipo", sort=False)):
+                color = f"C{k}"
+                nombre = ID_A_NOMBRE.get(mid, mid)
+                ax.plot(t["Periodo"], t["porcentaje_perdido"], marker="o", markersize=3,
+                        linewidth=1, alpha=0.5, color=color, label=nombre)
+                ax.plot(t["Periodo"], t["porcentaje_perdido_movil"], linewidth=2, linestyle="--",
+                        color=color, label=f"{nombre} (media {ventana})")
+            ax.set_ylabel("% Perdido")
+            ax.set_ylim(bottom=0)
+            ax.grid(True, alpha=0.3)
+            ax.legend(fontsize=7, ncol=2)
+            fig.autofmt_xdate()
+            st.pyplot(fig, use_container_width=True)
+            plt.close(fig)
+            st.caption(f"El último período incluye {fechas_cubo[-1]}, que puede estar incompleto.")
+            tabla = tendencia.assign(Maquina=tendencia["Id Equipo"].map(lambda m: ID_A_NOMBRE.get(m, m)))
+            st.dataframe(tabla[["Maquina", "Periodo", "dias", "neto", "perdido_no_programado",
+                                "porcentaje_perdido", "porcentaje_perdido_movil", "contador_total"]],
+                         use_container_width=True, hide_index=True)
+
+# =========================================================
+# Panel de diagnóstico
+# =========================================================
+if diagnostico.activo():
+    diagnostico.emitir_resumen()
+    if informe_memoria is not None:
+        st.sidebar.caption(
+            f"Memoria de eventos: {informe_memoria['bytes_antes'] / 2**20:.1f} MB → "
+            f"{informe_memoria['bytes_despues'] / 2**20:.1f} MB ({informe_memoria['filas']} filas)"
+        )
+    with st.sidebar.expander("Tiempos por etapa", expanded=True):
+        registros = pd.DataFrame(diagnostico.etapas())
+        if registros.empty:
+            st.caption("Sin etapas medidas en esta corrida (todo vino de caché).")
+        else:
+            por_etapa = (registros.groupby("etapa", sort=False)["segundos"]
+                         .agg(["count", "sum", "max"]).rename(columns={"count": "llamadas"}))
+            if "filas" in registros:
+                por_etapa["filas"] = registros.groupby("etapa", sort=False)["filas"].sum()
+            st.dataframe(por_etapa, use_container_width=True)
+        for nombre, c in diagnostico.contadores().items():
+            st.caption(f"{nombre}: {c['aciertos']} aciertos · {c['fallos']} fallos")
+        if "proceso" in registros:
+            st.caption("Las etapas 'render' con proceso=pool se midieron en los workers de render.")
+    with st.sidebar.expander("En segundo plano"):
+        # Refresco del snapshot y lectura de plantas: corren en otros hilos, fuera de esta corrida
+        fondo = pd.DataFrame(diagnostico.etapas_fondo())
+        if fondo.empty:
+            st.caption("Sin trabajo en segundo plano medido todavía.")
+        else:
+            columnas = [c for c in ("hora", "origen", "etapa", "segundos", "filas") if c in fondo]
+            st.dataframe(fondo[columnas].iloc[::-1].head(50), use_container_width=True, hide_index=True)
+    with st.sidebar.expander("Memoria de render"):
+        # Se mide a pedido: arranca un proceso aparte y dibuja el reloj más cargado de la selección
+        if st.button("Medir memoria por reloj", disabled=not (maquinas_seleccionadas and fechas_seleccionadas)):
+            muestras = [calcular_reloj(indice, mid, f, umbral_minutos=umbral_min, calendario=CALENDARIO)
+                        for _, mid in maquinas_seleccionadas for f in fechas_seleccionadas]
+            with st.spinner("Midiendo..."):
+                cota = memoria_por_reloj(max(muestras, key=lambda r: len(r["unplanned"])))
+            st.caption(f"≤ {cota / 2**20:.1f} MB por reloj · {PROCESOS_RENDER} proceso(s) de render "
+                       f"→ ≤ {PROCESOS_RENDER * cota / 2**20:.0f} MB por encima de la base de cada worker")
@@ -0,0 +1,167 @@
+"""
+Benchmark por etapa del pipeline de tiempos muertos.
+
+    python -m benchmarks.bench_pipeline --filas 10000,100000,1000000 --salida bench.json
+    python -m benchmarks.bench_pipeline --comparar antes.json despues.json
+
+Etapas: parse (read_excel), normalize (Fecha ya tipada; normalize_mixto con
+seriales de Excel, texto ISO y texto d/m/AAAA mezclados), index, filter
+(filtro por máquina/día sobre el DataFrame vs. acceso por índice), gaps (calcular_reloj por día y
+calcular_indicadores_lote), pausas (resta vectorizada de pausas), render (un
+reloj por figura y todos en una grilla; el render también guarda la cota
+de memoria por reloj, ver imagenes_reloj.memoria_por_reloj) y excel.
+Los resultados (mejor tiempo de N repeticiones) se guardan en JSON para
+comparar entre commits.
+"""
+import argparse
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+import datos
+from benchmarks.sintetico import a_xlsx, fechas_mixtas, generar_eventos
+from datos import normalizar_columnas
+from exportar import excel_consolidado, excel_detalle_dia
+from imagenes_reloj import figura_a_bytes, memoria_por_reloj
+from reloj_circular import (IndiceEventos, calcular_indicadores_lote, calcular_reloj, dibujar_reloj,
+                            dibujar_relojes_grilla)
+from turnos import CALENDARIO_POR_DEFECTO, restar_intervalos
+
+N_MAQUINAS = 5
+EVENTOS_POR_TURNO = 400
+
+
+def _medir(fn, repeticiones):
+    mejor = math.inf
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def correr(filas, repeticiones=3, muestra_dias=20, muestra_render=3, max_filas_xlsx=200_000, umbral=3):
+    dias = max(1, math.ceil(filas / (N_MAQUINAS * EVENTOS_POR_TURNO)))
+    raw = generar_eventos(n_maquinas=N_MAQUINAS, dias=dias, eventos_por_turno=EVENTOS_POR_TURNO)
+    filas = len(raw)
+    resultados = []
+
+    def registrar(etapa, fn, reps=repeticiones, **extra):
+        resultados.append(dict(filas=filas, etapa=etapa, segundos=_medir(fn, reps),
+                               repeticiones=reps, **extra))
+
+    # ---------------- parse ----------------
+    if filas <= max_filas_xlsx:
+        xlsx = a_xlsx(raw)
+        registrar("parse", lambda: pd.read_excel(BytesIO(xlsx), sheet_name=0, engine="openpyxl", header=1),
+                  reps=1)
+
+    # ---------------- normalize / index ----------------
+    # Sin caché de fechas: cada repetición vuelve a parsear (si no, desde la 2.ª se mide un acierto)
+    def normalizar(crudo):
+        datos._cache_fechas.clear()
+        return normalizar_columnas(crudo.copy())
+
+    registrar("normalize", lambda: normalizar(raw))
+    mixto = fechas_mixtas(raw)
+    registrar("normalize_mixto", lambda: normalizar(mixto))
+    df = normalizar_columnas(raw.copy())
+    registrar("index", lambda: IndiceEventos(df))
+    indice = IndiceEventos(df)
+    claves = indice.claves()[:muestra_dias]
+
+    # ---------------- filter ----------------
+    registrar("filter_df", lambda: [df[(df["Id Equipo"] == m) & (df["Fecha"].dt.date == f)] for m, f in claves],
+              por=len(claves))
+    registrar("filter_indice", lambda: [indice.dia(m, f) for m, f in claves], por=len(claves))
+
+    # ---------------- gaps ----------------
+    registrar("gaps_dia", lambda: [calcular_reloj(indice, m, f, umbral) for m, f in claves], por=len(claves))
+    registrar("gaps_lote", lambda: calcular_indicadores_lote(df, umbral))
+
+    # ---------------- pausas ----------------
+    candidatos = []
+    for m, f in claves:
+        turno = CALENDARIO_POR_DEFECTO.turnos(f, m)[0]
+        eventos = np.concatenate([[pd.Timestamp(turno["inicio"]).value],
+                                  indice.dia(m, f)["Fecha"].to_numpy(dtype="datetime64[ns]").view("int64"),
+                                  [pd.Timestamp(turno["fin"]).value]])
+        pausas = np.array([[pd.Timestamp(ps).value, pd.Timestamp(pe).value] for _, ps, pe in turno["pausas"]])
+        candidatos.append((eventos[:-1], eventos[1:], pausas[:, 0], pausas[:, 1]))
+    registrar("pausas", lambda: [restar_intervalos(*c) for c in candidatos], por=len(candidatos))
+
+    # ---------------- render ----------------
+    muestra = [calcular_reloj(indice, m, f, umbral) for m, f in claves[:muestra_render]]
+    registrar("render", lambda: [figura_a_bytes(dibujar_reloj(r)) for r in muestra], reps=1, por=len(muestra),
+              memoria_reloj=memoria_por_reloj(max(muestra, key=lambda r: len(r["unplanned"]))))
+    todos = [calcular_reloj(indice, m, f, umbral) for m, f in claves]
+    registrar("render_grilla", lambda: figura_a_bytes(dibujar_relojes_grilla(todos)), reps=1, por=len(todos))
+
+    # ---------------- excel ----------------
+    registrar("excel_dia", lambda: [excel_detalle_dia(r["lista_gaps"]) for r in muestra], por=len(muestra))
+    _, gaps = calcular_indicadores_lote(df, umbral)
+    por_maquina = {m: g for m, g in gaps.groupby("Id Equipo", observed=True)}
+    registrar("excel_consolidado", lambda: excel_consolidado(por_maquina), reps=1, gaps=len(gaps))
+    return resultados
+
+
+def comparar(antes, despues):
+    with open(antes) as fa, open(despues) as fb:
+        a, b = json.load(fa), json.load(fb)
+    previo = {(r["filas"], r["etapa"]): r["segundos"] for r in a["resultados"]}
+    print(f"{'filas':>10} {'etapa':<18} {'antes (s)':>10} {'después (s)':>12} {'x':>7}")
+    for r in b["resultados"]:
+        t0 = previo.get((r["filas"], r["etapa"]))
+        if t0 is None:
+            continue
+        print(f"{r['filas']:>10} {r['etapa']:<18} {t0:>10.4f} {r['segundos']:>12.4f} {t0 / r['segundos']:>7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark por etapa del reloj de tiempos muertos.")
+    parser.add_argument("--filas", default="10000,100000,1000000",
+                        help="Tamaños (filas aproximadas), separados por coma")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--max-filas-xlsx", type=int, default=200_000,
+                        help="Por encima de este tamaño no se mide el parse XLSX")
+    parser.add_argument("--salida", default=None, help="Archivo JSON (por defecto bench_<commit>.json)")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DESPUES"))
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return 0
+
+    commit = _commit()
+    resultados = []
+    for filas in [int(x) for x in args.filas.split(",")]:
+        for r in correr(filas, repeticiones=args.repeticiones, max_filas_xlsx=args.max_filas_xlsx):
+            print(f"{r['filas']:>10} {r['etapa']:<18} {r['segundos']:.4f}s", file=sys.stderr)
+            resultados.append(r)
+
+    salida = args.salida or f"bench_{commit or 'local'}.json"
+    with open(salida, "w") as f:
+        json.dump(dict(commit=commit, fecha=datetime.now().isoformat(timespec="seconds"),
+                       python=platform.python_version(), pandas=pd.__version__,
+                       resultados=resultados), f, indent=2)
+    print(salida)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
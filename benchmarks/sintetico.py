@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+
+# =========================================================
+# Generador determinístico de datos con forma de sheet
+# =========================================================
+def generar_eventos(n_maquinas=5, dias=30, eventos_por_turno=400, frac_parcial_cero=0.1,
+                    frac_duplicados=0.02, frac_fuera_turno=0.05, desde="2024-01-01", semilla=0):
+    """
+    DataFrame crudo con las columnas del sheet ('Fecha', 'Id Equipo', 'Parcial'),
+    sin ordenar, listo para normalizar_columnas.
+
+    - n_maquinas × dias turnos, con ~eventos_por_turno eventos cada uno
+    - frac_parcial_cero: filas con Parcial == 0 (se ignoran en el reloj)
+    - frac_duplicados: filas que repiten el timestamp de otra de la misma máquina
+    - frac_fuera_turno: eventos antes de las 06:00 o después del cierre
+    Misma semilla ⇒ mismos datos.
+    """
+    rng = np.random.default_rng(semilla)
+    maquinas = np.array([f"{0xA0B0C0D00000 + i:012X}" for i in range(n_maquinas)])
+    dias_ns = pd.date_range(desde, periods=dias, freq="D").to_numpy().astype("int64")
+
+    n = n_maquinas * dias * eventos_por_turno
+    turno = rng.integers(0, n_maquinas * dias, n)
+    maq, dia = turno // dias, turno % dias
+
+    # Dentro del turno: 06:00–15:00 (vale para todos los días); fuera: 00:00–06:00 o 16:00–24:00
+    seg = rng.uniform(6 * 3600, 15 * 3600, n)
+    fuera = rng.random(n) < frac_fuera_turno
+    seg[fuera] = np.where(rng.random(fuera.sum()) < 0.5,
+                          rng.uniform(0, 6 * 3600, fuera.sum()),
+                          rng.uniform(16 * 3600, 24 * 3600 - 1, fuera.sum()))
+    fecha = dias_ns[dia] + np.round(seg).astype("int64") * 1_000_000_000
+
+    dup = rng.random(n) < frac_duplicados
+    origen = rng.integers(0, n, dup.sum())
+    fecha[dup], maq[dup] = fecha[origen], maq[origen]
+
+    parcial = rng.integers(1, 50, n)
+    parcial[rng.random(n) < frac_parcial_cero] = 0
+
+    return pd.DataFrame({
+        "Fecha": pd.to_datetime(fecha),
+        "Id Equipo": maquinas[maq],
+        "Parcial": parcial,
+    })
+
+def fechas_mixtas(df, semilla=0):
+    """
+    Copia de `df` con 'Fecha' como columna object de tipos mezclados, como queda
+    un sheet editado a mano: un tercio seriales de Excel (float), un tercio texto
+    ISO y un tercio texto local d/m/AAAA H:MM:SS.
+    """
+    rng = np.random.default_rng(semilla)
+    fecha = pd.to_datetime(df["Fecha"])
+    tipo = rng.integers(0, 3, len(df))
+    serial = (fecha - pd.Timestamp("1899-12-30")) / pd.Timedelta(days=1)
+    valores = np.where(tipo == 0, serial.to_numpy(dtype=object),
+                       np.where(tipo == 1, fecha.dt.strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object),
+                                fecha.dt.strftime("%d/%m/%Y %H:%M:%S").to_numpy(dtype=object)))
+    return df.assign(Fecha=pd.Series(valores, index=df.index, dtype=object))
+
+def a_xlsx(df):
+    """Bytes de un XLSX con el mismo layout que el export del sheet (encabezado en la fila 2)."""
+    from io import BytesIO
+
+    buf = BytesIO()
+    df.to_excel(buf, index=False, startrow=1, engine="xlsxwriter")
+    return buf.getvalue()
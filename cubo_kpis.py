@@ -0,0 +1,292 @@
+"""
+Cubo diario de KPIs precalculado (Parquet particionado).
+
+Uso desde cron, p. ej. cada hora:
+
+    python cubo_kpis.py --cubo kpi_cubo --umbral 3 --umbral 5
+    python cubo_kpis.py --fuentes plantas.json   # varias plantas (ver fuentes.py)
+
+Estructura (particionado Hive):
+    <cubo>/indicadores/umbral=<u>/fecha=<AAAA-MM-DD>/*.parquet
+    <cubo>/gaps/umbral=<u>/fecha=<AAAA-MM-DD>/*.parquet
+    <cubo>/tendencia/umbral=<u>/granularidad=<semana|mes>/periodo=<AAAA-MM-DD>/*.parquet
+
+Cada corrida procesa solo las fechas nuevas; la última fecha ya guardada se
+recalcula siempre, porque pudo haberse escrito con el turno en curso. Los
+resúmenes semanales / mensuales de `tendencia` se rehacen solo para los
+períodos que contienen alguna fecha procesada.
+"""
+import argparse
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from datos import (SHEET_EXPORT_URL, MACHINE_NAME_TO_ID, SnapshotEventos,
+                   cargar_excel_desde_sheet, normalizar_columnas)
+from fuentes import cargar_registro
+from reloj_circular import calcular_indicadores_lote
+from turnos import cargar_calendario
+
+
+# =========================================================
+# Lectura / escritura del cubo
+# =========================================================
+def fechas_en_cubo(ruta: str, umbral: int) -> list:
+    """Fechas (date) ya procesadas para un umbral."""
+    base = os.path.join(ruta, "indicadores", f"umbral={umbral}")
+    if not os.path.isdir(base):
+        return []
+    return sorted(
+        pd.Timestamp(n.split("=", 1)[1]).date()
+        for n in os.listdir(base) if n.startswith("fecha=")
+    )
+
+def _leer_fechas(base: str, fechas, maquinas_ids=None) -> pd.DataFrame:
+    dataset = ds.dataset(base, format="parquet", partitioning="hive")
+    filtro = ds.field("fecha").isin(sorted(str(f) for f in fechas))
+    if maquinas_ids is not None:
+        filtro &= ds.field("Id Equipo").isin(list(maquinas_ids))
+    return dataset.to_table(filter=filtro).to_pandas().drop(columns=["fecha"])
+
+def _escribir(tabla: pd.DataFrame, ruta: str, umbral: int) -> None:
+    tabla = tabla.assign(umbral=umbral, fecha=tabla["Fecha"].astype(str))
+    tabla["Id Equipo"] = tabla["Id Equipo"].astype(str)
+    ds.write_dataset(
+        pa.Table.from_pandas(tabla, preserve_index=False),
+        ruta,
+        format="parquet",
+        partitioning=ds.partitioning(
+            pa.schema([("umbral", pa.int32()), ("fecha", pa.string())]), flavor="hive"
+        ),
+        existing_data_behavior="delete_matching",  # reescribe solo las fechas recalculadas
+    )
+
+def _reescribir_fechas(tabla: pd.DataFrame, ruta: str, umbral: int, fechas, maquinas) -> None:
+    """
+    Reemplaza las particiones de `fechas` por `tabla`. Se conservan las filas de
+    las máquinas que esta corrida no procesó (la app y la CLI pueden cubrir
+    conjuntos distintos) y se borran las particiones que quedan sin filas (p. ej.
+    una fecha que ya no tiene gaps).
+    """
+    base = os.path.join(ruta, f"umbral={umbral}")
+    if os.path.isdir(base):
+        previas = _leer_fechas(base, fechas)
+        ajenas = previas[~previas["Id Equipo"].astype(str).isin(maquinas)]
+        if not ajenas.empty:
+            tabla = pd.concat([tabla, ajenas], ignore_index=True)
+        for f in fechas:
+            shutil.rmtree(os.path.join(base, f"fecha={f}"), ignore_errors=True)
+    if not tabla.empty:
+        _escribir(tabla, ruta, umbral)
+
+def actualizar_cubo(df: pd.DataFrame, ruta: str, umbrales=(3,), maquinas_ids=None,
+                    completo: bool = False, calendario=None) -> dict:
+    """
+    Calcula indicadores, gaps y contador Parcial de cada máquina y fecha que falte
+    en el cubo (o de todas con completo=True). Devuelve {umbral: fechas procesadas}.
+    Solo se reemplazan las filas de las máquinas procesadas: lo que otra corrida
+    escribió para otras máquinas se conserva.
+    Si cambia el calendario de turnos hay que recalcular con completo=True.
+    """
+    calendario = calendario or cargar_calendario()
+    if maquinas_ids is not None:
+        df = df[df["Id Equipo"].isin(list(maquinas_ids))]
+    # Máquinas cuyas filas reemplaza esta corrida (las demás quedan como estaban)
+    maquinas = set(df["Id Equipo"].astype(str).unique())
+    if maquinas_ids is not None:
+        maquinas |= {str(m) for m in maquinas_ids}
+    dias = df["Fecha"].dt.date
+    procesadas = {}
+    for umbral in umbrales:
+        hechas = [] if completo else fechas_en_cubo(ruta, umbral)
+        # La última fecha guardada se recalcula: pudo escribirse con el turno abierto
+        listas = set(hechas[:-1])
+        pendientes = sorted(set(dias.dropna().unique()) - listas)
+        if not pendientes:
+            procesadas[umbral] = []
+            continue
+        fuente = df[dias.isin(calendario.fechas_fuente(pendientes))]
+        ind, gaps = calcular_indicadores_lote(fuente, umbral_minutos=umbral, calendario=calendario)
+        ind, gaps = ind[ind["Fecha"].isin(pendientes)], gaps[gaps["Fecha"].isin(pendientes)]
+        _reescribir_fechas(ind, os.path.join(ruta, "indicadores"), umbral, pendientes, maquinas)
+        _reescribir_fechas(gaps, os.path.join(ruta, "gaps"), umbral, pendientes, maquinas)
+        # Un cubo previo sin tendencia la arma completa la primera vez
+        if completo or not os.path.isdir(os.path.join(ruta, "tendencia", f"umbral={umbral}")):
+            actualizar_tendencia(ruta, umbral, fechas_en_cubo(ruta, umbral))
+        else:
+            actualizar_tendencia(ruta, umbral, pendientes)
+        procesadas[umbral] = pendientes
+    return procesadas
+
+def leer_cubo(ruta: str, umbral: int, maquinas_ids=None, fechas=None, tabla: str = "indicadores"):
+    """
+    Lee del cubo las filas de un umbral, filtrando por máquinas y fechas.
+    Devuelve (DataFrame, cubiertas): `cubiertas` son los pares (Id Equipo, fecha)
+    con fila en el cubo, solo de fechas cerradas (se excluye la última, que
+    puede estar incompleta). Un par sin fila puede ser una máquina que la CLI no
+    procesó (p. ej. fuera de MACHINE_NAME_TO_ID) o un día sin eventos: el que
+    lee debe calcularlo en vivo, no suponer ceros.
+    """
+    cerradas = set(fechas_en_cubo(ruta, umbral)[:-1])
+    if fechas is not None:
+        cerradas &= set(fechas)
+    base = os.path.join(ruta, tabla, f"umbral={umbral}")
+    if not cerradas or not os.path.isdir(base):
+        return pd.DataFrame(), set()
+    ind = _leer_fechas(base, cerradas, maquinas_ids)
+    return ind, set(zip(ind["Id Equipo"].astype(str), ind["Fecha"]))
+
+
+# =========================================================
+# Resúmenes semanales / mensuales (tendencia)
+# =========================================================
+# Semanas de lunes a domingo; el período se identifica por su primer día
+GRANULARIDADES = {"semana": "W-SUN", "mes": "M"}
+SUMABLES = ["total_disponible", "inutilizado_programado", "neto", "perdido_no_programado", "contador_total"]
+
+def inicio_periodo(fechas, granularidad: str) -> np.ndarray:
+    """Primer día (date) del período de cada fecha."""
+    periodos = pd.to_datetime(pd.Series(fechas)).dt.to_period(GRANULARIDADES[granularidad])
+    return periodos.dt.start_time.dt.date.to_numpy()
+
+def _fechas_de_periodos(periodos, granularidad: str) -> list:
+    """Todas las fechas de los períodos (dados por su primer día)."""
+    fechas = []
+    for p in pd.PeriodIndex(pd.to_datetime(list(periodos)), freq=GRANULARIDADES[granularidad]):
+        fechas.extend(pd.date_range(p.start_time, p.end_time.normalize()).date)
+    return fechas
+
+def resumir_periodos(ind: pd.DataFrame, granularidad: str) -> pd.DataFrame:
+    """
+    Suma los indicadores diarios por máquina y período. 'dias' cuenta los días
+    con tiempo neto; el % perdido se recalcula sobre las sumas (no es el
+    promedio de los % diarios).
+    """
+    columnas = ["Id Equipo", "Periodo", "dias"] + SUMABLES + ["porcentaje_perdido"]
+    if ind.empty:
+        return pd.DataFrame(columns=columnas)
+    tabla = ind[SUMABLES].assign(
+        **{"Id Equipo": ind["Id Equipo"].astype(str).to_numpy(),
+           "Periodo": inicio_periodo(ind["Fecha"], granularidad),
+           "dias": (ind["neto"] > 0).astype("int64").to_numpy()}
+    )
+    out = tabla.groupby(["Id Equipo", "Periodo"], sort=True)[["dias"] + SUMABLES].sum().reset_index()
+    neto = out["neto"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["porcentaje_perdido"] = np.where(neto > 0, out["perdido_no_programado"] / neto * 100.0, 0.0)
+    return out[columnas]
+
+def actualizar_tendencia(ruta: str, umbral: int, fechas) -> None:
+    """Rehace los resúmenes de los períodos que contienen alguna de `fechas`, desde el cubo diario."""
+    base = os.path.join(ruta, "indicadores", f"umbral={umbral}")
+    if not fechas or not os.path.isdir(base):
+        return
+    for granularidad in GRANULARIDADES:
+        periodos = sorted(set(inicio_periodo(fechas, granularidad)))
+        ind = _leer_fechas(base, _fechas_de_periodos(periodos, granularidad))
+        tabla = resumir_periodos(ind, granularidad)
+        if tabla.empty:
+            continue
+        tabla = tabla.assign(umbral=umbral, granularidad=granularidad, periodo=tabla["Periodo"].astype(str))
+        ds.write_dataset(
+            pa.Table.from_pandas(tabla, preserve_index=False),
+            os.path.join(ruta, "tendencia"),
+            format="parquet",
+            partitioning=ds.partitioning(
+                pa.schema([("umbral", pa.int32()), ("granularidad", pa.string()), ("periodo", pa.string())]),
+                flavor="hive",
+            ),
+            existing_data_behavior="delete_matching",  # reescribe solo los períodos afectados
+        )
+
+def leer_tendencia(ruta: str, umbral: int, granularidad: str, maquinas_ids=None,
+                   desde=None, hasta=None, ventana: int = 4) -> pd.DataFrame:
+    """
+    Resúmenes por máquina y período entre `desde` y `hasta` (fechas, inclusive),
+    con la media móvil del % perdido sobre los últimos `ventana` períodos con
+    datos ('porcentaje_perdido_movil' = suma de perdido / suma de neto en la
+    ventana). La media móvil usa también los períodos anteriores a `desde`.
+    """
+    base = os.path.join(ruta, "tendencia", f"umbral={umbral}", f"granularidad={granularidad}")
+    if not os.path.isdir(base):
+        return pd.DataFrame()
+    dataset = ds.dataset(base, format="parquet", partitioning="hive")
+    filtro = None
+    if hasta is not None:
+        filtro = ds.field("periodo") <= str(hasta)
+    if maquinas_ids is not None:
+        f = ds.field("Id Equipo").isin(list(maquinas_ids))
+        filtro = f if filtro is None else filtro & f
+    out = dataset.to_table(filter=filtro).to_pandas().drop(columns=["periodo"])
+    if out.empty:
+        return out
+    out = out.sort_values(["Id Equipo", "Periodo"], kind="stable").reset_index(drop=True)
+    por_maquina = out.groupby("Id Equipo", sort=False)
+    perdido = por_maquina["perdido_no_programado"].transform(lambda s: s.rolling(ventana, min_periods=1).sum())
+    neto = por_maquina["neto"].transform(lambda s: s.rolling(ventana, min_periods=1).sum())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["porcentaje_perdido_movil"] = np.where(neto > 0, perdido / neto * 100.0, 0.0)
+    if desde is not None:
+        out = out[out["Periodo"] >= inicio_periodo([desde], granularidad)[0]]
+    return out.reset_index(drop=True)
+
+
+# =========================================================
+# CLI
+# =========================================================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Precalcula el cubo diario de KPIs de tiempos muertos.")
+    parser.add_argument("--fuente", default=os.environ.get("RELOJ_FUENTE", SHEET_EXPORT_URL),
+                        help="URL del sheet o archivo local (.xlsx/.csv/.parquet)")
+    parser.add_argument("--fuentes", default=os.environ.get("RELOJ_FUENTES"),
+                        help="Registro de plantas (JSON, ver fuentes.py); reemplaza a --fuente")
+    parser.add_argument("--snapshot", default=None,
+                        help="Snapshot Arrow local; si se indica, se refresca y se usa como fuente")
+    parser.add_argument("--cubo", default=os.environ.get("RELOJ_CUBO", "kpi_cubo"))
+    parser.add_argument("--umbral", type=int, action="append",
+                        help="Umbral en minutos (repetible). Por defecto 3.")
+    parser.add_argument("--calendario", default=os.environ.get("RELOJ_CALENDARIO"),
+                        help="Calendario de turnos (JSON, ver turnos.py); por defecto el de planta")
+    parser.add_argument("--completo", action="store_true",
+                        help="Recalcula todas las fechas (necesario si cambió el calendario)")
+    args = parser.parse_args(argv)
+
+    origen, maquinas_ids = args.fuente, MACHINE_NAME_TO_ID.values()
+    if args.fuentes:
+        # Todas las máquinas de las plantas registradas (un mapa de planta puede estar incompleto)
+        origen, maquinas_ids = cargar_registro(args.fuentes), None
+        # Se espera a todas las plantas: una demorada quedaría fuera de fechas que se dan por procesadas
+        origen.espera_segundos = None
+
+    if args.snapshot:
+        snapshot = SnapshotEventos(origen, args.snapshot)
+        try:
+            snapshot.refrescar()
+        except Exception as e:
+            if not snapshot.version():
+                raise
+            print(f"Aviso: no se pudo refrescar la fuente, se usa el snapshot ({e})", file=sys.stderr)
+        df = snapshot.cargar()
+    elif args.fuentes:
+        df = origen.leer()
+    else:
+        df = normalizar_columnas(cargar_excel_desde_sheet(args.fuente))
+    if args.fuentes:
+        for planta, error in origen.fallidas().items():
+            print(f"Aviso: no se pudo leer la planta {planta} ({error})", file=sys.stderr)
+
+    procesadas = actualizar_cubo(df, args.cubo, umbrales=args.umbral or [3],
+                                 maquinas_ids=maquinas_ids, completo=args.completo,
+                                 calendario=cargar_calendario(args.calendario))
+    for umbral, fechas in procesadas.items():
+        print(f"umbral={umbral}: {len(fechas)} fecha(s) procesada(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,464 @@
+import hashlib
+import os
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from diagnostico import contar, en_segundo_plano, etapa
+
+
+# =========================================================
+# CONFIGURACIÓN GOOGLE SHEETS (XLSX export)
+# =========================================================
+SHEET_EXPORT_URL = (
+    "https://docs.google.com/spreadsheets/d/"
+    "1clzNg0YblSQVvpWlWqeAwHKYiTyKcv-meWaI1RILAFo/export?format=xlsx"
+)
+
+# =========================================================
+# Mapeo nombre ↔ ID de máquina (para UI amigable)
+# =========================================================
+MACHINE_NAME_TO_ID = {
+    "Seccionadora": "4C4F686CDDA0",
+    "Centro de Mecanizado 1": "84EA676CDDA0",
+    "Centro de Mecanizado 2": "98D1676CDDA0",
+    "Pegadora 1": "3C75A0C964EC",
+    "Pegadora 2": "8C6EA51FB608",
+}
+ID_TO_MACHINE_NAME = {v: k for k, v in MACHINE_NAME_TO_ID.items()}
+
+# =========================================================
+# Lectura de la fuente (Google Sheets export o archivo local)
+# =========================================================
+def cargar_excel_desde_sheet(origen: str, descargar=None) -> pd.DataFrame:
+    """
+    Lee la hoja de eventos. `origen` puede ser la URL de export XLSX del sheet
+    o un archivo local (.xlsx, .csv o .parquet) que la reemplaza, p. ej. en pruebas.
+    `descargar(url) -> bytes` reemplaza a urllib (ver fuentes.ConexionesHTTP).
+    """
+    ext = os.path.splitext(str(origen))[1].lower()
+    if os.path.exists(origen) and ext == ".csv":
+        with etapa("parse_csv") as e:
+            df = pd.read_csv(origen, header=1)
+            e.anotar(filas=len(df))
+        return df
+    if os.path.exists(origen) and ext == ".parquet":
+        with etapa("parse_parquet") as e:
+            df = pd.read_parquet(origen)
+            e.anotar(filas=len(df))
+        return df
+    if str(origen).startswith(("http://", "https://")):
+        # Descarga y parseo por separado, para poder medir cada uno
+        with etapa("descarga") as e:
+            if descargar is not None:
+                contenido = descargar(origen)
+            else:
+                with urllib.request.urlopen(origen) as resp:
+                    contenido = resp.read()
+            e.anotar(bytes=len(contenido))
+        origen = BytesIO(contenido)
+    with etapa("parse_xlsx") as e:
+        df = pd.read_excel(origen, sheet_name=0, engine="openpyxl", header=1)
+        e.anotar(filas=len(df))
+    return df
+
+# =========================================================
+# Parseo de Fecha (formatos fijados, vectorizado por tipo)
+# =========================================================
+# Formatos de texto candidatos; "local" es el del sheet (es-AR): d/m/AAAA con hora opcional
+_FORMATOS_TEXTO = [
+    ("iso", "ISO8601"),
+    ("local", "{fecha} %H:%M:%S"),
+    ("local", "{fecha} %H:%M"),
+    ("local", "{fecha}"),
+]
+_MUESTRA_FORMATOS = 2000
+_ORIGEN_EXCEL = "1899-12-30"
+_cache_fechas = OrderedDict()
+_CACHE_FECHAS_MAX = 4
+_lock_fechas = threading.Lock()  # varias fuentes pueden normalizarse a la vez (fuentes.py)
+
+
+def _huella_columna(serie: pd.Series) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(pd.util.hash_pandas_object(serie, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def _dia_primero(textos: pd.Series) -> bool:
+    """d/m o m/d: se decide una vez mirando si algún campo supera 12. Empate → d/m (local)."""
+    partes = textos.str.extract(r"^(\d{1,2})/(\d{1,2})/").astype(float)
+    if (partes[1] > 12).any() and not (partes[0] > 12).any():
+        return False
+    return True
+
+def _detectar_formatos(textos: pd.Series) -> list:
+    """Formatos presentes en una muestra, ordenados por frecuencia (se detectan una sola vez)."""
+    muestra = textos.iloc[:_MUESTRA_FORMATOS]
+    fecha = "%d/%m/%Y" if _dia_primero(muestra) else "%m/%d/%Y"
+    encontrados = []
+    for tipo, fmt in _FORMATOS_TEXTO:
+        fmt = fmt.format(fecha=fecha)
+        n = int(pd.to_datetime(muestra, format=fmt, errors="coerce").notna().sum())
+        if n:
+            encontrados.append((n, tipo, fmt))
+    return [(tipo, fmt) for _, tipo, fmt in sorted(encontrados, key=lambda x: -x[0])]
+
+def _excel_a_datetime(valores) -> np.ndarray:
+    fechas = pd.to_datetime(pd.to_numeric(valores, errors="coerce"), unit="D",
+                            origin=_ORIGEN_EXCEL, errors="coerce")
+    return pd.Series(fechas).dt.round("s").to_numpy(dtype="datetime64[ns]")
+
+def _parsear(serie: pd.Series, formatos=None):
+    n = len(serie)
+    out = np.full(n, np.datetime64("NaT"), dtype="datetime64[ns]")
+    por_formato = {}
+
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        out[:] = (serie.dt.tz_localize(None) if serie.dt.tz is not None else serie).to_numpy(dtype="datetime64[ns]")
+        por_formato["datetime"] = int(serie.notna().sum())
+        return out, por_formato, formatos
+    if pd.api.types.is_numeric_dtype(serie):
+        out[:] = _excel_a_datetime(serie)
+        por_formato["excel"] = int(serie.notna().sum())
+        return out, por_formato, formatos
+
+    # Columna object mezclada: se clasifica por tipo (una vez por tipo distinto)
+    tipos = serie.map(type)
+    clase = {t: ("datetime" if issubclass(t, (datetime, np.datetime64))
+                 else "texto" if issubclass(t, str)
+                 else "excel" if issubclass(t, (int, float, np.number)) and not issubclass(t, bool)
+                 else "otro") for t in tipos.unique()}
+    clase = tipos.map(clase).to_numpy()
+
+    m = clase == "datetime"
+    if m.any():
+        out[m] = pd.to_datetime(serie[m], errors="coerce").to_numpy(dtype="datetime64[ns]")
+        por_formato["datetime"] = int(m.sum())
+    m = clase == "excel"
+    if m.any():
+        out[m] = _excel_a_datetime(serie[m])
+        por_formato["excel"] = int(m.sum())
+
+    posiciones = np.flatnonzero(clase == "texto")
+    if len(posiciones):
+        textos = serie.iloc[posiciones].str.strip()
+        if formatos is None:
+            formatos = _detectar_formatos(textos)
+        for tipo, fmt in formatos:
+            parseado = pd.to_datetime(textos, format=fmt, errors="coerce")
+            ok = parseado.notna().to_numpy()
+            out[posiciones[ok]] = parseado[ok].to_numpy(dtype="datetime64[ns]")
+            por_formato[tipo] = por_formato.get(tipo, 0) + int(ok.sum())
+            posiciones, textos = posiciones[~ok], textos[~ok]
+            if not len(posiciones):
+                break
+        if len(posiciones):
+            # Último recurso, elemento por elemento: solo lo que no encajó en ningún formato
+            resto = pd.to_datetime(textos, errors="coerce", format="mixed", dayfirst=True)
+            out[posiciones] = resto.to_numpy(dtype="datetime64[ns]")
+            por_formato["otros"] = int(len(posiciones))
+    return out, por_formato, formatos
+
+def _parsear_e_informar(serie: pd.Series, formatos=None):
+    valores, por_formato, formatos = _parsear(serie, formatos)
+    informe = dict(filas=len(serie), nat=int(np.isnat(valores).sum()),
+                   vacias=int(serie.isna().sum()), por_formato=por_formato, formatos=formatos)
+    return pd.Series(valores, index=serie.index, name=serie.name), informe
+
+def parsear_fechas(serie: pd.Series, formatos=None, usar_cache: bool = True):
+    """
+    Convierte la columna Fecha cruda a datetime64[ns] detectando una sola vez los
+    formatos presentes y usando un camino vectorizado para cada uno:
+      - datetime ya tipados (openpyxl)
+      - números seriales de Excel (origen 1899-12-30, redondeados al segundo)
+      - texto ISO (AAAA-MM-DD ...)
+      - texto local d/m/AAAA [H:MM[:SS]] (m/d si los datos lo indican)
+    El resultado se cachea por hash del contenido de la columna cruda.
+    Devuelve (serie_parseada, informe) con filas, NaT, conteo por formato y
+    'formatos', los formatos de texto usados (None si no hubo texto).
+
+    Con `formatos` (los de un informe anterior) no se vuelve a detectar: un
+    bloque chico de filas nuevas, p. ej. con solo días <= 12, se interpreta
+    igual que el sheet completo. usar_cache=False no consulta ni llena la
+    caché (lecturas incrementales, que no se repiten).
+    """
+    if not usar_cache:
+        return _parsear_e_informar(serie, formatos)
+    clave = (_huella_columna(serie), repr(formatos))
+    with _lock_fechas:
+        guardado = _cache_fechas.get(clave)
+        if guardado is not None:
+            _cache_fechas.move_to_end(clave)
+    if guardado is not None:
+        valores, informe = guardado
+        contar("cache_fechas", True)
+        return pd.Series(valores, index=serie.index, name=serie.name), dict(informe)
+    contar("cache_fechas", False)
+
+    parseada, informe = _parsear_e_informar(serie, formatos)
+    valores = parseada.to_numpy()
+    with _lock_fechas:
+        _cache_fechas[clave] = (valores, informe)
+        while len(_cache_fechas) > _CACHE_FECHAS_MAX:
+            _cache_fechas.popitem(last=False)
+    return pd.Series(valores, index=serie.index, name=serie.name), dict(informe)
+
+def normalizar_columnas(df: pd.DataFrame, formatos=None, usar_cache: bool = True) -> pd.DataFrame:
+    """
+    Nombres de columna canónicos ('Fecha', 'Id Equipo'), Fecha parseada (ver
+    parsear_fechas, que recibe `formatos` y `usar_cache`), 'Id Equipo'
+    categórica y 'Dia Turno'.
+    """
+    df.columns = [str(c).strip() for c in df.columns]
+    rename_map = {}
+    for c in df.columns:
+        cl = (
+            str(c)
+            .strip()
+            .lower()
+            .replace("í", "i").replace("á", "a").replace("é", "e")
+            .replace("ó", "o").replace("ú", "u")
+        )
+        if cl in ["fecha", "fecha y hora", "fecha/hora", "timestamp", "date", "datetime"]:
+            rename_map[c] = "Fecha"
+        if cl in ["id equipo", "id_equipo", "id maquina", "id máquina", "equipo", "machineid", "idequipo"]:
+            rename_map[c] = "Id Equipo"
+    df = df.rename(columns=rename_map)
+    if "Fecha" not in df.columns or "Id Equipo" not in df.columns:
+        raise ValueError("No se encuentran las columnas requeridas: 'Fecha' y 'Id Equipo'.")
+    with etapa("to_datetime", filas=len(df)) as e:
+        df["Fecha"], informe = parsear_fechas(df["Fecha"], formatos, usar_cache)
+        e.anotar(nat=informe["nat"])
+    # Filas con Fecha inválida (NaT): quedan contadas en vez de descartarse en silencio
+    df.attrs["informe_fechas"] = informe
+    df["Id Equipo"] = df["Id Equipo"].astype(str).str.strip().astype("category")
+    # Día calendario precalculado (clave del índice; los turnos noche se resuelven con el calendario)
+    df["Dia Turno"] = df["Fecha"].dt.normalize()
+    return df
+
+def filtrar_eventos(df: pd.DataFrame, maquinas_ids=None, fechas=None) -> pd.DataFrame:
+    """Filas de las máquinas y días de turno pedidos (sin pasar por objetos date)."""
+    mask = pd.Series(True, index=df.index)
+    if maquinas_ids is not None:
+        mask &= df["Id Equipo"].isin(list(maquinas_ids))
+    if fechas is not None:
+        dia = df["Dia Turno"] if "Dia Turno" in df.columns else df["Fecha"].dt.normalize()
+        mask &= dia.isin(pd.to_datetime(list(fechas)))
+    return df[mask]
+
+
+# =========================================================
+# Modo compacto (memoria)
+# =========================================================
+def memoria_eventos(df: pd.DataFrame) -> int:
+    """Bytes ocupados por el DataFrame (incluye el contenido de columnas object)."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def compactar_eventos(df: pd.DataFrame):
+    """
+    Versión compacta del DataFrame normalizado, con solo lo que usa el motor:
+      - Fecha: datetime64[s] (int64 de segundos epoch; se descartan fracciones de segundo)
+      - Id Equipo: categórica (códigos enteros chicos)
+      - Parcial: numérica con downcast (entero si todos los valores lo son), NaN → 0
+      - Planta (si hay varias fuentes): categórica
+    Filas sin Fecha se descartan. Devuelve (df_compacto, informe) con la memoria
+    antes/después en bytes.
+    """
+    antes = memoria_eventos(df)
+    d = df[df["Fecha"].notna()]
+    compacto = pd.DataFrame({
+        "Fecha": d["Fecha"].astype("datetime64[s]"),
+        "Id Equipo": d["Id Equipo"].astype("category"),
+    })
+    if "Planta" in d.columns:  # varias fuentes (fuentes.py)
+        compacto["Planta"] = d["Planta"].astype("category")
+    parcial_col = next((c for c in d.columns if "parcial" in str(c).strip().lower()), None)
+    if parcial_col is not None:
+        parc = pd.to_numeric(d[parcial_col], errors="coerce").fillna(0)
+        if (parc == parc.round()).all():
+            parc = pd.to_numeric(parc.astype("int64"), downcast="integer")
+        compacto["Parcial"] = parc
+    compacto = compacto.reset_index(drop=True)
+    despues = memoria_eventos(compacto)
+    informe = dict(filas=len(compacto), bytes_antes=antes, bytes_despues=despues,
+                   columnas_descartadas=[c for c in df.columns
+                                         if c not in (parcial_col, "Fecha", "Id Equipo", "Planta")])
+    return compacto, informe
+
+
+# =========================================================
+# Snapshot local (Arrow IPC) con refresco incremental
+# =========================================================
+# Columnas que se guardan como texto plano y vuelven categóricas al leer
+_CATEGORICAS = ("Id Equipo", "Planta")
+
+
+def _a_tabla_arrow(df: pd.DataFrame) -> pa.Table:
+    """
+    Convierte a Arrow; las columnas object con tipos mezclados se guardan como texto.
+    Las categóricas van como texto plano: un archivo IPC admite un solo
+    diccionario por columna, y una máquina nueva en un refresco lo cambiaría.
+    """
+    df = df.copy()
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype(str)
+        elif df[c].dtype == object:
+            try:
+                pa.array(df[c], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                df[c] = df[c].astype("string")
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def leer_snapshot(ruta: str) -> pa.Table:
+    """Abre el snapshot con memory map (sin copiar el archivo a memoria)."""
+    with etapa("snapshot_lectura") as e, pa.memory_map(ruta, "r") as fuente:
+        tabla = pa.ipc.open_file(fuente).read_all()
+        e.anotar(filas=tabla.num_rows)
+    return tabla
+
+def snapshot_a_pandas(tabla: pa.Table) -> pd.DataFrame:
+    """DataFrame del snapshot con 'Id Equipo' y 'Planta' categóricas, como normalizar_columnas."""
+    return tabla.to_pandas(categories=[c for c in _CATEGORICAS if c in tabla.column_names])
+
+# Versión del contenido guardada en los metadatos del snapshot: "<filas>-<huella>",
+# con la huella = suma (mód 2**64) de los hashes de fila, que no depende del orden
+_CLAVE_VERSION = b"reloj_version"
+
+
+def _huella_filas(tabla: pa.Table) -> int:
+    if tabla.num_rows == 0:
+        return 0
+    hashes = pd.util.hash_pandas_object(tabla.to_pandas(), index=False).to_numpy()
+    return int(hashes.sum(dtype="uint64"))
+
+def _version(filas: int, huella: int) -> str:
+    return f"{filas}-{huella % 2**64:016x}"
+
+def version_snapshot(ruta: str) -> str:
+    """Versión del contenido guardada en el snapshot ("" si no existe o no la tiene)."""
+    if not os.path.exists(ruta):
+        return ""
+    with pa.memory_map(ruta, "r") as fuente:
+        metadatos = pa.ipc.open_file(fuente).schema.metadata or {}
+    return metadatos.get(_CLAVE_VERSION, b"").decode()
+
+def escribir_snapshot(tabla: pa.Table, ruta: str, version: str = None) -> None:
+    """Escritura atómica: los lectores con el archivo mapeado siguen viendo la versión previa."""
+    if version is not None:
+        tabla = tabla.replace_schema_metadata({**(tabla.schema.metadata or {}),
+                                               _CLAVE_VERSION: version.encode()})
+    tmp = f"{ruta}.tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, tabla.schema) as writer:
+            writer.write_table(tabla)
+    os.replace(tmp, ruta)
+
+
+class SnapshotEventos:
+    """
+    Copia local normalizada de la fuente de eventos.
+
+    - cargar(): devuelve el DataFrame desde el snapshot (memory map). Si no existe,
+      lo construye en el momento; si está vencido (TTL), lo refresca en segundo plano.
+    - refrescar(): baja la fuente y agrega solo las filas con Fecha posterior a la
+      última guardada de su máquina (y planta, si hay varias). Si las filas
+      anteriores ya no coinciden con las guardadas (llegaron tarde, se editaron
+      o se borraron) se reescribe completo. Si la fuente no responde, se sigue
+      trabajando con el snapshot.
+    - version(): cambia solo cuando cambia el contenido (sirve de clave de caché).
+
+    `origen` es una URL / archivo, o un fuentes.RegistroFuentes (varias plantas).
+    """
+
+    def __init__(self, origen: str, ruta: str, ttl_segundos: float = 600):
+        self.origen = origen
+        self.ruta = ruta
+        self.ttl_segundos = ttl_segundos
+        self.ultimo_error = None
+        self.informe_fechas = None  # NaT / formatos de la última lectura de la fuente
+        self._lock = threading.Lock()
+
+    def version(self) -> str:
+        """Identifica el contenido actual (filas y huella); "" si todavía no existe."""
+        return version_snapshot(self.ruta)
+
+    def vencido(self) -> bool:
+        """Pasó el TTL desde el último refresco (el mtime se renueva aunque no haya novedades)."""
+        modificado = os.path.getmtime(self.ruta) if os.path.exists(self.ruta) else 0.0
+        return time.time() - modificado > self.ttl_segundos
+
+    def _reescribir(self, tabla: pa.Table) -> None:
+        escribir_snapshot(tabla, self.ruta, _version(tabla.num_rows, _huella_filas(tabla)))
+
+    def _leer_fuente(self) -> pd.DataFrame:
+        if hasattr(self.origen, "leer"):  # registro de varias plantas: ya viene normalizado
+            return self.origen.leer()
+        return normalizar_columnas(cargar_excel_desde_sheet(self.origen))
+
+    def refrescar(self) -> int:
+        """Devuelve la cantidad de filas nuevas agregadas al snapshot."""
+        with self._lock:
+            df = self._leer_fuente()
+            self.informe_fechas = df.attrs.get("informe_fechas")
+            df = df[df["Fecha"].notna()]
+            nuevo = _a_tabla_arrow(df)
+
+            actual_version = self.version()
+            if not actual_version:
+                # Sin snapshot (o sin versión, de antes de guardarla): se escribe completo
+                self._reescribir(nuevo)
+                return nuevo.num_rows
+            actual = leer_snapshot(self.ruta)
+            if not actual.schema.equals(nuevo.schema):
+                # Cambió la estructura del sheet: se reescribe completo
+                self._reescribir(nuevo)
+                return nuevo.num_rows
+
+            # Corte por máquina (y planta): una máquina que sincroniza tarde no pierde filas
+            claves = [c for c in ("Planta", "Id Equipo") if c in actual.column_names]
+            ultimas = (actual.select(claves + ["Fecha"]).to_pandas()
+                       .groupby(claves)["Fecha"].max().rename("corte"))
+            fuente = nuevo.select(claves + ["Fecha"]).to_pandas()
+            corte = fuente.join(ultimas, on=claves)["corte"]
+            posterior = pa.array((corte.isna() | (fuente["Fecha"] > corte)).to_numpy())
+            previas, agregadas = nuevo.filter(pc.invert(posterior)), nuevo.filter(posterior)
+
+            huella_previas = _huella_filas(previas)
+            if _version(previas.num_rows, huella_previas) != actual_version:
+                # Las filas hasta el corte no son las guardadas: se reescribe completo
+                self._reescribir(nuevo)
+                return max(nuevo.num_rows - actual.num_rows, 0)
+            if agregadas.num_rows == 0:
+                os.utime(self.ruta)  # sin novedades: se reinicia el TTL (la versión no cambia)
+                return 0
+            version = _version(nuevo.num_rows, huella_previas + _huella_filas(agregadas))
+            escribir_snapshot(pa.concat_tables([actual, agregadas]), self.ruta, version)
+            return agregadas.num_rows
+
+    def _refrescar_seguro(self):
+        try:
+            self.refrescar()
+            self.ultimo_error = None
+        except Exception as e:  # sin conexión: se mantiene el snapshot existente
+            self.ultimo_error = e
+
+    def refrescar_en_segundo_plano(self) -> None:
+        if self._lock.locked():
+            return
+        threading.Thread(target=en_segundo_plano(self._refrescar_seguro, "snapshot"), daemon=True).start()
+
+    def cargar(self) -> pd.DataFrame:
+        if not os.path.exists(self.ruta):
+            self.refrescar()
+        elif self.vencido():
+            self.refrescar_en_segundo_plano()
+        return snapshot_a_pandas(leer_snapshot(self.ruta))
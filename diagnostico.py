@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+# =========================================================
+# Instrumentación liviana por etapa
+# =========================================================
+# Se activa globalmente con RELOJ_DIAGNOSTICO=1 o por hilo con activar() (en
+# Streamlit cada sesión corre en su propio hilo). Apagada, etapa() devuelve un
+# objeto nulo compartido: el costo es una consulta de atributo por llamada.
+#
+# El trabajo que corre en otros hilos (refresco del snapshot, lectura de plantas)
+# se mide si alguna sesión activó el diagnóstico en los últimos minutos (cada
+# rerun de Streamlit corre en un hilo nuevo, así que no hay un hilo al que
+# preguntarle) y sus registros quedan en un buffer del proceso (etapas_fondo). Los workers del pool de render miden con
+# capturar() y devuelven sus registros junto con cada resultado (agregar()).
+logger = logging.getLogger("reloj.diagnostico")
+
+_GLOBAL = os.environ.get("RELOJ_DIAGNOSTICO", "").strip().lower() in ("1", "true", "si", "sí")
+_local = threading.local()
+_VENTANA_FONDO = 600.0  # segundos desde la última activación en que se mide el trabajo de fondo
+_ultima_activacion = None
+_fondo = deque(maxlen=500)
+_fondo_lock = threading.Lock()
+
+
+def _configurar_logger() -> None:
+    """
+    Deja el logger en INFO (salvo que ya tenga un nivel propio) y, si nadie
+    configuró logging, le agrega una salida a stderr con una línea JSON por registro.
+    """
+    if logger.level == logging.NOTSET:
+        logger.setLevel(logging.INFO)
+    if not logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+
+if _GLOBAL:  # p. ej. corridas de cron de cubo_kpis.py, que nunca llaman a activar()
+    _configurar_logger()
+
+
+def activo() -> bool:
+    return _GLOBAL or getattr(_local, "activo", False)
+
+def activar(valor: bool = True) -> None:
+    """Activa/desactiva la medición para el hilo actual y reinicia sus registros."""
+    global _ultima_activacion
+    _local.activo = valor
+    reiniciar()
+    if valor:
+        _ultima_activacion = time.monotonic()
+        _configurar_logger()
+
+def reiniciar() -> None:
+    _local.etapas = []
+    _local.contadores = {}
+
+def etapas() -> list:
+    """Registros de la corrida actual: dicts con etapa, segundos, filas y extras."""
+    return list(getattr(_local, "etapas", []))
+
+def contadores() -> dict:
+    """Contadores de la corrida actual, p. ej. {'cache_relojes': {'aciertos': 3, 'fallos': 1}}."""
+    return {k: dict(v) for k, v in getattr(_local, "contadores", {}).items()}
+
+def etapas_fondo() -> list:
+    """Últimos registros del trabajo en segundo plano de todo el proceso (más viejos primero)."""
+    with _fondo_lock:
+        return list(_fondo)
+
+def agregar(registros, **extra) -> None:
+    """Suma a la corrida actual registros medidos en otro proceso (ver capturar())."""
+    if not activo():
+        return
+    if not hasattr(_local, "etapas"):
+        reiniciar()
+    for r in registros:
+        r = {**r, **extra}
+        _local.etapas.append(r)
+        logger.info(json.dumps(r, ensure_ascii=False, default=str))
+
+@contextmanager
+def capturar(emitir: bool = True):
+    """
+    Mide lo que corre dentro del bloque en este hilo, esté o no activo, y deja
+    los registros en la lista que devuelve. Con emitir=False no se loguean (un
+    worker del pool: los emite el proceso que los recibe con agregar()).
+    """
+    previo = {k: getattr(_local, k) for k in ("activo", "etapas", "contadores", "silencioso")
+              if hasattr(_local, k)}
+    _local.activo, _local.silencioso = True, not emitir
+    reiniciar()
+    registros = []
+    try:
+        yield registros
+    finally:
+        registros.extend(_local.etapas)
+        for k in ("activo", "etapas", "contadores", "silencioso"):
+            if k in previo:
+                setattr(_local, k, previo[k])
+            elif hasattr(_local, k):
+                delattr(_local, k)
+
+def medir_fondo() -> bool:
+    """True si el diagnóstico está activo acá, por RELOJ_DIAGNOSTICO o en alguna sesión reciente."""
+    return (activo() or (_ultima_activacion is not None
+                         and time.monotonic() - _ultima_activacion < _VENTANA_FONDO))
+
+def en_segundo_plano(fn, origen: str):
+    """
+    Envuelve fn para correrla en otro hilo: si hay diagnóstico activo en el
+    proceso, sus etapas van a etapas_fondo() con 'origen' (p. ej. "snapshot").
+    """
+    lanzada_con_diagnostico = medir_fondo()
+
+    def envuelta(*args, **kwargs):
+        if not (lanzada_con_diagnostico or medir_fondo()):
+            return fn(*args, **kwargs)
+        registros = []
+        try:
+            with capturar() as registros:
+                return fn(*args, **kwargs)
+        finally:
+            hora = time.strftime("%H:%M:%S")
+            with _fondo_lock:
+                _fondo.extend(dict(r, origen=origen, hora=hora) for r in registros)
+    return envuelta
+
+
+class _EtapaNula:
+    """Etapa cuando la medición está apagada: no hace nada."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def anotar(self, **datos):
+        pass
+
+
+_NULA = _EtapaNula()
+
+
+class _Etapa:
+    def __init__(self, nombre, filas=None, **extra):
+        self.nombre = nombre
+        self.filas = filas
+        self.extra = extra
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def anotar(self, filas=None, **datos):
+        """Agrega filas procesadas u otros datos al registro de la etapa."""
+        if filas is not None:
+            self.filas = filas
+        self.extra.update(datos)
+
+    def __exit__(self, *exc):
+        registro = dict(etapa=self.nombre, segundos=round(time.perf_counter() - self._t0, 6))
+        if self.filas is not None:
+            registro["filas"] = int(self.filas)
+        registro.update(self.extra)
+        if not hasattr(_local, "etapas"):
+            reiniciar()
+        _local.etapas.append(registro)
+        if not getattr(_local, "silencioso", False):
+            logger.info(json.dumps(registro, ensure_ascii=False, default=str))
+        return False
+
+
+def etapa(nombre, filas=None, **extra):
+    """
+    Mide un bloque:  with etapa("descarga") as e: ...; e.anotar(filas=len(df))
+    Cada registro también se emite como una línea JSON en el logger 'reloj.diagnostico'.
+    """
+    if not activo():
+        return _NULA
+    return _Etapa(nombre, filas, **extra)
+
+def contar(nombre, acierto: bool) -> None:
+    """Suma un acierto o un fallo de caché."""
+    if not activo():
+        return
+    if not hasattr(_local, "contadores"):
+        reiniciar()
+    c = _local.contadores.setdefault(nombre, {"aciertos": 0, "fallos": 0})
+    c["aciertos" if acierto else "fallos"] += 1
+
+def emitir_resumen() -> None:
+    """Emite los contadores de la corrida como una línea JSON."""
+    if activo():
+        logger.info(json.dumps(dict(contadores=contadores()), ensure_ascii=False))
@@ -0,0 +1,101 @@
+import numbers
+from io import BytesIO
+
+import pandas as pd
+import xlsxwriter
+
+from diagnostico import etapa
+
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+FORMATO_DURACION = "[h]:mm:ss"
+
+
+# =========================================================
+# Detalle de un día (una hoja)
+# =========================================================
+def excel_detalle_dia(lista_gaps) -> bytes:
+    """Workbook con los tiempos muertos de un día (Duracion como fracción del día)."""
+    with etapa("excel_dia", filas=len(lista_gaps)):
+        return _excel_detalle_dia(lista_gaps)
+
+def _excel_detalle_dia(lista_gaps) -> bytes:
+    output = BytesIO()
+    df_gaps = pd.DataFrame(lista_gaps)
+
+    if not df_gaps.empty:
+        dur_seconds = pd.to_timedelta(df_gaps["Duracion_min"], unit="m").dt.total_seconds()
+        df_xlsx = pd.DataFrame({
+            "Inicio": df_gaps["Inicio"],
+            "Fin": df_gaps["Fin"],
+            "Duracion": (dur_seconds / 86400.0)  # Excel: fracción del día
+        })
+    else:
+        df_xlsx = pd.DataFrame(columns=["Inicio", "Fin", "Duracion"])
+
+    # Forzamos xlsxwriter para evitar problemas de entorno
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        df_xlsx.to_excel(writer, index=False, sheet_name="TiemposMuertos")
+        workbook  = writer.book
+        worksheet = writer.sheets["TiemposMuertos"]
+        time_fmt = workbook.add_format({"num_format": FORMATO_DURACION})
+        worksheet.set_column(0, 0, 10)             # A: Inicio
+        worksheet.set_column(1, 1, 10)             # B: Fin
+        worksheet.set_column(2, 2, 12, time_fmt)   # C: Duracion
+    return output.getvalue()
+
+
+# =========================================================
+# Consolidado (una hoja por máquina + resumen), en streaming
+# =========================================================
+def _nombre_hoja(nombre, usados):
+    """Nombre válido para Excel (<= 31 caracteres, sin []:*?/\\) y sin repetir."""
+    limpio = "".join("_" if ch in "[]:*?/\\" else ch for ch in str(nombre))[:31] or "Hoja"
+    base, n = limpio, 2
+    while limpio.lower() in usados:
+        sufijo = f" ({n})"
+        limpio, n = base[:31 - len(sufijo)] + sufijo, n + 1
+    usados.add(limpio.lower())
+    return limpio
+
+def excel_consolidado(gaps_por_maquina, resumen=None) -> bytes:
+    """
+    Un solo workbook con una hoja por máquina (Fecha, Inicio, Fin, Duracion) y,
+    opcionalmente, una hoja 'Resumen' con la tabla de indicadores.
+
+    Se escribe con xlsxwriter en modo constant_memory (fila por fila), así el
+    uso de memoria no crece con la cantidad de días y máquinas exportados.
+    """
+    with etapa("excel_consolidado", filas=sum(len(g) for g in gaps_por_maquina.values())):
+        return _excel_consolidado(gaps_por_maquina, resumen)
+
+def _excel_consolidado(gaps_por_maquina, resumen=None) -> bytes:
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    bold = workbook.add_format({"bold": True})
+    time_fmt = workbook.add_format({"num_format": FORMATO_DURACION})
+    usados = set()
+
+    for maquina, gaps in gaps_por_maquina.items():
+        ws = workbook.add_worksheet(_nombre_hoja(maquina, usados))
+        ws.set_column(0, 0, 12)             # A: Fecha
+        ws.set_column(1, 2, 10)             # B-C: Inicio, Fin
+        ws.set_column(3, 3, 12, time_fmt)   # D: Duracion
+        ws.write_row(0, 0, ["Fecha", "Inicio", "Fin", "Duracion"], bold)
+        for i, (fecha, inicio, fin, dur_min) in enumerate(
+            gaps[["Fecha", "Inicio", "Fin", "Duracion_min"]].itertuples(index=False, name=None), start=1
+        ):
+            ws.write_string(i, 0, str(fecha))
+            ws.write_string(i, 1, inicio)
+            ws.write_string(i, 2, fin)
+            ws.write_number(i, 3, dur_min * 60.0 / 86400.0, time_fmt)  # fracción del día
+
+    if resumen is not None:
+        ws = workbook.add_worksheet(_nombre_hoja("Resumen", usados))
+        ws.set_column(0, len(resumen.columns) - 1, 18)
+        ws.write_row(0, 0, [str(c) for c in resumen.columns], bold)
+        for i, fila in enumerate(resumen.itertuples(index=False, name=None), start=1):
+            ws.write_row(i, 0, [v if isinstance(v, numbers.Real) else str(v) for v in fila])
+
+    workbook.close()
+    return output.getvalue()
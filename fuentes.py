@@ -0,0 +1,309 @@
+import http.client
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from urllib.parse import urljoin, urlsplit
+
+import pandas as pd
+
+from datos import (SHEET_EXPORT_URL, MACHINE_NAME_TO_ID, cargar_excel_desde_sheet,
+                   normalizar_columnas)
+from diagnostico import en_segundo_plano
+
+
+# =========================================================
+# Conexiones HTTP reutilizadas
+# =========================================================
+class ConexionesHTTP:
+    """
+    Descargas HTTP(S) con conexiones keep-alive reutilizadas: una conexión por
+    (hilo, esquema, host, puerto), así cada hilo del pool vuelve a usar la suya
+    en los refrescos siguientes. Sigue redirecciones (el export de Google
+    redirige a otro host) y reintenta una vez si el servidor cerró una conexión
+    reutilizada.
+    """
+
+    def __init__(self, timeout: float = 60, max_redirecciones: int = 5):
+        self.timeout = timeout
+        self.max_redirecciones = max_redirecciones
+        self.abiertas = 0  # conexiones creadas (para medir la reutilización)
+        self.pedidos = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._todas = []
+
+    def _conexion(self, esquema, host, puerto):
+        conexiones = self._local.__dict__.setdefault("conexiones", {})
+        clave = (esquema, host, puerto)
+        if clave not in conexiones:
+            clase = http.client.HTTPSConnection if esquema == "https" else http.client.HTTPConnection
+            conexiones[clave] = clase(host, puerto, timeout=self.timeout)
+            with self._lock:
+                self.abiertas += 1
+                self._todas.append(conexiones[clave])
+        return clave, conexiones[clave]
+
+    def _descartar(self, clave):
+        conexion = self._local.conexiones.pop(clave, None)
+        if conexion is not None:
+            conexion.close()
+            with self._lock:
+                self._todas.remove(conexion)
+
+    def _pedir(self, url):
+        partes = urlsplit(url)
+        ruta = (partes.path or "/") + (f"?{partes.query}" if partes.query else "")
+        for intento in range(2):
+            clave, conexion = self._conexion(partes.scheme, partes.hostname, partes.port)
+            reutilizada = conexion.sock is not None
+            try:
+                conexion.request("GET", ruta, headers={"Connection": "keep-alive"})
+                resp = conexion.getresponse()
+                cuerpo = resp.read()
+            except (http.client.HTTPException, OSError):
+                self._descartar(clave)
+                if intento or not reutilizada:
+                    raise
+                continue  # el servidor cerró la conexión ociosa: se abre otra
+            if resp.will_close:
+                self._descartar(clave)
+            with self._lock:
+                self.pedidos += 1
+            return resp, cuerpo
+
+    def descargar(self, url: str) -> bytes:
+        for _ in range(self.max_redirecciones + 1):
+            resp, cuerpo = self._pedir(url)
+            if resp.status in (301, 302, 303, 307, 308) and resp.getheader("Location"):
+                url = urljoin(url, resp.getheader("Location"))
+                continue
+            if resp.status != 200:
+                raise OSError(f"HTTP {resp.status} {resp.reason} al leer {url}")
+            return cuerpo
+        raise OSError(f"Demasiadas redirecciones al leer {url}")
+
+    def cerrar(self) -> None:
+        with self._lock:
+            for conexion in self._todas:
+                conexion.close()
+            self._todas = []
+
+
+# =========================================================
+# Registro de fuentes (una por planta)
+# =========================================================
+class Fuente:
+    """Sheet o archivo de eventos de una planta, con su mapa nombre → Id Equipo."""
+
+    def __init__(self, planta: str, origen: str, maquinas=None):
+        self.planta = planta
+        self.origen = origen
+        self.maquinas = dict(maquinas or {})
+        self.datos = None  # último DataFrame leído bien (se conserva si la fuente falla)
+        self.ultimo_error = None
+        self.ultima_lectura = None  # datetime de la última lectura correcta
+        self.segundos = None
+
+    def __repr__(self):
+        return f"Fuente({self.planta!r}, {self.origen!r})"
+
+
+class RegistroFuentes:
+    """
+    Varias fuentes de eventos (plantas) leídas en paralelo y unidas en una sola
+    tabla normalizada, con la columna 'Planta' en cada fila.
+
+    - refrescar(plantas): lee las fuentes en un pool de hilos; una fuente caída
+      no frena a las demás y conserva sus últimos datos.
+    - refrescar_fallidas(): reintenta solo las que fallaron.
+    - leer(): refresca las vencidas (más viejas que `ttl_segundos`) o fallidas y
+      devuelve la tabla unida; sirve como `origen` de datos.SnapshotEventos.
+      Con `espera_segundos` no espera más que eso a las fuentes lentas: se une
+      lo que terminó y las demás siguen leyéndose en segundo plano con sus
+      últimos datos (sin espera, p. ej. en la CLI, se espera a todas).
+    """
+
+    def __init__(self, fuentes, max_hilos=None, timeout: float = 60, ttl_segundos: float = 0,
+                 espera_segundos=None):
+        self.fuentes = list(fuentes)
+        plantas = [f.planta for f in self.fuentes]
+        if not plantas:
+            raise ValueError("El registro necesita al menos una fuente.")
+        if len(set(plantas)) != len(plantas):
+            raise ValueError(f"Plantas repetidas en el registro: {plantas}")
+        self.ttl_segundos = ttl_segundos
+        self.espera_segundos = espera_segundos
+        self.http = ConexionesHTTP(timeout=timeout)
+        self._pool = ThreadPoolExecutor(max_workers=max_hilos or min(8, len(self.fuentes)),
+                                        thread_name_prefix="fuente")
+        self._en_curso = {}  # planta -> Future de la lectura en curso
+        self._lock = threading.Lock()
+
+    def plantas(self) -> list:
+        return [f.planta for f in self.fuentes]
+
+    def fuente(self, planta: str) -> Fuente:
+        return next(f for f in self.fuentes if f.planta == planta)
+
+    def _leer(self, fuente: Fuente) -> pd.DataFrame:
+        t0 = time.perf_counter()
+        df = normalizar_columnas(cargar_excel_desde_sheet(fuente.origen, descargar=self.http.descargar))
+        # El contador puede llamarse distinto en cada sheet: se unifica como 'Parcial'
+        parcial = next((c for c in df.columns if "parcial" in str(c).strip().lower()), None)
+        if parcial is not None and parcial != "Parcial":
+            df = df.rename(columns={parcial: "Parcial"})
+        df["Planta"] = fuente.planta
+        fuente.segundos = time.perf_counter() - t0
+        return df
+
+    def _terminar(self, fuente: Fuente, futuro) -> None:
+        """Guarda el resultado de una lectura terminada (idempotente: pueden esperarla varios)."""
+        try:
+            fuente.datos = futuro.result()
+            fuente.ultimo_error = None
+            fuente.ultima_lectura = datetime.now()
+        except Exception as e:  # fuente caída: se conservan sus datos anteriores
+            fuente.ultimo_error = e
+        with self._lock:
+            if self._en_curso.get(fuente.planta) is futuro:
+                del self._en_curso[fuente.planta]
+
+    def refrescar(self, plantas=None, espera=None) -> dict:
+        """
+        Lee en paralelo las fuentes de `plantas` (todas por defecto). Si una ya
+        se está leyendo, se espera esa misma lectura. Con `espera` (segundos) se
+        vuelve a lo sumo en ese tiempo: las lecturas sin terminar siguen en
+        segundo plano y guardan su resultado al terminar.
+        Devuelve {planta: error o None} de las que terminaron.
+        """
+        elegidas = [f for f in self.fuentes if plantas is None or f.planta in plantas]
+        futuros, nuevos = {}, []
+        with self._lock:
+            for f in elegidas:
+                if f.planta not in self._en_curso:
+                    self._en_curso[f.planta] = self._pool.submit(en_segundo_plano(self._leer, f"planta {f.planta}"), f)
+                    nuevos.append(f)
+                futuros[f.planta] = self._en_curso[f.planta]
+        for f in nuevos:  # fuera del lock: si ya terminó, el callback corre en este hilo
+            futuros[f.planta].add_done_callback(lambda futuro, f=f: self._terminar(f, futuro))
+        listos, _ = wait(futuros.values(), timeout=espera)
+        terminadas = [f for f in elegidas if futuros[f.planta] in listos]
+        for f in terminadas:  # el callback puede no haber corrido todavía
+            self._terminar(f, futuros[f.planta])
+        return {f.planta: f.ultimo_error for f in terminadas}
+
+    def demoradas(self) -> list:
+        """Plantas con una lectura todavía en curso (se usan sus últimos datos)."""
+        with self._lock:
+            return [p for p in self.plantas() if p in self._en_curso]
+
+    def fallidas(self) -> dict:
+        """{planta: error} de las fuentes cuya última lectura falló."""
+        return {f.planta: f.ultimo_error for f in self.fuentes if f.ultimo_error is not None}
+
+    def refrescar_fallidas(self) -> dict:
+        return self.refrescar([f.planta for f in self.fuentes if f.ultimo_error is not None or f.datos is None])
+
+    def vencidas(self) -> list:
+        ahora = datetime.now()
+        return [f.planta for f in self.fuentes
+                if f.datos is None or f.ultimo_error is not None
+                or (ahora - f.ultima_lectura).total_seconds() >= self.ttl_segundos]
+
+    def tabla(self) -> pd.DataFrame:
+        """
+        Une los últimos datos de cada fuente. 'Id Equipo' y 'Planta' quedan
+        categóricas; el informe de fechas suma el de cada fuente. Si ninguna
+        fuente se pudo leer nunca, se relanza el primer error.
+        """
+        partes = [f.datos for f in self.fuentes if f.datos is not None]
+        if not partes:
+            errores = [f.ultimo_error for f in self.fuentes if f.ultimo_error is not None]
+            raise errores[0] if errores else ValueError("Ninguna fuente fue leída todavía.")
+        df = pd.concat(partes, ignore_index=True)
+        df["Id Equipo"] = df["Id Equipo"].astype(str).astype("category")
+        df["Planta"] = pd.Categorical(df["Planta"], categories=self.plantas())
+        informe = dict(filas=0, nat=0, vacias=0, por_formato={})
+        for p in partes:
+            parcial = p.attrs.get("informe_fechas") or {}
+            for k in ("filas", "nat", "vacias"):
+                informe[k] += parcial.get(k, 0)
+            for fmt, n in parcial.get("por_formato", {}).items():
+                informe["por_formato"][fmt] = informe["por_formato"].get(fmt, 0) + n
+        df.attrs["informe_fechas"] = informe
+        return df
+
+    def leer(self) -> pd.DataFrame:
+        vencidas = self.vencidas()
+        if vencidas:
+            # Sin datos de ninguna planta no hay nada que mostrar: se espera a que terminen
+            hay_datos = any(f.datos is not None for f in self.fuentes)
+            self.refrescar(vencidas, espera=self.espera_segundos if hay_datos else None)
+        return self.tabla()
+
+    # ---------------- Mapas de máquinas ----------------
+    def nombre_a_id(self) -> dict:
+        """Nombre visible → Id Equipo de todas las plantas; un nombre repetido lleva la planta."""
+        conteo = {}
+        for f in self.fuentes:
+            for nombre in f.maquinas:
+                conteo[nombre] = conteo.get(nombre, 0) + 1
+        return {(nombre if conteo[nombre] == 1 else f"{nombre} ({f.planta})"): mid
+                for f in self.fuentes for nombre, mid in f.maquinas.items()}
+
+    def planta_de_maquina(self) -> dict:
+        """Id Equipo → planta, según los mapas de máquinas."""
+        return {mid: f.planta for f in self.fuentes for mid in f.maquinas.values()}
+
+    def cerrar(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self.http.cerrar()
+
+
+# =========================================================
+# Configuración desde JSON
+# =========================================================
+# {
+#   "plantas": [
+#     {"nombre": "Planta Norte", "origen": "https://docs.google.com/.../export?format=xlsx",
+#      "maquinas": {"Seccionadora": "4C4F686CDDA0", ...}},
+#     {"nombre": "Planta Sur", "origen": "datos/sur.xlsx", "maquinas": {...}}
+#   ],
+#   "max_hilos": 4,
+#   "timeout": 60,
+#   "espera": 15
+# }
+# `origen` acepta lo mismo que datos.cargar_excel_desde_sheet (URL o archivo local);
+# las rutas relativas se toman desde la carpeta del JSON. `espera` (segundos,
+# opcional) es el máximo que leer() espera a una planta lenta (ver RegistroFuentes).
+def registro_desde_config(config: dict, base: str = "", ttl_segundos: float = 0,
+                          espera_segundos=None) -> RegistroFuentes:
+    """
+    Arma un RegistroFuentes desde un dict (formato JSON de arriba);
+    `espera_segundos` se usa si el JSON no define "espera".
+    """
+    fuentes = []
+    for p in config.get("plantas", []):
+        origen = str(p["origen"])
+        if base and "://" not in origen and not os.path.isabs(origen):
+            origen = os.path.join(base, origen)
+        fuentes.append(Fuente(str(p["nombre"]), origen, p.get("maquinas")))
+    return RegistroFuentes(fuentes, max_hilos=config.get("max_hilos"),
+                           timeout=config.get("timeout", 60), ttl_segundos=ttl_segundos,
+                           espera_segundos=config.get("espera", espera_segundos))
+
+def cargar_registro(ruta=None, origen=None, ttl_segundos: float = 0, espera_segundos=None) -> RegistroFuentes:
+    """
+    Registro desde un archivo JSON; sin ruta, una sola planta con `origen`
+    (por defecto el sheet de planta) y MACHINE_NAME_TO_ID.
+    """
+    if not ruta:
+        return RegistroFuentes([Fuente("Planta", origen or SHEET_EXPORT_URL, MACHINE_NAME_TO_ID)],
+                               ttl_segundos=ttl_segundos, espera_segundos=espera_segundos)
+    with open(ruta, encoding="utf-8") as f:
+        config = json.load(f)
+    return registro_desde_config(config, base=os.path.dirname(os.path.abspath(ruta)),
+                                 ttl_segundos=ttl_segundos, espera_segundos=espera_segundos)
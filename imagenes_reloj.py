@@ -0,0 +1,261 @@
+import hashlib
+import math
+import os
+import threading
+import tracemalloc
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from multiprocessing import get_context
+
+from diagnostico import activo, agregar, capturar, contar, etapa
+from reloj_circular import dibujar_reloj
+
+
+# =========================================================
+# Codificación de figuras
+# =========================================================
+def figura_a_bytes(fig, formato="png", dpi=200):
+    """Serializa la figura (mismos parámetros que usa st.pyplot) y la libera."""
+    buf = BytesIO()
+    try:
+        fig.savefig(buf, format=formato, dpi=dpi, bbox_inches="tight")
+    finally:
+        if fig.canvas.manager is not None:  # creada con pyplot: sacarla del registro global
+            import matplotlib.pyplot as plt
+            plt.close(fig)
+        fig.clear()
+    return buf.getvalue()
+
+def _renderizar(resultado, formato="png"):
+    with etapa("render", segmentos=len(resultado["unplanned"])):
+        return figura_a_bytes(dibujar_reloj(resultado), formato=formato)
+
+def _renderizar_medido(resultado, formato="png"):
+    # En el worker: la imagen y los registros de diagnóstico, que emite el proceso principal
+    with capturar(emitir=False) as registros:
+        datos = _renderizar(resultado, formato)
+    return datos, registros
+
+
+# =========================================================
+# Render en paralelo (pool de procesos)
+# =========================================================
+def procesos_render(procesos=None) -> int:
+    """Procesos del pool de render: `procesos` o, por defecto, hasta 4."""
+    return procesos or min(4, os.cpu_count() or 1)
+
+def crear_pool_render(procesos=None, max_relojes_por_proceso=200):
+    """
+    Pool de procesos para dibujar relojes. Se usa 'spawn' (el proceso de Streamlit
+    tiene hilos) y cada worker se recicla tras `max_relojes_por_proceso` relojes,
+    así la memoria de matplotlib no crece sin límite.
+    """
+    return ProcessPoolExecutor(
+        max_workers=procesos_render(procesos),
+        mp_context=get_context("spawn"),
+        max_tasks_per_child=max_relojes_por_proceso,
+    )
+
+def renderizar_relojes(resultados, pool=None, formato="png"):
+    """
+    Dibuja los resultados de calcular_reloj y devuelve las imágenes en el mismo
+    orden. Con `pool` (ver crear_pool_render) el trabajo se reparte entre procesos;
+    sin pool se dibuja en serie en este proceso.
+    """
+    resultados = list(resultados)
+    if pool is None or len(resultados) < 2:
+        return [_renderizar(r, formato) for r in resultados]
+    formatos = [formato] * len(resultados)
+    if not activo():
+        return list(pool.map(_renderizar, resultados, formatos))
+    with etapa("render_pool", relojes=len(resultados)):
+        salida = list(pool.map(_renderizar_medido, resultados, formatos))
+    for _, registros in salida:
+        agregar(registros, proceso="pool")
+    return [datos for datos, _ in salida]
+
+def _rss_kb(campo):
+    with open("/proc/self/status") as f:
+        return next(int(l.split()[1]) for l in f if l.startswith(campo + ":"))
+
+def _pico_rss(fn):
+    """
+    Pico de RSS (bytes) por encima del RSS previo mientras corre fn(). Solo
+    Linux: se reinicia el máximo del proceso (VmHWM) escribiendo 5 en
+    /proc/self/clear_refs. Devuelve None si no se puede medir.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        antes = _rss_kb("VmRSS")
+    except (OSError, StopIteration):
+        return None
+    fn()
+    return max(_rss_kb("VmHWM") - antes, 0) * 1024
+
+def _bytes_canvas(fig, dpi):
+    """Buffer RGBA del canvas Agg al guardar con `dpi` (memoria C++, invisible para tracemalloc)."""
+    ancho, alto = fig.get_size_inches() * dpi
+    return math.ceil(ancho) * math.ceil(alto) * 4
+
+def _medir_memoria(resultado, formato="png", dpi=200, repeticiones=2):
+    # Un dibujo previo a baja resolución carga fuentes y cachés de matplotlib
+    # (costo fijo por proceso, no por reloj) sin dejar buffers grandes ya reservados
+    figura_a_bytes(dibujar_reloj(resultado), formato=formato, dpi=10)
+    picos = []
+    for _ in range(repeticiones):
+        tracemalloc.start()
+        try:
+            fig = dibujar_reloj(resultado)
+            canvas = _bytes_canvas(fig, dpi)
+            rss = _pico_rss(lambda: figura_a_bytes(fig, formato=formato, dpi=dpi))
+            python = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        picos.append(max(rss or 0, python + canvas))
+    return max(picos)
+
+def memoria_por_reloj(resultado, formato="png", dpi=200):
+    """
+    Cota medida (bytes) de la memoria que suma dibujar y codificar un reloj.
+
+    Se toma el pico de RSS durante el dibujo (incluye el canvas Agg en C++ y los
+    buffers del codificador) y, como piso, el pico de tracemalloc más el buffer
+    RGBA ancho × alto × 4. Corre en un proceso nuevo de un solo uso (~1-2 s de
+    arranque): en un proceso con historia el allocator reutiliza memoria ya
+    reservada y el RSS subestima el costo.
+    """
+    with crear_pool_render(1, max_relojes_por_proceso=1) as pool:
+        return pool.submit(_medir_memoria, resultado, formato, dpi).result()
+
+
+# =========================================================
+# Caché LRU de relojes renderizados
+# =========================================================
+class CacheRelojes:
+    """
+    Caché de imágenes de relojes, acotada en bytes con desalojo LRU.
+
+    La clave es (maquina_id, fecha, umbral_minutos, huella_datos), donde la huella
+    identifica los eventos del día: los días pasados conservan la misma huella
+    aunque el snapshot se refresque, así que solo "hoy" se vuelve a dibujar.
+    Con `directorio` las imágenes también se persisten en disco, acotadas a
+    `max_bytes_disco`: al pasarse se borran las de mtime más viejo (una lectura
+    desde disco renueva el mtime).
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directorio=None, formato="png",
+                 max_bytes_disco=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_bytes_disco = max_bytes_disco
+        self.directorio = directorio
+        self.formato = formato
+        self.aciertos = 0
+        self.fallos = 0
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._bytes_disco = 0
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+            self._bytes_disco = sum(tam for _, tam, _ in self._archivos_disco())
+            self._podar_disco()
+
+    def _ruta(self, clave):
+        nombre = hashlib.sha1(repr(clave).encode("utf-8")).hexdigest()
+        return os.path.join(self.directorio, f"{nombre}.{self.formato}")
+
+    def _guardar(self, clave, datos):
+        self._items[clave] = datos
+        self._items.move_to_end(clave)
+        self._bytes += len(datos)
+        while self._bytes > self.max_bytes and len(self._items) > 1:
+            _, viejo = self._items.popitem(last=False)
+            self._bytes -= len(viejo)
+
+    def _archivos_disco(self):
+        """(ruta, bytes, mtime) de las imágenes guardadas en el directorio."""
+        archivos = []
+        for entrada in os.scandir(self.directorio):
+            if entrada.is_file() and entrada.name.endswith(f".{self.formato}"):
+                try:
+                    st = entrada.stat()
+                except FileNotFoundError:  # borrada por otro proceso
+                    continue
+                archivos.append((entrada.path, st.st_size, st.st_mtime))
+        return archivos
+
+    def _podar_disco(self):
+        if self._bytes_disco <= self.max_bytes_disco:
+            return
+        archivos = sorted(self._archivos_disco(), key=lambda a: a[2])
+        self._bytes_disco = sum(tam for _, tam, _ in archivos)
+        for ruta, tam, _ in archivos:
+            if self._bytes_disco <= self.max_bytes_disco:
+                break
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            self._bytes_disco -= tam
+
+    def _leer_disco(self, clave):
+        try:
+            with open(self._ruta(clave), "rb") as f:
+                datos = f.read()
+            os.utime(self._ruta(clave))  # recién usada: última en podarse
+        except FileNotFoundError:  # no está (o se podó recién)
+            return None
+        return datos
+
+    def __contains__(self, clave):
+        """Consulta sin afectar el orden LRU ni los contadores."""
+        with self._lock:
+            if clave in self._items:
+                return True
+        return bool(self.directorio) and os.path.exists(self._ruta(clave))
+
+    def get(self, clave):
+        with self._lock:
+            datos = self._items.get(clave)
+            if datos is not None:
+                self._items.move_to_end(clave)
+                self.aciertos += 1
+                contar("cache_relojes", True)
+                return datos
+        datos = self._leer_disco(clave) if self.directorio else None
+        if datos is not None:
+            with self._lock:
+                if clave not in self._items:
+                    self._guardar(clave, datos)
+                self.aciertos += 1
+            contar("cache_relojes", True)
+            return datos
+        with self._lock:
+            self.fallos += 1
+        contar("cache_relojes", False)
+        return None
+
+    def put(self, clave, datos):
+        with self._lock:
+            if clave in self._items:
+                self._bytes -= len(self._items.pop(clave))
+            self._guardar(clave, datos)
+        if self.directorio:
+            tmp = f"{self._ruta(clave)}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(datos)
+            os.replace(tmp, self._ruta(clave))
+            with self._lock:
+                self._bytes_disco += len(datos)
+                self._podar_disco()
+
+    def obtener(self, clave, dibujar):
+        """Devuelve la imagen cacheada o la genera con dibujar() -> Figure."""
+        datos = self.get(clave)
+        if datos is None:
+            with etapa("render"):
+                datos = figura_a_bytes(dibujar(), formato=self.formato)
+            self.put(clave, datos)
+        return datos
@@ -1,145 +1,287 @@
-import matplotlib.pyplot as plt
+import hashlib
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import timedelta
+
+from turnos import CALENDARIO_POR_DEFECTO, NS_DIA, restar_intervalos
 
 
 # =========================
 # Utilidades internas
 # =========================
-def _combine(date_dt, t):
-    return datetime(date_dt.year, date_dt.month, date_dt.day, t.hour, t.minute, 0)
+def _columna_parcial(columnas):
+    """
+    Devuelve la primera columna cuyo nombre contenga 'parcial' (o None).
+    """
+    for c in columnas:
+        if "parcial" in str(c).strip().lower():
+            return c
+    return None
+
+
+# =========================
+# Índice de eventos por (máquina, día de turno)
+# =========================
+class IndiceEventos:
+    """
+    Índice reutilizable de eventos, construido una vez por carga de datos.
+
+    Resuelve la columna Parcial una sola vez (ya numérica), ordena por
+    (máquina, día de turno, Fecha) y guarda los límites de cada bloque, de modo
+    que dia(maquina_id, fecha) es un acceso O(1) que no depende del tamaño del sheet.
+    """
+
+    def __init__(self, df):
+        self.parcial_col = _columna_parcial(df.columns)
+        d = df[df["Fecha"].notna()]
+        fecha_ns = d["Fecha"].to_numpy(dtype="datetime64[ns]")
+        if "Dia Turno" in d.columns:
+            dia_ns = d["Dia Turno"].to_numpy(dtype="datetime64[ns]")
+        else:
+            dia_ns = fecha_ns.astype("datetime64[D]").astype("datetime64[ns]")
+        maquina = d["Id Equipo"].astype("category")
+        codigos = maquina.cat.codes.to_numpy()
+
+        orden = np.lexsort((fecha_ns, dia_ns, codigos))  # estable
+        eventos = {"Fecha": fecha_ns[orden]}
+        if self.parcial_col is not None:
+            parc = pd.to_numeric(d[self.parcial_col], errors="coerce").fillna(0)
+            eventos[self.parcial_col] = parc.to_numpy()[orden]
+        self._eventos = pd.DataFrame(eventos)
+
+        codigos, dia_ns = codigos[orden], dia_ns[orden]
+        cortes = np.flatnonzero((codigos[1:] != codigos[:-1]) | (dia_ns[1:] != dia_ns[:-1])) + 1
+        inicios = np.concatenate([[0], cortes]) if len(orden) else np.array([], dtype=int)
+        finales = np.concatenate([cortes, [len(orden)]]) if len(orden) else np.array([], dtype=int)
+        categorias = maquina.cat.categories
+        dias = pd.to_datetime(dia_ns[inicios]).date
+        self._bloques = {
+            (categorias[codigos[i]], dia): (i, j)
+            for i, j, dia in zip(inicios, finales, dias)
+        }
+
+    def dia(self, maquina_id, fecha):
+        """Eventos (ordenados por Fecha) de una máquina en un día de turno."""
+        i, j = self._bloques.get((maquina_id, fecha), (0, 0))
+        return self._eventos.iloc[i:j]
 
-def _parse_hhmm(s):
-    return datetime.strptime(s, "%H:%M").time()
+    def huella(self, maquina_id, fecha, dias=1):
+        """
+        Hash del contenido de los eventos del día (cambia solo si cambian sus filas).
+        Con dias > 1 incluye también los días siguientes (turnos noche).
+        """
+        h = hashlib.blake2b(digest_size=16)
+        for k in range(dias):
+            for _, col in self.dia(maquina_id, fecha + timedelta(days=k)).items():
+                h.update(np.ascontiguousarray(col.to_numpy()).tobytes())
+        return h.hexdigest()
 
-def _interval_subtract(base_interval, cut_interval):
+    def maquinas(self):
+        return sorted({m for m, _ in self._bloques})
+
+    def fechas(self):
+        return sorted({f for _, f in self._bloques})
+
+    def claves(self):
+        """Todas las combinaciones (máquina, día de turno) con eventos."""
+        return list(self._bloques)
+
+
+# =========================
+# Núcleo vectorizado por turno (compartido por el cálculo diario y el lote)
+# =========================
+def _asignar_turnos(ts, codigo, turno_codigo, turno_ini, turno_fin):
     """
-    Resta un intervalo [c,d) del intervalo [a,b) y devuelve una lista con los remanentes.
-    Si no hay solapamiento, devuelve [a,b). Si hay, recorta.
+    Turno de cada evento (-1 si no cae en ninguno). Eventos ordenados por
+    (codigo, ts) y turnos por (codigo, inicio); los turnos de una máquina no se
+    solapan, así que basta un searchsorted por máquina. Un evento justo en el
+    límite entre dos turnos consecutivos va al que empieza.
     """
-    a, b = base_interval
-    c, d = cut_interval
-    if d <= a or c >= b:
-        return [base_interval]
-    parts = []
-    if c > a:
-        parts.append((a, min(c, b)))
-    if d < b:
-        parts.append((max(d, a), b))
-    return parts
+    turno = np.full(len(ts), -1, dtype="int64")
+    if len(turno_ini) == 0:
+        return turno
+    for c in np.unique(codigo):
+        e0, e1 = np.searchsorted(codigo, [c, c + 1])
+        t0, t1 = np.searchsorted(turno_codigo, [c, c + 1])
+        k = np.searchsorted(turno_ini[t0:t1], ts[e0:e1], side="right") - 1 + t0
+        ok = (k >= t0) & (ts[e0:e1] <= turno_fin[np.clip(k, 0, len(turno_fin) - 1)])
+        turno[e0:e1] = np.where(ok, k, -1)
+    return turno
+
 
-def _merge_small_gaps(intervals, min_minutes=3.0):
+def _gaps_por_turno(ts, turno, parc, tabla, turno_codigo, umbral_minutos):
     """
-    Filtra segmentos menores a min_minutes (NO los une entre sí).
+    Aplica las reglas del reloj a cada turno en una sola pasada: recorte al turno,
+    descarte de timestamps duplicados, filtro Parcial > 0, eventos teóricos en los
+    límites, candidatos >= umbral, resta de pausas y filtro final >= umbral.
+
+    `ts`/`turno` vienen de _asignar_turnos (orden por máquina y tiempo).
+    Devuelve con_eventos y contador por turno, y los segmentos no programados
+    (pa, pb en ns, pt = turno) ordenados por (turno, inicio).
     """
-    return [(a, b) for a, b in intervals if (b - a).total_seconds() / 60.0 >= min_minutes]
+    t_ini, t_fin = tabla["turno_ini"], tabla["turno_fin"]
+    n_turnos = len(t_ini)
+    en_turno = turno >= 0
+    primero = np.ones(len(ts), dtype=bool)
+    primero[1:] = (turno[1:] != turno[:-1]) | (ts[1:] != ts[:-1])
+    keep = en_turno & primero
+    contador = np.zeros(n_turnos)
+    if parc is not None:
+        usado = en_turno & (parc > 0)
+        contador = np.bincount(turno[usado], weights=parc[usado], minlength=n_turnos)
+        keep &= parc > 0
+    ts, t = ts[keep], turno[keep]
+    con_eventos = np.bincount(t, minlength=n_turnos) > 0
+
+    # ---------------- Candidatos de gap (>= umbral) ----------------
+    nuevo = np.ones(len(ts), dtype=bool)
+    nuevo[1:] = t[1:] != t[:-1]
+    ultimo = np.ones(len(ts), dtype=bool)
+    ultimo[:-1] = t[1:] != t[:-1]
+    previo = np.empty_like(ts)
+    previo[1:] = ts[:-1]
+    previo[nuevo] = t_ini[t[nuevo]]
+    a = np.concatenate([previo, ts[ultimo]])
+    b = np.concatenate([ts, t_fin[t[ultimo]]])
+    tt = np.concatenate([t, t[ultimo]])
+    sel = (b - a) / 1e9 / 60.0 >= umbral_minutos
+    a, b, tt = a[sel], b[sel], tt[sel]
+    orden = np.lexsort((a, tt))
+    a, b, tt = a[orden], b[orden], tt[orden]
 
-def _dt_to_angle(dt, start_dt, end_dt):
-    total_min = (end_dt - start_dt).total_seconds() / 60.0
-    if total_min <= 0:
-        return 0.0
-    minutes = (dt - start_dt).total_seconds() / 60.0
-    return 2 * np.pi * (minutes / total_min)
+    # ---------------- Restar pausas programadas (por máquina) ----------------
+    pausa_codigo = turno_codigo[tabla["pausa_turno"]]
+    cand_codigo = turno_codigo[tt]
+    pa, pb, pt = [np.empty(0, dtype="int64")], [np.empty(0, dtype="int64")], [np.empty(0, dtype="int64")]
+    for c in np.unique(cand_codigo):
+        i0, i1 = np.searchsorted(cand_codigo, [c, c + 1])
+        p0, p1 = np.searchsorted(pausa_codigo, [c, c + 1])
+        ra, rb, origen = restar_intervalos(a[i0:i1], b[i0:i1],
+                                           tabla["pausa_ini"][p0:p1], tabla["pausa_fin"][p0:p1])
+        pa.append(ra)
+        pb.append(rb)
+        pt.append(tt[i0:i1][origen])
+    pa, pb, pt = np.concatenate(pa), np.concatenate(pb), np.concatenate(pt)
+    seg = (pb - pa) / 1e9
+    sel = seg / 60.0 >= umbral_minutos
+    return dict(con_eventos=con_eventos, contador=contador,
+                pa=pa[sel], pb=pb[sel], pt=pt[sel], seg=seg[sel])
+
+
+def _inutilizado_por_turno(tabla):
+    """Segundos de pausa programada de cada turno (las pausas ya vienen unidas)."""
+    return np.bincount(tabla["pausa_turno"], weights=(tabla["pausa_fin"] - tabla["pausa_ini"]) / 1e9,
+                       minlength=len(tabla["turno_ini"]))
+
+def _sumar(valores):
+    return float(np.bincount(np.zeros(len(valores), dtype="int64"), weights=valores, minlength=1)[0])
 
 
 # =========================
 # API principal
 # =========================
-def generar_reloj(df, maquina_id, fecha, umbral_minutos=3):
+def calcular_reloj(df, maquina_id, fecha, umbral_minutos=3, calendario=None):
     """
-    Devuelve:
-      - fig: gráfico polar
-      - indicadores: métricas del día
+    Cálculo puro (sin matplotlib) del reloj de una máquina en un día.
+    `df` puede ser el DataFrame normalizado o un IndiceEventos.
+
+    Devuelve un dict con:
+      - indicadores: métricas del día (suma de sus turnos con eventos)
       - lista_gaps: detalle de intervalos de tiempo muerto (>= umbral)
+      - hay_eventos, maquina_id, inicio, fin, pausas, unplanned, turnos: lo
+        necesario para dibujar el reloj con dibujar_reloj
 
-    Reglas:
-      - Turno: Lun–Jue 06:00–16:00, Vie 06:00–15:00
-      - Pausas programadas: 08:00–08:20, 12:00–12:40 y últimos 20 min del turno
-      - Crea eventos teóricos a las 06:00 y al cierre (15:00/16:00)
+    Reglas (por cada turno del día según `calendario`, por defecto el de planta:
+    Lun–Jue 06:00–16:00, Vie 06:00–15:00, pausas 08:00–08:20, 12:00–12:40 y
+    últimos 20 min del turno):
+      - Crea eventos teóricos al inicio y al cierre del turno
       - No marca no planificadas dentro de pausas programadas
       - Ignora eventos fuera del turno (filtro estricto al rango [inicio, fin])
+      - Un turno noche pertenece al día en que empieza
     """
-    # ---------------- Turno por día ----------------
-    weekday = fecha.weekday()  # 0=lunes ... 4=viernes
-    inicio_str = "06:00"
-    fin_str = "16:00" if weekday < 4 else "15:00"
-    inicio_dt = _combine(pd.to_datetime(fecha), _parse_hhmm(inicio_str))
-    fin_dt    = _combine(pd.to_datetime(fecha), _parse_hhmm(fin_str))
-
-    # ---------------- Pausas programadas ----------------
-    desayuno = (_combine(pd.to_datetime(fecha), _parse_hhmm("08:00")),
-                _combine(pd.to_datetime(fecha), _parse_hhmm("08:20")))
-    almuerzo = (_combine(pd.to_datetime(fecha), _parse_hhmm("12:00")),
-                _combine(pd.to_datetime(fecha), _parse_hhmm("12:40")))
-    limpieza = (fin_dt - timedelta(minutes=20), fin_dt)  # últimos 20 min del turno
-    pausas = [("Desayuno", *desayuno), ("Almuerzo", *almuerzo), ("Limpieza", *limpieza)]
+    # ---------------- Turnos y pausas programadas ----------------
+    calendario = calendario or CALENDARIO_POR_DEFECTO
+    resultado = resultado_vacio(maquina_id, fecha, calendario)
+    if not resultado["turnos"]:
+        return resultado
+    inicio_dt, fin_dt = resultado["inicio"], resultado["fin"]
 
     # ---------------- Filtrado y normalización ----------------
-    df_dia = df[(df["Id Equipo"] == maquina_id) & (df["Fecha"].dt.date == fecha)].copy()
+    if isinstance(df, IndiceEventos):
+        dias = pd.date_range(inicio_dt.date(), fin_dt.date()).date
+        df_dia = pd.concat([df.dia(maquina_id, d) for d in dias]) if len(dias) > 1 \
+            else df.dia(maquina_id, fecha)
+        parcial_col = df.parcial_col
+    else:
+        df_dia = df[(df["Id Equipo"] == maquina_id) & (df["Fecha"] >= inicio_dt) & (df["Fecha"] <= fin_dt)]
+        parcial_col = _columna_parcial(df_dia.columns)
     if df_dia.empty:
-        fig, ax = plt.subplots(figsize=(6, 4))
-        ax.axis("off")
-        ax.text(0.5, 0.5, "Sin eventos para la combinación seleccionada",
-                ha="center", va="center")
-        indicadores = dict(total_disponible=0, inutilizado_programado=0, neto=0,
-                           perdido_no_programado=0, porcentaje_perdido=0)
-        return fig, indicadores, []
+        return resultado
+    ts, parc = _eventos_ordenados(df_dia, parcial_col)
 
-    df_dia = df_dia.sort_values("Fecha").reset_index(drop=True)
-    # Preservamos segundos (no usamos .dt.floor("min"))
-    df_dia["Fecha"] = pd.to_datetime(df_dia["Fecha"], errors="coerce")
-    df_dia = df_dia.drop_duplicates(subset=["Fecha"])
-    # 🔒 Filtro ESTRICTO al rango del turno
-    df_dia = df_dia[(df_dia["Fecha"] >= inicio_dt) & (df_dia["Fecha"] <= fin_dt)]
-
-    # ✅ NUEVO: ignorar filas con "Parcial == 0" de forma robusta
-    parcial_col = None
-    for c in df_dia.columns:
-        if "parcial" in str(c).strip().lower():
-            parcial_col = c
-            break
-    if parcial_col is not None:
-        parc = pd.to_numeric(df_dia[parcial_col], errors="coerce").fillna(0)
-        df_dia = df_dia[parc > 0]
+    # 🔒 Filtro ESTRICTO al rango de cada turno
+    tabla = tabla_del_dia(calendario, maquina_id, fecha)
+    turno_codigo = np.zeros(len(tabla["turno_ini"]), dtype="int64")
+    turno = _asignar_turnos(ts, np.zeros(len(ts), dtype="int64"), turno_codigo,
+                            tabla["turno_ini"], tabla["turno_fin"])
+    r = _gaps_por_turno(ts, turno, parc, tabla, turno_codigo, umbral_minutos)
+    # 🔢 Contador total utilizado (Parcial > 0): mismo recorte, incluye duplicados
+    resultado["contador_total"] = float(r["contador"].sum())
 
     # Si luego del filtro no quedan eventos, devolver estado controlado
-    if df_dia.empty:
-        fig, ax = plt.subplots(figsize=(6, 4))
-        ax.axis("off")
-        ax.text(0.5, 0.5, "Sin eventos para la combinación seleccionada",
-                ha="center", va="center")
-        indicadores = dict(total_disponible=0, inutilizado_programado=0, neto=0,
-                           perdido_no_programado=0, porcentaje_perdido=0)
-        return fig, indicadores, []
+    if not r["con_eventos"].any():
+        return resultado
+    return completar_resultado(resultado, tabla, r["con_eventos"], r["pa"], r["pb"], r["seg"])
+
+
+def resultado_vacio(maquina_id, fecha, calendario=None):
+    """Resultado de calcular_reloj para un día sin eventos (con sus turnos y pausas)."""
+    turnos = (calendario or CALENDARIO_POR_DEFECTO).turnos(fecha, maquina_id)
+    if turnos:
+        inicio_dt, fin_dt = turnos[0]["inicio"], max(t["fin"] for t in turnos)
+    else:  # feriado o día sin turnos
+        inicio_dt = fin_dt = pd.Timestamp(fecha).to_pydatetime()
+    return dict(
+        hay_eventos=False, maquina_id=maquina_id, inicio=inicio_dt, fin=fin_dt, turnos=turnos,
+        pausas=[p for t in turnos for p in t["pausas"]], unplanned=[], lista_gaps=[], contador_total=0.0,
+        indicadores=dict(total_disponible=0, inutilizado_programado=0, neto=0,
+                         perdido_no_programado=0, porcentaje_perdido=0),
+    )
+
+
+def tabla_del_dia(calendario, maquina_id, fecha):
+    """Turnos y pausas (ns) de una máquina en una fecha, ver CalendarioTurnos.tabla."""
+    return calendario.tabla([maquina_id], [pd.Timestamp(fecha).value // NS_DIA])
+
+
+def _eventos_ordenados(df_dia, parcial_col):
+    """Fecha (ns) y Parcial numérico de las filas válidas, en orden estable por Fecha."""
+    # Orden estable: ante timestamps duplicados se conserva la primera fila del sheet
+    # Preservamos segundos (no usamos .dt.floor("min"))
+    fecha_col = pd.to_datetime(df_dia["Fecha"], errors="coerce")
+    validos = fecha_col.notna().to_numpy()
+    ts = fecha_col.to_numpy(dtype="datetime64[ns]").view("int64")[validos]
+    orden = np.argsort(ts, kind="stable")
+    parc = None
+    if parcial_col is not None:
+        parc = pd.to_numeric(df_dia[parcial_col], errors="coerce").fillna(0).to_numpy()[validos][orden]
+    return ts[orden], parc
 
-    # ---------------- Candidatos de gap (>= umbral) ----------------
-    eventos = [inicio_dt] + list(df_dia["Fecha"]) + [fin_dt]
-    candidatos = []
-    for i in range(len(eventos) - 1):
-        a, b = eventos[i], eventos[i + 1]
-        if (b - a).total_seconds() / 60.0 >= umbral_minutos:
-            candidatos.append((a, b))
-
-    # ---------------- Restar pausas programadas ----------------
-    unplanned = candidatos[:]
-    for _, ps, pe in pausas:
-        nuevos = []
-        for seg in unplanned:
-            nuevos.extend(_interval_subtract(seg, (ps, pe)))
-        unplanned = nuevos
-
-    # Filtramos gaps chicos (no unimos contiguos)
-    unplanned = _merge_small_gaps(unplanned, min_minutes=umbral_minutos)
 
+def completar_resultado(resultado, tabla, con_eventos, pa, pb, seg):
+    """
+    Completa indicadores, lista_gaps y unplanned de un resultado a partir de los
+    segmentos no programados del día (pa, pb en ns; seg en segundos; en orden).
+    """
     # ---------------- Indicadores ----------------
-    total_disponible = (fin_dt - inicio_dt).total_seconds() / 60.0
-    inutilizado_programado = sum((pe - ps).total_seconds() for _, ps, pe in pausas) / 60.0
+    # Misma suma secuencial que el lote (bincount), para obtener valores idénticos
+    total_disponible = _sumar((tabla["turno_fin"] - tabla["turno_ini"])[con_eventos] / 1e9) / 60.0
+    inutilizado_programado = _sumar(_inutilizado_por_turno(tabla)[con_eventos]) / 60.0
     neto = total_disponible - inutilizado_programado
-    perdido_no_programado = sum((b - a).total_seconds() for a, b in unplanned) / 60.0
+    perdido_no_programado = _sumar(seg) / 60.0
     porcentaje_perdido = (perdido_no_programado / neto * 100.0) if neto > 0 else 0.0
 
-    indicadores = dict(
+    resultado["indicadores"] = dict(
         total_disponible=total_disponible,
         inutilizado_programado=inutilizado_programado,
         neto=neto,
@@ -148,57 +290,449 @@ def generar_reloj(df, maquina_id, fecha, umbral_minutos=3):
     )
 
     # ---------------- Listado detallado ----------------
-    lista_gaps = [
+    unplanned = list(zip(pd.to_datetime(pa), pd.to_datetime(pb)))
+    resultado["lista_gaps"] = [
         dict(
             Inicio=a.strftime("%H:%M:%S"),
             Fin=b.strftime("%H:%M:%S"),
-            Duracion_min=(b - a).total_seconds() / 60.0,
+            Duracion_min=s / 60.0,
         )
-        for a, b in unplanned
+        for (a, b), s in zip(unplanned, seg.tolist())
     ]
+    resultado["unplanned"] = unplanned
+    resultado["hay_eventos"] = True
+    return resultado
 
-    # ---------------- Gráfico polar ----------------
-    fig = plt.figure(figsize=(6, 4.5), facecolor="white")  # ÚNICO cambio solicitado en su momento: tamaño
-    ax = plt.subplot(111, polar=True)
+
+def _ejes_polares(fig, posicion=111):
+    """Ejes polares del reloj: sentido horario, inicio del turno arriba, sin ticks."""
+    ax = fig.add_subplot(posicion, polar=True)
     ax.set_theta_direction(-1)
     ax.set_theta_offset(np.pi / 2)
     ax.spines["polar"].set_linewidth(3)
     ax.set_yticklabels([])
     ax.set_xticklabels([])
+    return ax
 
-    # Pausas programadas (azul)
-    for nombre, ps, pe in pausas:
-        ang0 = _dt_to_angle(ps, inicio_dt, fin_dt)
-        ang1 = _dt_to_angle(pe, inicio_dt, fin_dt)
-        if ang1 > ang0:
-            ax.barh(1.0, width=ang1 - ang0, left=ang0, height=0.10,
-                    color="royalblue", alpha=0.8, edgecolor="black", linewidth=0.5)
-            ax.text(ang0 + (ang1 - ang0) / 2, 1.12, nombre,
-                    ha="center", va="center", fontsize=9)
-
-    # No programadas (rojo)
-    for a, b in unplanned:
-        ang0 = _dt_to_angle(a, inicio_dt, fin_dt)
-        ang1 = _dt_to_angle(b, inicio_dt, fin_dt)
+
+def _angulos(instantes, inicio_dt, fin_dt):
+    """Ángulo (radianes, 0 = inicio del turno) de cada instante dentro de [inicio, fin]."""
+    t = np.asarray(instantes, dtype="datetime64[ns]").view("int64")
+    ini, fin = pd.Timestamp(inicio_dt).value, pd.Timestamp(fin_dt).value
+    if fin <= ini:
+        return np.zeros(len(t))
+    return 2 * np.pi * (t - ini) / (fin - ini)
+
+
+# Puntos por arco de cada sector: los vértices se unen con rectas en pantalla
+_PUNTOS_ARCO = 32
+
+
+def _capa(tramos, inicio_dt, fin_dt, radio, alto, color, alpha=1.0, borde="none", grosor=0.0):
+    """
+    Sectores circulares [desde, hasta] × [radio ± alto/2] de una capa del reloj.
+    `color` puede ser un color o uno por tramo. Devuelve (vértices, caras, bordes,
+    grosores) para _dibujar_capas; los tramos vacíos se descartan.
+    """
+    from matplotlib.colors import to_rgba_array
+
+    tramos = list(tramos)
+    ang0 = _angulos([a for a, _ in tramos], inicio_dt, fin_dt)
+    ang1 = _angulos([b for _, b in tramos], inicio_dt, fin_dt)
+    sel = ang1 > ang0
+    n = int(sel.sum())
+    s = np.linspace(0.0, 1.0, _PUNTOS_ARCO)
+    theta = ang0[sel, None] + (ang1 - ang0)[sel, None] * s
+    # Arco exterior de ida y arco interior de vuelta
+    vertices = np.empty((n, 2 * _PUNTOS_ARCO, 2))
+    vertices[:, :_PUNTOS_ARCO, 0] = theta
+    vertices[:, :_PUNTOS_ARCO, 1] = radio + alto / 2
+    vertices[:, _PUNTOS_ARCO:, 0] = theta[:, ::-1]
+    vertices[:, _PUNTOS_ARCO:, 1] = radio - alto / 2
+    caras = to_rgba_array(color, alpha)
+    caras = caras[sel] if len(caras) == len(sel) > 1 else np.repeat(caras, n, axis=0)
+    bordes = np.repeat(to_rgba_array(borde, alpha if borde != "none" else None), n, axis=0)
+    return vertices, caras, bordes, np.full(n, grosor)
+
+
+def _dibujar_capas(ax, capas):
+    """Todas las capas (en orden: la última queda arriba) como un único PolyCollection."""
+    from matplotlib.collections import PolyCollection
+
+    vertices, caras, bordes, grosores = (np.concatenate(x) for x in zip(*capas))
+    ax.add_collection(PolyCollection(vertices, closed=True, facecolors=caras,
+                                     edgecolors=bordes, linewidths=grosores), autolim=False)
+
+
+def _radiales(inicio_dt, fin_dt, radio):
+    """Horas en punto de [inicio, fin] y sus radiales como segmentos (theta, r) desde el centro."""
+    horas = pd.date_range(pd.Timestamp(inicio_dt).ceil("h"), pd.Timestamp(fin_dt), freq="h")
+    ang = _angulos(horas, inicio_dt, fin_dt)
+    segmentos = np.zeros((len(ang), 2, 2))
+    segmentos[:, :, 0] = ang[:, None]
+    segmentos[:, 1, 1] = radio
+    return horas, segmentos
+
+
+def _radiales_hora(ax, inicio_dt, fin_dt, radio=1.1, pad=8, fontsize=10):
+    """Radiales de cada hora (un LineCollection) con su etiqueta como tick del eje angular."""
+    from matplotlib.collections import LineCollection
+
+    horas, segmentos = _radiales(inicio_dt, fin_dt, radio)
+    ax.add_collection(LineCollection(segmentos, colors="#888888", linewidths=1), autolim=False)
+    ax.xaxis.grid(False)
+    ax.set_xticks(segmentos[:, 0, 0], labels=horas.strftime("%H:%M:%S"), fontsize=fontsize, fontweight="bold")
+    ax.tick_params(axis="x", pad=pad)
+
+
+def dibujar_reloj(resultado):
+    """
+    Dibuja el gráfico polar a partir del resultado de calcular_reloj.
+    Usa la API orientada a objetos (Figure), sin estado global de pyplot: la
+    figura se libera sola cuando deja de referenciarse. matplotlib se importa
+    recién acá, así el cálculo no depende de él.
+    """
+    from matplotlib.figure import Figure
+
+    if not resultado["hay_eventos"]:
+        fig = Figure(figsize=(6, 4))
+        ax = fig.add_subplot(111)
+        ax.axis("off")
+        ax.text(0.5, 0.5, "Sin eventos para la combinación seleccionada",
+                ha="center", va="center")
+        return fig
+
+    inicio_dt, fin_dt = resultado["inicio"], resultado["fin"]
+
+    # ---------------- Gráfico polar ----------------
+    fig = Figure(figsize=(6, 4.5), facecolor="white")  # ÚNICO cambio solicitado en su momento: tamaño
+    ax = _ejes_polares(fig)
+
+    # Pausas programadas (azul) y no programadas (rojo): una sola colección
+    _dibujar_capas(ax, [
+        _capa([(ps, pe) for _, ps, pe in resultado["pausas"]], inicio_dt, fin_dt, 1.0, 0.10,
+              "royalblue", alpha=0.8, borde="black", grosor=0.5),
+        _capa(resultado["unplanned"], inicio_dt, fin_dt, 1.0, 0.10,
+              "red", alpha=0.85, borde="black", grosor=0.8),
+    ])
+    for nombre, ps, pe in resultado["pausas"]:
+        ang0, ang1 = _angulos([ps, pe], inicio_dt, fin_dt)
         if ang1 > ang0:
-            ax.barh(1.0, width=ang1 - ang0, left=ang0, height=0.10,
-                    color="red", alpha=0.85, edgecolor="black", linewidth=0.8)
-
-    # Radiales de hora
-    h = inicio_dt.replace(minute=0, second=0)
-    if h < inicio_dt:
-        h += timedelta(hours=1)
-    while h <= fin_dt:
-        ang = _dt_to_angle(h, inicio_dt, fin_dt)
-        ax.plot([ang, ang], [0, 1.1], color="#888888", linewidth=1)
-        ax.text(ang, 1.35, h.strftime("%H:%M:%S"), ha="center",
-                va="center", fontsize=10, fontweight="bold", color="black")
-        h += timedelta(hours=1)
+            ax.text(ang0 + (ang1 - ang0) / 2, 1.12, nombre, ha="center", va="center", fontsize=9)
+
+    _radiales_hora(ax, inicio_dt, fin_dt)
+    ax.set_ylim(0, 1.155)
 
     # Título
     ax.set_title(
-        f"Reloj Circular de Tiempos Muertos – Máquina {maquina_id} – {inicio_dt.date()}",
+        f"Reloj Circular de Tiempos Muertos – Máquina {resultado['maquina_id']} – {inicio_dt.date()}",
         va="bottom", fontsize=13, fontweight="bold"
     )
 
-    return fig, indicadores, lista_gaps
+    return fig
+
+
+def _a_plano(theta_r, cx, cy, escala):
+    """(theta, r) del reloj (horario, inicio arriba) -> (x, y) en un círculo centrado en (cx, cy)."""
+    theta, r = theta_r[..., 0], theta_r[..., 1] * escala
+    return np.stack([cx + r * np.sin(theta), cy + r * np.cos(theta)], axis=-1)
+
+
+def _titulo_celda(titulo, lado, fontsize=7):
+    """
+    Título de una celda de la grilla en líneas que entren en su ancho: 'nombre –
+    fecha' se parte en dos líneas (nombre, fecha) y cada línea larga se recorta con '…'.
+    """
+    max_chars = max(4, int(lado * 72 / (0.62 * fontsize)))  # ancho medio de un carácter en negrita
+    lineas = [parte.strip() for parte in str(titulo).split(" – ")]
+    return "\n".join(l if len(l) <= max_chars else l[:max_chars - 1].rstrip() + "…" for l in lineas)
+
+def dibujar_relojes_grilla(resultados, titulos=None, columnas=7, lado=1.6):
+    """
+    Varios relojes (resultados de calcular_reloj, p. ej. máquinas × días) en una
+    sola figura de `columnas` columnas: un render en lugar de uno por reloj.
+
+    Todo va en un único eje cartesiano: los sectores de todos los relojes en un
+    PolyCollection y contornos + radiales en un LineCollection (los ejes polares
+    por celda costarían casi lo mismo que una figura por reloj). Sin etiquetas
+    horarias: cada celda indica el rango del turno bajo el título.
+    Las celdas None quedan en blanco (sirve para empezar cada máquina en una fila).
+    `titulos`: uno por celda (por defecto 'Id Equipo – fecha'); se muestran en
+    dos líneas y recortados al ancho de la celda (ver _titulo_celda).
+    """
+    from matplotlib.collections import LineCollection, PolyCollection
+    from matplotlib.figure import Figure
+
+    n = len(resultados)
+    columnas = max(1, min(columnas, n))
+    filas = max(1, -(-n // columnas))
+    alto_celda = 1.3  # el reloj ocupa la parte de abajo; arriba va el título
+    fig = Figure(figsize=(lado * columnas, lado * alto_celda * filas), facecolor="white")
+    ax = fig.add_axes((0, 0, 1, 1))
+    ax.axis("off")
+    ax.set_xlim(0, columnas)
+    ax.set_ylim(-filas * alto_celda, 0)
+    ax.set_aspect("equal")
+
+    escala = 0.42 / 1.155  # mismo radio relativo que dibujar_reloj
+    contorno = np.stack([np.linspace(0, 2 * np.pi, 4 * _PUNTOS_ARCO), np.full(4 * _PUNTOS_ARCO, 1.155)], axis=1)
+    capas, lineas = [], []
+    for i, r in enumerate(resultados):
+        if r is None:
+            continue
+        cx = i % columnas + 0.5
+        cy = -(i // columnas) * alto_celda - alto_celda + 0.5
+        titulo = _titulo_celda(titulos[i] if titulos else f"{r['maquina_id']} – {r['inicio'].date()}", lado)
+        if not r["hay_eventos"]:
+            ax.text(cx, cy + 0.5, titulo, ha="center", va="bottom", fontsize=7, fontweight="bold",
+                    linespacing=1.1)
+            ax.text(cx, cy, "Sin eventos", ha="center", va="center", fontsize=6, color="#888888")
+            continue
+        inicio_dt, fin_dt = r["inicio"], r["fin"]
+        ax.text(cx, cy + 0.5, f"{titulo}\n{inicio_dt:%H:%M}–{fin_dt:%H:%M}",
+                ha="center", va="bottom", fontsize=7, fontweight="bold", linespacing=1.1)
+        for vertices, caras, bordes, grosores in (
+            _capa([(ps, pe) for _, ps, pe in r["pausas"]], inicio_dt, fin_dt, 1.0, 0.10,
+                  "royalblue", alpha=0.8),
+            _capa(r["unplanned"], inicio_dt, fin_dt, 1.0, 0.10,
+                  "red", alpha=0.85, borde="black", grosor=0.2),
+        ):
+            capas.append((_a_plano(vertices, cx, cy, escala), caras, bordes, grosores))
+        _, radiales = _radiales(inicio_dt, fin_dt, 1.1)
+        lineas.extend(_a_plano(radiales, cx, cy, escala))
+        lineas.append(_a_plano(contorno, cx, cy, escala))
+
+    if lineas:
+        ax.add_collection(LineCollection(lineas, colors="#888888", linewidths=0.5), autolim=False)
+    if capas:
+        vertices, caras, bordes, grosores = (np.concatenate(x) for x in zip(*capas))
+        ax.add_collection(PolyCollection(vertices, closed=True, facecolors=caras,
+                                         edgecolors=bordes, linewidths=grosores), autolim=False)
+    return fig
+
+
+def dibujar_reloj_multiple(resultados, simultaneas=None, nombres=None):
+    """
+    Reloj de línea: un anillo por máquina (resultados de calcular_reloj del mismo
+    día, de adentro hacia afuera) sobre la misma escala horaria que dibujar_reloj,
+    y un anillo exterior con la cantidad de máquinas paradas a la vez.
+
+    `simultaneas`: [(desde, hasta, cantidad), ...] (ver simultaneidad.perfil_dia).
+    `nombres`: etiquetas de cada anillo (por defecto el Id Equipo).
+    """
+    from matplotlib import colormaps
+    from matplotlib.figure import Figure
+
+    con_eventos = [r for r in resultados if r["hay_eventos"]]
+    if not con_eventos:
+        return dibujar_reloj(resultados[0] if resultados else dict(hay_eventos=False))
+    inicio_dt = min(r["inicio"] for r in con_eventos)
+    fin_dt = max(r["fin"] for r in con_eventos)
+    nombres = nombres or [r["maquina_id"] for r in resultados]
+
+    fig = Figure(figsize=(7, 6), facecolor="white")
+    ax = _ejes_polares(fig)
+    n = len(resultados)
+    paso = 0.8 / n
+    alto = paso * 0.8
+
+    # Un anillo por máquina: fondo, pausas (azul) y no programadas (rojo)
+    capas = []
+    for i, (r, nombre) in enumerate(zip(resultados, nombres)):
+        radio = 0.3 + i * paso
+        capas.append(_capa([(inicio_dt, fin_dt)], inicio_dt, fin_dt, radio, alto, "#f2f2f2"))
+        capas.append(_capa([(ps, pe) for _, ps, pe in r["pausas"]], inicio_dt, fin_dt, radio, alto,
+                           "royalblue", alpha=0.8))
+        capas.append(_capa(r["unplanned"], inicio_dt, fin_dt, radio, alto,
+                           "red", alpha=0.85, borde="black", grosor=0.3))
+        ax.text(-0.05, radio, str(nombre), ha="right", va="center", fontsize=7,
+                bbox=dict(facecolor="white", alpha=0.7, edgecolor="none", pad=1))
+
+    # Anillo exterior: máquinas paradas a la vez (más oscuro = más máquinas)
+    radio_ext = 0.3 + n * paso + 0.05
+    simultaneas = list(simultaneas or [])
+    cantidad = np.array([c for _, _, c in simultaneas], dtype=float)
+    capas.append(_capa([(a, b) for a, b, _ in simultaneas], inicio_dt, fin_dt, radio_ext, 0.08,
+                       colormaps["Reds"](0.3 + 0.7 * cantidad / n)))
+    _dibujar_capas(ax, capas)
+
+    _radiales_hora(ax, inicio_dt, fin_dt, radio=radio_ext + 0.05, pad=14, fontsize=8)
+    ax.set_ylim(0, radio_ext + 0.1)
+    ax.set_title(f"Paradas simultáneas – {len(resultados)} máquinas – {inicio_dt.date()}",
+                 va="bottom", fontsize=12, fontweight="bold")
+    return fig
+
+
+def generar_reloj(df, maquina_id, fecha, umbral_minutos=3):
+    """
+    Devuelve:
+      - fig: gráfico polar
+      - indicadores: métricas del día
+      - lista_gaps: detalle de intervalos de tiempo muerto (>= umbral)
+
+    Equivale a calcular_reloj + dibujar_reloj (ver reglas en calcular_reloj).
+    """
+    resultado = calcular_reloj(df, maquina_id, fecha, umbral_minutos=umbral_minutos)
+    return dibujar_reloj(resultado), resultado["indicadores"], resultado["lista_gaps"]
+
+
+# =========================
+# Cálculo en lote (todas las máquinas × días)
+# =========================
+_INDICADORES = ["total_disponible", "inutilizado_programado", "neto",
+                "perdido_no_programado", "porcentaje_perdido"]
+
+
+def _segmentos_lote(df, umbral_minutos, calendario=None):
+    """
+    Núcleo vectorizado de calcular_indicadores_lote: grupos (máquina, día de turno),
+    métricas fijas por grupo y los segmentos no programados (pa, pb, pg, seg en segundos).
+    """
+    calendario = calendario or CALENDARIO_POR_DEFECTO
+    parcial_col = _columna_parcial(df.columns)
+    cols = ["Id Equipo", "Fecha"] + ([parcial_col] if parcial_col is not None else [])
+    d = df.loc[df["Fecha"].notna(), cols]
+
+    ts = d["Fecha"].to_numpy(dtype="datetime64[ns]").view("int64")
+    codigos, maquinas = pd.factorize(d["Id Equipo"], sort=True)
+    orden = np.lexsort((ts, codigos))  # estable: igual criterio que calcular_reloj
+    ts, codigos = ts[orden], codigos[orden].astype("int64")
+    dia = ts // NS_DIA
+    parc = None
+    if parcial_col is not None:
+        parc = pd.to_numeric(d[parcial_col], errors="coerce").fillna(0).to_numpy()[orden]
+
+    # ---------------- Turnos de los pares (máquina, día) presentes ----------------
+    # Clave compuesta ordenable (máquina, día); con turnos noche también el día anterior
+    if len(ts):
+        d0 = dia.min() - 1
+        ancho = dia.max() - d0 + 1
+    else:
+        d0, ancho = 0, 1
+    clave = codigos * ancho + (dia - d0)
+    candidatas = [clave, clave - 1] if calendario.cruza_medianoche() else [clave]
+    pares = np.unique(np.concatenate(candidatas))
+    par_codigo, par_dia = pares // ancho, pares % ancho + d0
+    tabla = calendario.tabla(maquinas.take(par_codigo), par_dia)
+    turno_codigo = par_codigo[tabla["turno_par"]]
+
+    turno = _asignar_turnos(ts, codigos, turno_codigo, tabla["turno_ini"], tabla["turno_fin"])
+    r = _gaps_por_turno(ts, turno, parc, tabla, turno_codigo, umbral_minutos)
+
+    # ---------------- Grupos (máquina, día de turno) ----------------
+    # Un evento fuera de todo turno igual genera la fila de su día calendario (en cero)
+    par_evento = np.where(turno >= 0, tabla["turno_par"][np.maximum(turno, 0)],
+                          np.searchsorted(pares, clave))
+    grupos_par = np.unique(par_evento)
+    n_grupos = len(grupos_par)
+    grupos = np.stack([par_codigo[grupos_par], par_dia[grupos_par]], axis=1)
+    grupo_turno = np.searchsorted(grupos_par, tabla["turno_par"])
+    con = r["con_eventos"]
+
+    # ---------------- Indicadores ----------------
+    total_disponible = np.bincount(grupo_turno[con], weights=(tabla["turno_fin"] - tabla["turno_ini"])[con] / 1e9,
+                                   minlength=n_grupos) / 60.0
+    inutilizado = np.bincount(grupo_turno[con], weights=_inutilizado_por_turno(tabla)[con],
+                              minlength=n_grupos) / 60.0
+    neto = total_disponible - inutilizado
+    contador = np.zeros(n_grupos)
+    if parc is not None:
+        contador = np.bincount(grupo_turno[con], weights=r["contador"][con], minlength=n_grupos)
+    return dict(grupos=grupos, maquinas=maquinas, dia_grupo=grupos[:, 1],
+                total_disponible=total_disponible, inutilizado=inutilizado, neto=neto,
+                contador=contador, pa=r["pa"], pb=r["pb"], pg=grupo_turno[r["pt"]], seg=r["seg"])
+
+
+def calcular_indicadores_lote(df, umbral_minutos=3, calendario=None):
+    """
+    Versión vectorizada de generar_reloj para TODAS las combinaciones
+    (Id Equipo, día de turno) presentes en df, en una sola pasada. `calendario`
+    es un CalendarioTurnos (por defecto el de planta); un turno noche cuenta en
+    el día en que empieza.
+
+    Devuelve:
+      - indicadores: DataFrame con columnas 'Id Equipo', 'Fecha' (date), las cinco
+        métricas de generar_reloj (mismos nombres y mismos valores) y
+        'contador_total' (suma de Parcial > 0 dentro del turno).
+      - gaps: DataFrame con 'Id Equipo', 'Fecha', 'Inicio', 'Fin' y 'Duracion_min'
+        (mismo formato que lista_gaps), en orden cronológico por grupo.
+
+    Aplica exactamente las mismas reglas que generar_reloj: recorte estricto al
+    turno, descarte de timestamps duplicados, filtro Parcial > 0, candidatos
+    >= umbral, resta de pausas y filtro final >= umbral.
+    """
+    r = _segmentos_lote(df, umbral_minutos, calendario)
+    grupos, maquinas, neto = r["grupos"], r["maquinas"], r["neto"]
+    pa, pb, pg, seg = r["pa"], r["pb"], r["pg"], r["seg"]
+
+    perdido = np.bincount(pg, weights=seg, minlength=len(grupos)) / 60.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        porcentaje = np.where(neto > 0, perdido / neto * 100.0, 0.0)
+
+    fechas = pd.to_datetime(r["dia_grupo"] * NS_DIA).date
+    indicadores = pd.DataFrame({
+        "Id Equipo": maquinas.take(grupos[:, 0]),
+        "Fecha": fechas,
+        "total_disponible": r["total_disponible"],
+        "inutilizado_programado": r["inutilizado"],
+        "neto": neto,
+        "perdido_no_programado": perdido,
+        "porcentaje_perdido": porcentaje,
+        "contador_total": r["contador"],
+    })
+
+    # ---------------- Listado detallado ----------------
+    gaps = pd.DataFrame({
+        "Id Equipo": maquinas.take(grupos[pg, 0]),
+        "Fecha": fechas[pg],
+        "Inicio": pd.to_datetime(pa).strftime("%H:%M:%S"),
+        "Fin": pd.to_datetime(pb).strftime("%H:%M:%S"),
+        "Duracion_min": seg / 60.0,
+    })
+    return indicadores, gaps
+
+
+# =========================
+# Sensibilidad al umbral
+# =========================
+_SPAN_S = 2 * 24 * 3600.0  # mayor que cualquier segmento de un día (clave compuesta exacta)
+
+
+def sensibilidad_umbral(df, umbrales=range(1, 31), calendario=None):
+    """
+    '% Perdido' y 'perdido_no_programado' para TODOS los umbrales de una vez,
+    por (Id Equipo, día).
+
+    Un segmento (ya restadas las pausas) cuenta con umbral u si dura >= u: como
+    cada segmento está contenido en su gap candidato, el filtro de candidatos
+    queda implícito. Basta calcular los segmentos una vez (umbral 0), ordenarlos
+    por duración y usar sumas acumuladas: el costo no crece con la cantidad de
+    umbrales más allá de un searchsorted.
+
+    Devuelve un DataFrame largo: 'Id Equipo', 'Fecha', 'umbral', 'neto',
+    'perdido_no_programado', 'porcentaje_perdido'.
+    """
+    r = _segmentos_lote(df, 0, calendario)
+    grupos, neto, pg, seg = r["grupos"], r["neto"], r["pg"], r["seg"]
+    umbrales = np.asarray(list(umbrales), dtype=float)
+    n_grupos, n_umbrales = len(grupos), len(umbrales)
+
+    orden = np.lexsort((seg, pg))
+    pg, seg = pg[orden], seg[orden]
+    clave = pg * _SPAN_S + seg
+    acumulado = np.concatenate([[0.0], np.cumsum(seg)])
+    fin_grupo = np.searchsorted(pg, np.arange(n_grupos), side="right")
+    objetivo = np.arange(n_grupos)[:, None] * _SPAN_S + umbrales[None, :] * 60.0
+    desde = np.searchsorted(clave, objetivo.ravel(), side="left").reshape(n_grupos, n_umbrales)
+    perdido = (acumulado[fin_grupo][:, None] - acumulado[desde]) / 60.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        porcentaje = np.where(neto[:, None] > 0, perdido / neto[:, None] * 100.0, 0.0)
+
+    return pd.DataFrame({
+        "Id Equipo": np.repeat(r["maquinas"].take(grupos[:, 0]), n_umbrales),
+        "Fecha": np.repeat(pd.to_datetime(r["dia_grupo"] * NS_DIA).date, n_umbrales),
+        "umbral": np.tile(umbrales, n_grupos),
+        "neto": np.repeat(neto, n_umbrales),
+        "perdido_no_programado": perdido.ravel(),
+        "porcentaje_perdido": porcentaje.ravel(),
+    })
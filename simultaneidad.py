@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+from reloj_circular import _segmentos_lote
+from turnos import NS_DIA
+
+
+# =========================================================
+# Barrido (sweep-line) de intervalos
+# =========================================================
+def barrido(ini, fin, grupo=None):
+    """
+    Cantidad de intervalos [ini, fin) activos en cada momento, por grupo.
+
+    Ordena los 2·n bordes una vez (O(n log n)) y acumula +1 / -1: a igual
+    instante los finales van antes que los inicios, así dos paradas que solo se
+    tocan no cuentan como simultáneas. Devuelve (grupo, desde, hasta, cantidad)
+    de los tramos con cantidad > 0, en orden por grupo y tiempo.
+    """
+    ini, fin = np.asarray(ini, dtype="int64"), np.asarray(fin, dtype="int64")
+    grupo = np.zeros(len(ini), dtype="int64") if grupo is None else np.asarray(grupo, dtype="int64")
+    t = np.concatenate([ini, fin])
+    delta = np.concatenate([np.ones(len(ini), dtype="int64"), -np.ones(len(fin), dtype="int64")])
+    g = np.concatenate([grupo, grupo])
+    orden = np.lexsort((delta, t, g))
+    t, delta, g = t[orden], delta[orden], g[orden]
+    # Cada grupo vuelve a cero, así que un único cumsum sirve para todos
+    cantidad = np.cumsum(delta)
+    sel = (g[:-1] == g[1:]) & (t[1:] > t[:-1]) & (cantidad[:-1] > 0)
+    return g[:-1][sel], t[:-1][sel], t[1:][sel], cantidad[:-1][sel]
+
+
+def tiempo_con_al_menos(grupo, desde, hasta, cantidad, n_grupos, n_max):
+    """Matriz (n_grupos, n_max) con los ns en que hubo al menos N = 1..n_max activos."""
+    por_cantidad = np.zeros((n_grupos, n_max + 1))
+    np.add.at(por_cantidad, (grupo, np.minimum(cantidad, n_max)), (hasta - desde).astype(float))
+    return np.cumsum(por_cantidad[:, ::-1], axis=1)[:, ::-1][:, 1:]
+
+
+def tramos_simultaneos(grupo, desde, hasta, cantidad, minimo=2):
+    """
+    Une los tramos contiguos con al menos `minimo` activos. Devuelve
+    (grupo, desde, hasta, pico) de cada parada simultánea.
+    """
+    sel = cantidad >= minimo
+    grupo, desde, hasta, cantidad = grupo[sel], desde[sel], hasta[sel], cantidad[sel]
+    if len(desde) == 0:
+        return grupo, desde, hasta, cantidad
+    nuevo = np.ones(len(desde), dtype=bool)
+    nuevo[1:] = (grupo[1:] != grupo[:-1]) | (desde[1:] != hasta[:-1])
+    inicios = np.flatnonzero(nuevo)
+    finales = np.concatenate([inicios[1:], [len(desde)]]) - 1
+    return grupo[inicios], desde[inicios], hasta[finales], np.maximum.reduceat(cantidad, inicios)
+
+
+# =========================================================
+# Análisis de línea (varias máquinas por día)
+# =========================================================
+def analizar_linea(df, umbral_minutos=3, calendario=None, minimo=2, top=5):
+    """
+    Paradas no programadas simultáneas de todas las máquinas de `df`, por día.
+
+    Devuelve un dict de DataFrames:
+      - perfil: 'Fecha', 'Desde', 'Hasta', 'Maquinas paradas' (función escalón)
+      - al_menos: 'Fecha', 'N', 'minutos' con al menos N máquinas paradas
+      - mas_largas: las `top` paradas más largas con >= `minimo` máquinas a la
+        vez por día: 'Fecha', 'Desde', 'Hasta', 'Duracion_min', 'Pico', 'Maquinas'
+    """
+    r = _segmentos_lote(df, umbral_minutos, calendario)
+    grupos, maquinas = r["grupos"], r["maquinas"]
+    pa, pb, pg = r["pa"], r["pb"], r["pg"]
+    dias, dia_gap = np.unique(r["dia_grupo"][pg], return_inverse=True)
+    dia_gap = dia_gap.ravel()
+    maquina_gap = np.asarray(maquinas.take(grupos[pg, 0]))
+    fechas = pd.to_datetime(dias * NS_DIA).date
+    n_maquinas = max(len(maquinas), 1)
+
+    g, desde, hasta, cantidad = barrido(pa, pb, dia_gap)
+    perfil = pd.DataFrame({
+        "Fecha": fechas[g],
+        "Desde": pd.to_datetime(desde),
+        "Hasta": pd.to_datetime(hasta),
+        "Maquinas paradas": cantidad,
+    })
+
+    minutos = tiempo_con_al_menos(g, desde, hasta, cantidad, len(dias), n_maquinas) / 1e9 / 60.0
+    al_menos = pd.DataFrame({
+        "Fecha": np.repeat(fechas, n_maquinas),
+        "N": np.tile(np.arange(1, n_maquinas + 1), len(dias)),
+        "minutos": minutos.ravel(),
+    })
+
+    tg, td, th, pico = tramos_simultaneos(g, desde, hasta, cantidad, minimo=minimo)
+    duracion = (th - td) / 1e9 / 60.0
+    orden = np.lexsort((-duracion, tg))
+    rango = np.arange(len(orden)) - np.searchsorted(tg[orden], tg[orden])
+    orden = orden[rango < top]
+    filas = []
+    for k in orden:
+        # Máquinas con alguna parada que se superpone con el tramo
+        en_tramo = (dia_gap == tg[k]) & (pa < th[k]) & (pb > td[k])
+        filas.append({
+            "Fecha": fechas[tg[k]],
+            "Desde": pd.Timestamp(td[k]),
+            "Hasta": pd.Timestamp(th[k]),
+            "Duracion_min": duracion[k],
+            "Pico": int(pico[k]),
+            "Maquinas": ", ".join(sorted(set(map(str, maquina_gap[en_tramo])))),
+        })
+    mas_largas = pd.DataFrame(filas, columns=["Fecha", "Desde", "Hasta", "Duracion_min", "Pico", "Maquinas"])
+    return dict(perfil=perfil, al_menos=al_menos, mas_largas=mas_largas)
+
+
+def perfil_dia(perfil, fecha):
+    """Tramos (desde, hasta, cantidad) de un día, para dibujar_reloj_multiple."""
+    p = perfil[perfil["Fecha"] == fecha]
+    return list(zip(p["Desde"], p["Hasta"], p["Maquinas paradas"]))
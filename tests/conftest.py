@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# Los módulos de la app viven en la raíz del repo (layout plano)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.sintetico import generar_eventos  # noqa: E402
+from datos import normalizar_columnas  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def crudo():
+    """Eventos sintéticos con duplicados, Parcial == 0 y eventos fuera de turno."""
+    return generar_eventos(n_maquinas=3, dias=10, eventos_por_turno=120, frac_parcial_cero=0.15,
+                           frac_duplicados=0.08, frac_fuera_turno=0.1, semilla=7)
+
+@pytest.fixture(scope="session")
+def eventos(crudo):
+    return normalizar_columnas(crudo.copy())
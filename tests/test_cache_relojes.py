@@ -0,0 +1,21 @@
+import os
+import time
+
+from imagenes_reloj import CacheRelojes
+
+
+def test_cache_en_disco_poda_por_mtime(tmp_path):
+    cache = CacheRelojes(max_bytes=1000, directorio=str(tmp_path), max_bytes_disco=2500)
+    for i in range(3):
+        cache.put(("m", i), bytes([i]) * 1000)
+        time.sleep(0.01)
+    # Solo entran dos imágenes en disco: se borró la de mtime más viejo
+    assert len(os.listdir(tmp_path)) == 2
+    assert ("m", 0) not in cache
+
+    # Una lectura desde disco renueva el mtime: la que se poda es la otra
+    otra = CacheRelojes(max_bytes=1000, directorio=str(tmp_path), max_bytes_disco=2500)
+    assert otra.get(("m", 1)) == bytes([1]) * 1000
+    time.sleep(0.01)
+    otra.put(("m", 3), b"\x03" * 1000)
+    assert ("m", 1) in otra and ("m", 2) not in otra
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from datos import _a_tabla_arrow, compactar_eventos, snapshot_a_pandas
+from reloj_circular import calcular_indicadores_lote
+
+
+def test_compactar_tipos(eventos):
+    compacto, informe = compactar_eventos(eventos.assign(Planta="Norte"))
+    assert compacto["Fecha"].dtype == "datetime64[s]"
+    assert compacto["Id Equipo"].dtype == "category"
+    assert compacto["Planta"].dtype == "category"
+    assert np.issubdtype(compacto["Parcial"].dtype, np.integer)
+    assert compacto["Parcial"].dtype.itemsize < eventos["Parcial"].dtype.itemsize
+    assert informe["filas"] == len(eventos)
+    assert informe["bytes_despues"] < informe["bytes_antes"]
+    assert "Dia Turno" in informe["columnas_descartadas"]
+
+def test_compactar_parcial_con_decimales_y_vacios(eventos):
+    d = eventos.head(4).assign(Parcial=[1.5, np.nan, 2.0, 0.0])
+    d.loc[d.index[3], "Fecha"] = pd.NaT
+    compacto, _ = compactar_eventos(d)
+    # Con decimales no se pasa a entero; NaN -> 0 y las filas sin Fecha se descartan
+    assert compacto["Parcial"].tolist() == [1.5, 0.0, 2.0]
+
+def test_compactar_ida_y_vuelta(eventos):
+    compacto, _ = compactar_eventos(eventos)
+    pd.testing.assert_series_equal(compacto["Fecha"].astype("datetime64[ns]"),
+                                   eventos["Fecha"].reset_index(drop=True))
+    assert compacto["Id Equipo"].astype(str).tolist() == eventos["Id Equipo"].astype(str).tolist()
+    assert (compacto["Parcial"].to_numpy() == eventos["Parcial"].to_numpy()).all()
+
+    # Pasa por el snapshot Arrow sin perder los tipos compactos
+    leido = snapshot_a_pandas(_a_tabla_arrow(compacto))
+    assert leido["Id Equipo"].dtype == "category"
+    pd.testing.assert_frame_equal(leido.astype({"Fecha": "datetime64[s]"}), compacto,
+                                  check_categorical=False)
+
+    # Y el motor da lo mismo con la versión compacta
+    pd.testing.assert_frame_equal(calcular_indicadores_lote(compacto, 3)[0],
+                                  calcular_indicadores_lote(eventos, 3)[0], check_categorical=False)
@@ -0,0 +1,92 @@
+import os
+
+import pandas as pd
+import pytest
+
+from cubo_kpis import (SUMABLES, _reescribir_fechas, actualizar_cubo, fechas_en_cubo, leer_cubo,
+                       leer_tendencia, resumir_periodos)
+from reloj_circular import calcular_indicadores_lote
+
+
+def test_cubo_igual_al_lote_y_cobertura_por_maquina(eventos, tmp_path):
+    ruta = str(tmp_path / "cubo")
+    maquinas = list(eventos["Id Equipo"].cat.categories)
+    procesadas, otra = maquinas[:-1], maquinas[-1]
+    actualizar_cubo(eventos, ruta, umbrales=[3], maquinas_ids=procesadas)
+    fechas = fechas_en_cubo(ruta, 3)
+
+    ind, cubiertas = leer_cubo(ruta, 3, maquinas, fechas)
+    # La última fecha puede estar incompleta: no cuenta como cubierta
+    assert {f for _, f in cubiertas} == set(fechas[:-1])
+    # Una máquina que la CLI no procesó no queda cubierta (hay que calcularla en vivo)
+    assert not any(m == otra for m, _ in cubiertas)
+
+    esperado, _ = calcular_indicadores_lote(eventos, 3)
+    esperado = esperado[esperado["Id Equipo"].isin(procesadas) & esperado["Fecha"].isin(fechas[:-1])]
+    columnas = list(esperado.columns)
+    ordenar = lambda df: (df[columnas].astype({"Id Equipo": str}).sort_values(["Id Equipo", "Fecha"])
+                          .reset_index(drop=True))
+    pd.testing.assert_frame_equal(ordenar(ind), ordenar(esperado), check_dtype=False)
+
+def test_cubo_conserva_maquinas_de_otra_corrida(eventos, tmp_path):
+    # La app procesa todas las máquinas y la CLI solo las mapeadas: ninguna
+    # corrida debe borrar las filas que escribió la otra
+    ruta = str(tmp_path / "cubo")
+    maquinas = [str(m) for m in eventos["Id Equipo"].cat.categories]
+    actualizar_cubo(eventos, ruta, umbrales=[3])
+    actualizar_cubo(eventos, ruta, umbrales=[3], maquinas_ids=maquinas[:-1], completo=True)
+    fechas = fechas_en_cubo(ruta, 3)
+
+    esperado, esperado_gaps = calcular_indicadores_lote(eventos, 3)
+    ind, cubiertas = leer_cubo(ruta, 3, fechas=fechas)
+    assert {m for m, _ in cubiertas} == set(maquinas)
+    assert len(ind) == int(esperado["Fecha"].isin(fechas[:-1]).sum())
+    gaps, _ = leer_cubo(ruta, 3, fechas=fechas, tabla="gaps")
+    assert len(gaps) == int(esperado_gaps["Fecha"].isin(fechas[:-1]).sum())
+
+def test_cubo_borra_gaps_de_fechas_sin_gaps(eventos, tmp_path):
+    ruta = str(tmp_path / "cubo")
+    actualizar_cubo(eventos, ruta, umbrales=[3])
+    fecha = fechas_en_cubo(ruta, 3)[0]
+    base = os.path.join(ruta, "gaps")
+    assert os.path.isdir(os.path.join(base, "umbral=3", f"fecha={fecha}"))
+
+    # Una fecha recalculada que ya no tiene gaps no conserva la partición vieja
+    maquinas = {str(m) for m in eventos["Id Equipo"].cat.categories}
+    _reescribir_fechas(pd.DataFrame(), base, 3, [fecha], maquinas)
+    assert not os.path.exists(os.path.join(base, "umbral=3", f"fecha={fecha}"))
+
+@pytest.mark.parametrize("granularidad,frecuencia", [("semana", "W-SUN"), ("mes", "M")])
+def test_resumir_periodos_igual_a_groupby(eventos, granularidad, frecuencia):
+    ind, _ = calcular_indicadores_lote(eventos, 3)
+    obtenido = resumir_periodos(ind, granularidad)
+
+    d = ind.assign(**{"Id Equipo": ind["Id Equipo"].astype(str),
+                      "Periodo": pd.to_datetime(ind["Fecha"]).dt.to_period(frecuencia).dt.start_time.dt.date,
+                      "dias": (ind["neto"] > 0).astype("int64")})
+    esperado = d.groupby(["Id Equipo", "Periodo"])[["dias"] + SUMABLES].sum().reset_index()
+    esperado["porcentaje_perdido"] = esperado["perdido_no_programado"] / esperado["neto"] * 100.0
+    pd.testing.assert_frame_equal(obtenido, esperado[obtenido.columns], check_dtype=False)
+
+def test_leer_tendencia_igual_a_groupby(eventos, tmp_path):
+    ruta = str(tmp_path / "cubo")
+    actualizar_cubo(eventos, ruta, umbrales=[3])
+    ind, _ = calcular_indicadores_lote(eventos, 3)
+    d = ind.assign(**{"Id Equipo": ind["Id Equipo"].astype(str),
+                      "Periodo": pd.to_datetime(ind["Fecha"]).dt.to_period("W-SUN").dt.start_time.dt.date})
+    semanas = d.groupby(["Id Equipo", "Periodo"])[SUMABLES].sum().reset_index()
+    por_maquina = semanas.groupby("Id Equipo")
+    semanas["porcentaje_perdido_movil"] = (
+        por_maquina["perdido_no_programado"].transform(lambda s: s.rolling(2, min_periods=1).sum())
+        / por_maquina["neto"].transform(lambda s: s.rolling(2, min_periods=1).sum()) * 100.0)
+
+    tendencia = leer_tendencia(ruta, 3, "semana", ventana=2)
+    columnas = ["Id Equipo", "Periodo"] + SUMABLES + ["porcentaje_perdido_movil"]
+    pd.testing.assert_frame_equal(tendencia[columnas], semanas[columnas], check_dtype=False)
+
+    # `desde` recorta los períodos pero la media móvil sigue usando los anteriores
+    ultima = semanas["Periodo"].max()
+    recortada = leer_tendencia(ruta, 3, "semana", desde=ultima, ventana=2)
+    pd.testing.assert_frame_equal(recortada[columnas],
+                                  semanas[semanas["Periodo"] == ultima][columnas].reset_index(drop=True),
+                                  check_dtype=False)
@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _correr(codigo, **env):
+    return subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True,
+                          env={**os.environ, **env}, check=True)
+
+
+def test_variable_de_entorno_emite_json_sin_activar():
+    # Como en cron: nadie llama a activar() ni configura logging
+    r = _correr("import diagnostico\nwith diagnostico.etapa('descarga', filas=3): pass",
+                RELOJ_DIAGNOSTICO="1")
+    registro = json.loads(r.stderr.strip().splitlines()[-1])
+    assert registro["etapa"] == "descarga" and registro["filas"] == 3
+
+def test_variable_de_entorno_con_logging_ya_configurado():
+    r = _correr("import logging\nlogging.basicConfig(level=logging.WARNING, format='%(message)s')\n"
+                "import diagnostico\nwith diagnostico.etapa('parse'): pass",
+                RELOJ_DIAGNOSTICO="1")
+    assert json.loads(r.stderr.strip().splitlines()[-1])["etapa"] == "parse"
+
+def test_apagado_no_emite():
+    r = _correr("import diagnostico\nwith diagnostico.etapa('descarga'): pass", RELOJ_DIAGNOSTICO="")
+    assert r.stderr == ""
+
+def test_hilo_en_segundo_plano_va_al_buffer_del_proceso():
+    import threading
+
+    import diagnostico
+
+    def trabajo():
+        with diagnostico.etapa("descarga", filas=5):
+            pass
+
+    diagnostico.activar(True)
+    try:
+        hilo = threading.Thread(target=diagnostico.en_segundo_plano(trabajo, "snapshot"))
+        hilo.start()
+        hilo.join()
+        # No aparece en las etapas de esta corrida, sí en las del proceso
+        assert diagnostico.etapas() == []
+        registro = diagnostico.etapas_fondo()[-1]
+        assert registro["etapa"] == "descarga" and registro["origen"] == "snapshot" and registro["filas"] == 5
+    finally:
+        diagnostico.activar(False)
+
+def test_workers_del_pool_devuelven_sus_etapas(eventos):
+    import diagnostico
+    from imagenes_reloj import crear_pool_render, renderizar_relojes
+    from reloj_circular import calcular_reloj
+
+    m = eventos["Id Equipo"].cat.categories[0]
+    resultados = [calcular_reloj(eventos, m, f, 3) for f in sorted(eventos["Fecha"].dt.date.unique())[:2]]
+    diagnostico.activar(True)
+    pool = crear_pool_render(2)
+    try:
+        imagenes = renderizar_relojes(resultados, pool=pool)
+        registros = diagnostico.etapas()
+    finally:
+        pool.shutdown()
+        diagnostico.activar(False)
+    assert len(imagenes) == 2 and all(imagenes)
+    assert [r["etapa"] for r in registros].count("render") == 2
+    assert all(r["proceso"] == "pool" for r in registros if r["etapa"] == "render")
+    assert any(r["etapa"] == "render_pool" for r in registros)
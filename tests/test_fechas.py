@@ -0,0 +1,11 @@
+from benchmarks.sintetico import fechas_mixtas
+from datos import normalizar_columnas
+
+
+def test_fechas_mixtas_igual_a_tipadas(crudo):
+    tipadas = normalizar_columnas(crudo.copy())
+    mixtas = normalizar_columnas(fechas_mixtas(crudo))
+    assert (mixtas["Fecha"] == tipadas["Fecha"]).all()
+    informe = mixtas.attrs["informe_fechas"]
+    assert informe["nat"] == 0
+    assert set(informe["por_formato"]) == {"excel", "iso", "local"}
@@ -0,0 +1,81 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from benchmarks.sintetico import a_xlsx, generar_eventos
+from fuentes import Fuente, RegistroFuentes
+
+
+@pytest.fixture
+def servidor():
+    """Servidor HTTP local: /<planta>.xlsx con demora o error configurables por planta."""
+    archivos = {f"/{p}.xlsx": a_xlsx(generar_eventos(n_maquinas=1, dias=2, eventos_por_turno=20, semilla=i))
+                for i, p in enumerate(["rapida", "lenta"])}
+    estado = dict(demora={}, error=set())
+
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(estado["demora"].get(self.path, 0))
+            if self.path in estado["error"]:
+                self.send_response(500)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            cuerpo = archivos[self.path]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_port}", estado
+    srv.shutdown()
+
+@pytest.fixture
+def registro(servidor):
+    url, _ = servidor
+    reg = RegistroFuentes([Fuente("Rápida", f"{url}/rapida.xlsx"), Fuente("Lenta", f"{url}/lenta.xlsx")],
+                          ttl_segundos=0, espera_segundos=0.3)
+    yield reg
+    reg.cerrar()
+
+
+def test_planta_lenta_no_frena_a_las_demas(servidor, registro):
+    _, estado = servidor
+    assert set(registro.leer()["Planta"]) == {"Rápida", "Lenta"}  # primera carga: espera a todas
+    previa = registro.fuente("Lenta").ultima_lectura
+
+    estado["demora"]["/lenta.xlsx"] = 1.5
+    t0 = time.perf_counter()
+    df = registro.leer()
+    assert time.perf_counter() - t0 < 1.2
+    assert registro.demoradas() == ["Lenta"]
+    assert set(df["Planta"]) == {"Rápida", "Lenta"}  # la lenta, con sus últimos datos
+    assert registro.fuente("Rápida").ultima_lectura > previa
+
+    # La lectura demorada guarda su resultado al terminar, sin otro refresco
+    deadline = time.perf_counter() + 5
+    while registro.demoradas() and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    assert registro.demoradas() == []
+    assert registro.fuente("Lenta").ultima_lectura > previa
+
+def test_planta_con_error_conserva_datos_y_se_reintenta(servidor, registro):
+    _, estado = servidor
+    registro.leer()
+    filas = len(registro.fuente("Lenta").datos)
+    estado["error"].add("/lenta.xlsx")
+    df = registro.leer()
+    assert list(registro.fallidas()) == ["Lenta"]
+    assert (df["Planta"] == "Lenta").sum() == filas
+    estado["error"].clear()
+    assert registro.refrescar_fallidas() == {"Lenta": None}
+    assert registro.fallidas() == {}
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from reloj_circular import (_INDICADORES, IndiceEventos, calcular_indicadores_lote, calcular_reloj,
+                            sensibilidad_umbral)
+from turnos import CALENDARIO_POR_DEFECTO, CalendarioTurnos, Turno
+
+NOCHE = CalendarioTurnos({d: [Turno("Mañana", "06:00", "14:00", pausas=[("Desayuno", "09:00", "09:15")]),
+                              Turno("Noche", "22:00", "06:00", pausas=[("Cena", "02:00", "02:30")],
+                                    limpieza_min=10)]
+                          for d in range(7)})
+
+
+@pytest.mark.parametrize("umbral", [0, 3, 10])
+@pytest.mark.parametrize("calendario", [CALENDARIO_POR_DEFECTO, NOCHE], ids=["planta", "noche"])
+def test_lote_igual_a_calcular_reloj(eventos, umbral, calendario):
+    indicadores, gaps = calcular_indicadores_lote(eventos, umbral, calendario)
+    indice = IndiceEventos(eventos)
+    assert len(indicadores)
+    for fila in indicadores.itertuples(index=False):
+        m, f = fila[0], fila[1]
+        r = calcular_reloj(eventos, m, f, umbral, calendario)
+        for clave in _INDICADORES:
+            assert getattr(fila, clave) == r["indicadores"][clave], (m, f, clave)
+        assert fila.contador_total == r["contador_total"]
+        esperado = pd.DataFrame(r["lista_gaps"], columns=["Inicio", "Fin", "Duracion_min"])
+        obtenido = gaps[(gaps["Id Equipo"] == m) & (gaps["Fecha"] == f)][["Inicio", "Fin", "Duracion_min"]]
+        pd.testing.assert_frame_equal(obtenido.reset_index(drop=True), esperado, check_dtype=False)
+        if calendario is CALENDARIO_POR_DEFECTO:
+            # Mismo resultado leyendo desde el índice
+            assert calcular_reloj(indice, m, f, umbral, calendario)["indicadores"] == r["indicadores"]
+
+def test_duplicados_y_parcial_cero(eventos):
+    # Los datos de prueba cubren los casos especiales del motor
+    assert eventos.duplicated(["Id Equipo", "Fecha"]).any()
+    assert (eventos["Parcial"] == 0).any()
+
+@pytest.mark.parametrize("calendario", [CALENDARIO_POR_DEFECTO, NOCHE], ids=["planta", "noche"])
+def test_sensibilidad_igual_al_lote_por_umbral(eventos, calendario):
+    umbrales = [1, 3, 5, 10, 30]
+    curva = sensibilidad_umbral(eventos, umbrales, calendario)
+    for u in umbrales:
+        indicadores, _ = calcular_indicadores_lote(eventos, u, calendario)
+        obtenido = (curva[curva["umbral"] == u].set_index(["Id Equipo", "Fecha"])
+                    [["neto", "perdido_no_programado", "porcentaje_perdido"]].sort_index())
+        esperado = (indicadores.set_index(["Id Equipo", "Fecha"])
+                    [["neto", "perdido_no_programado", "porcentaje_perdido"]].sort_index())
+        assert len(esperado)
+        pd.testing.assert_frame_equal(obtenido, esperado, check_dtype=False,
+                                      check_index_type=False, check_categorical=False)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from simultaneidad import barrido, tiempo_con_al_menos, tramos_simultaneos
+
+
+def _por_instante(ini, fin, grupo, n_grupos, largo):
+    """Fuerza bruta: intervalos activos en cada instante entero [t, t+1)."""
+    activos = np.zeros((n_grupos, largo), dtype="int64")
+    for a, b, g in zip(ini, fin, grupo):
+        activos[g, a:b] += 1
+    return activos
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_barrido_igual_a_fuerza_bruta(semilla):
+    rng = np.random.default_rng(semilla)
+    n, n_grupos, largo = 60, 3, 100
+    ini = rng.integers(0, largo - 1, n)
+    fin = np.minimum(ini + rng.integers(1, 25, n), largo)
+    grupo = rng.integers(0, n_grupos, n)
+    esperado = _por_instante(ini, fin, grupo, n_grupos, largo)
+
+    g, desde, hasta, cantidad = barrido(ini, fin, grupo)
+    obtenido = np.zeros_like(esperado)
+    for gi, a, b, c in zip(g, desde, hasta, cantidad):
+        assert obtenido[gi, a:b].sum() == 0  # tramos disjuntos
+        obtenido[gi, a:b] = c
+    np.testing.assert_array_equal(obtenido, esperado)
+
+    al_menos = tiempo_con_al_menos(g, desde, hasta, cantidad, n_grupos, 4)
+    for k in range(1, 5):
+        np.testing.assert_array_equal(al_menos[:, k - 1], (esperado >= k).sum(axis=1))
+
+    tg, td, th, pico = tramos_simultaneos(g, desde, hasta, cantidad, minimo=2)
+    for gi in range(n_grupos):
+        marcas = np.zeros(largo, dtype=bool)
+        for a, b in zip(td[tg == gi], th[tg == gi]):
+            marcas[a:b] = True
+        np.testing.assert_array_equal(marcas, esperado[gi] >= 2)
+    for gi, a, b, p in zip(tg, td, th, pico):
+        assert p == esperado[gi, a:b].max()
+
+def test_intervalos_que_se_tocan_no_son_simultaneos():
+    g, desde, hasta, cantidad = barrido([0, 10], [10, 20])
+    assert cantidad.max() == 1
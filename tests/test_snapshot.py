@@ -0,0 +1,76 @@
+import pandas as pd
+
+from datos import SnapshotEventos, normalizar_columnas
+
+
+def _escribir_csv(df, ruta):
+    """CSV con el layout del sheet: título en la primera fila, encabezado en la segunda."""
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        f.write("Eventos\n")
+        df.to_csv(f, index=False)
+
+def _ordenado(df):
+    return (df[["Id Equipo", "Fecha", "Parcial"]].astype({"Id Equipo": str})
+            .sort_values(["Id Equipo", "Fecha", "Parcial"]).reset_index(drop=True))
+
+
+def test_snapshot_agrega_solo_filas_nuevas(crudo, tmp_path):
+    crudo = crudo.sort_values("Fecha", kind="stable")
+    corte = crudo["Fecha"].quantile(0.6)
+    fuente, ruta = tmp_path / "eventos.csv", str(tmp_path / "snapshot.arrow")
+    snapshot = SnapshotEventos(str(fuente), ruta, ttl_segundos=3600)
+
+    _escribir_csv(crudo[crudo["Fecha"] <= corte], fuente)
+    assert snapshot.refrescar() == int((crudo["Fecha"] <= corte).sum())
+    _escribir_csv(crudo, fuente)
+    assert snapshot.refrescar() == int((crudo["Fecha"] > corte).sum())
+    assert snapshot.refrescar() == 0
+
+    esperado = normalizar_columnas(crudo.copy())
+    pd.testing.assert_frame_equal(_ordenado(snapshot.cargar()), _ordenado(esperado))
+
+def test_snapshot_con_maquina_nueva(crudo, tmp_path):
+    # 'Id Equipo' es categórica: una máquina que aparece recién en el segundo
+    # refresco no debe romper el append (diccionarios Arrow distintos)
+    crudo = crudo.sort_values("Fecha", kind="stable")
+    corte = crudo["Fecha"].quantile(0.5)
+    nueva = crudo["Id Equipo"].unique()[-1]
+    primera = crudo[(crudo["Fecha"] <= corte) & (crudo["Id Equipo"] != nueva)]
+    completa = pd.concat([primera, crudo[crudo["Fecha"] > corte]])
+    fuente, ruta = tmp_path / "eventos.csv", str(tmp_path / "snapshot.arrow")
+    snapshot = SnapshotEventos(str(fuente), ruta, ttl_segundos=3600)
+
+    _escribir_csv(primera, fuente)
+    snapshot.refrescar()
+    _escribir_csv(completa, fuente)
+    assert snapshot.refrescar() == int((crudo["Fecha"] > corte).sum())
+
+    df = snapshot.cargar()
+    assert df["Id Equipo"].dtype == "category"
+    assert nueva in set(df["Id Equipo"])
+    pd.testing.assert_frame_equal(_ordenado(df), _ordenado(normalizar_columnas(completa.copy())))
+
+def test_snapshot_con_sincronizacion_tardia(crudo, tmp_path):
+    # Una máquina que sincroniza tarde trae filas anteriores a la última Fecha de
+    # otra máquina (y filas con la misma Fecha que el corte): no se pierden
+    crudo = crudo.sort_values("Fecha", kind="stable")
+    corte = crudo["Fecha"].quantile(0.6)
+    tardia = crudo["Id Equipo"].unique()[0]
+    primera = crudo[(crudo["Fecha"] <= corte)
+                    & ((crudo["Id Equipo"] != tardia) | (crudo["Fecha"] <= crudo["Fecha"].quantile(0.3)))]
+    fuente, ruta = tmp_path / "eventos.csv", str(tmp_path / "snapshot.arrow")
+    snapshot = SnapshotEventos(str(fuente), ruta, ttl_segundos=3600)
+
+    _escribir_csv(primera, fuente)
+    snapshot.refrescar()
+    _escribir_csv(crudo, fuente)
+    assert snapshot.refrescar() == len(crudo) - len(primera)
+    version = snapshot.version()
+    assert snapshot.refrescar() == 0 and snapshot.version() == version
+    pd.testing.assert_frame_equal(_ordenado(snapshot.cargar()), _ordenado(normalizar_columnas(crudo.copy())))
+
+    # Una fila repetida en el borde del corte también cambia la versión
+    _escribir_csv(pd.concat([crudo, crudo.tail(1)]), fuente)
+    snapshot.refrescar()
+    assert snapshot.version() != version
+    assert len(snapshot.cargar()) == len(crudo) + 1
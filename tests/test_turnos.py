@@ -0,0 +1,69 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from turnos import CalendarioTurnos, Turno, longitud_total, restar_intervalos, unir_intervalos
+
+
+def _puntos(ini, fin):
+    """Conjunto de enteros cubiertos por los intervalos [ini, fin)."""
+    return {x for a, b in zip(ini, fin) for x in range(int(a), int(b))}
+
+def _aleatorios(rng, n, largo=60):
+    ini = rng.integers(0, largo, n)
+    return ini, ini + rng.integers(-3, 15, n)  # incluye intervalos vacíos / invertidos
+
+
+@pytest.mark.parametrize("semilla", range(20))
+def test_unir_intervalos_igual_a_fuerza_bruta(semilla):
+    ini, fin = _aleatorios(np.random.default_rng(semilla), 12)
+    u_ini, u_fin = unir_intervalos(ini, fin)
+    assert (u_fin > u_ini).all()
+    # Disjuntos y no contiguos: los contiguos se unen
+    assert (u_ini[1:] > u_fin[:-1]).all()
+    assert _puntos(u_ini, u_fin) == _puntos(ini, fin)
+    assert longitud_total(ini, fin) == len(_puntos(ini, fin))
+
+def test_unir_intervalos_vacio():
+    ini, fin = unir_intervalos([], [])
+    assert len(ini) == len(fin) == 0
+
+@pytest.mark.parametrize("semilla", range(20))
+def test_restar_intervalos_igual_a_fuerza_bruta(semilla):
+    rng = np.random.default_rng(semilla)
+    ini, fin = _aleatorios(rng, 8)
+    c_ini, c_fin = _aleatorios(rng, 6)
+    r_ini, r_fin, origen = restar_intervalos(ini, fin, c_ini, c_fin)
+    assert (r_fin > r_ini).all()
+    cortes = _puntos(c_ini, c_fin)
+    for i in range(len(ini)):
+        propios = origen == i
+        assert _puntos(r_ini[propios], r_fin[propios]) == _puntos([ini[i]], [fin[i]]) - cortes
+        assert (np.diff(r_ini[propios]) > 0).all()  # cronológico dentro de cada intervalo
+    assert (np.diff(origen) >= 0).all()
+
+def test_restar_intervalos_sin_cortes():
+    r_ini, r_fin, origen = restar_intervalos([0, 10], [5, 20], [], [])
+    assert r_ini.tolist() == [0, 10] and r_fin.tolist() == [5, 20] and origen.tolist() == [0, 1]
+
+
+def test_turno_que_cruza_medianoche():
+    turno = Turno("Noche", "22:00", "06:00",
+                  pausas=[("Cena", "23:50", "00:20"), ("Café", "03:00", "03:15"), ("Fuera", "07:00", "08:00")],
+                  limpieza_min=10)
+    concreto = turno.en_fecha(date(2024, 1, 1))
+    base = datetime(2024, 1, 1)
+    assert concreto["inicio"] == base + timedelta(hours=22)
+    assert concreto["fin"] == base + timedelta(days=1, hours=6)
+    # Las pausas después de medianoche caen en el día siguiente; la que queda fuera del turno se descarta
+    assert concreto["pausas"] == [
+        ("Cena", base + timedelta(hours=23, minutes=50), base + timedelta(days=1, minutes=20)),
+        ("Café", base + timedelta(days=1, hours=3), base + timedelta(days=1, hours=3, minutes=15)),
+        ("Limpieza", base + timedelta(days=1, hours=5, minutes=50), base + timedelta(days=1, hours=6)),
+    ]
+
+    calendario = CalendarioTurnos({d: [turno] for d in range(7)})
+    assert calendario.cruza_medianoche()
+    # Los eventos del turno del 1/1 pueden estar fechados el 2/1
+    assert calendario.fechas_fuente([date(2024, 1, 1)]) == [date(2024, 1, 1), date(2024, 1, 2)]
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import datos
+from reloj_circular import calcular_reloj
+from vivo import FuenteIncremental, RelojEnVivo
+
+
+@pytest.mark.parametrize("partes", [1, 7, 50])
+def test_reloj_en_vivo_por_partes_igual_a_calcular_reloj(eventos, partes):
+    maquina = eventos["Id Equipo"].cat.categories[0]
+    filas = eventos[eventos["Id Equipo"] == maquina].sort_values("Fecha", kind="stable")
+    for fecha in sorted(filas["Dia Turno"].dt.date.unique())[:4]:
+        esperado = calcular_reloj(eventos, maquina, fecha, 3)
+        vivo = RelojEnVivo(maquina, fecha, 3)
+        for parte in np.array_split(np.arange(len(filas)), partes):
+            vivo.agregar(filas.iloc[parte])
+        r = vivo.resultado(ahora=esperado["fin"])
+        assert r["indicadores"] == esperado["indicadores"]
+        assert r["lista_gaps"] == esperado["lista_gaps"]
+        assert r["contador_total"] == esperado["contador_total"]
+
+
+def test_fuente_incremental_fija_formatos_y_no_usa_cache(tmp_path):
+    ruta = tmp_path / "vivo.csv"
+    # Sheet en m/d/AAAA: la primera lectura lo detecta (hay un "día" 13)
+    ruta.write_text("Eventos\nFecha,Id Equipo,Parcial\n"
+                    "01/13/2024 06:10:00,M1,5\n01/13/2024 06:20:00,M1,3\n", encoding="utf-8")
+    fuente = FuenteIncremental(str(ruta))
+    datos._cache_fechas.clear()
+    assert len(fuente.leer_nuevas()) == 2
+    # Un bloque nuevo con solo fechas ambiguas se interpreta igual que el resto
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write("02/03/2024 06:30:00,M1,4\n")
+    nuevas = fuente.leer_nuevas()
+    assert nuevas["Fecha"].tolist() == [pd.Timestamp("2024-02-03 06:30:00")]
+    assert len(datos._cache_fechas) == 0
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+
+NS_MIN = 60 * 1_000_000_000
+NS_DIA = 24 * 60 * NS_MIN
+
+
+# =========================================================
+# Aritmética de intervalos sobre arrays (int64, p. ej. ns epoch)
+# =========================================================
+# Todos los intervalos son semiabiertos [ini, fin).
+def unir_intervalos(ini, fin):
+    """Une intervalos solapados o contiguos. Devuelve (ini, fin) ordenados y disjuntos."""
+    ini, fin = np.asarray(ini, dtype="int64"), np.asarray(fin, dtype="int64")
+    validos = fin > ini
+    ini, fin = ini[validos], fin[validos]
+    if len(ini) == 0:
+        return ini, fin
+    orden = np.argsort(ini, kind="stable")
+    ini, fin = ini[orden], fin[orden]
+    fin_acum = np.maximum.accumulate(fin)
+    nuevo = np.ones(len(ini), dtype=bool)
+    nuevo[1:] = ini[1:] > fin_acum[:-1]
+    return ini[nuevo], np.maximum.reduceat(fin_acum, np.flatnonzero(nuevo))
+
+def longitud_total(ini, fin) -> int:
+    """Largo de la unión de los intervalos."""
+    ini, fin = unir_intervalos(ini, fin)
+    return int((fin - ini).sum())
+
+def recortar_intervalos(ini, fin, desde, hasta):
+    """Recorta cada intervalo a [desde, hasta) (escalares o arrays) y descarta los vacíos."""
+    ini = np.maximum(np.asarray(ini, dtype="int64"), desde)
+    fin = np.minimum(np.asarray(fin, dtype="int64"), hasta)
+    validos = fin > ini
+    return ini[validos], fin[validos]
+
+def restar_intervalos(ini, fin, cortes_ini, cortes_fin):
+    """
+    Resta a cada intervalo [ini_i, fin_i) la unión de los cortes.
+
+    Devuelve (ini, fin, origen): los remanentes en orden (por intervalo y luego
+    cronológico) y el índice del intervalo del que sale cada uno. Los cortes se
+    unen una vez y cada intervalo solo se cruza con las ventanas libres que toca
+    (searchsorted), así el costo es O((n + k) log k + salida) y no n × k.
+    """
+    ini, fin = np.asarray(ini, dtype="int64"), np.asarray(fin, dtype="int64")
+    c_ini, c_fin = unir_intervalos(cortes_ini, cortes_fin)
+    # Ventanas libres: complemento de los cortes
+    minimo, maximo = np.iinfo("int64").min, np.iinfo("int64").max
+    v_ini = np.concatenate([[minimo], c_fin])
+    v_fin = np.concatenate([c_ini, [maximo]])
+
+    primera = np.searchsorted(v_fin, ini, side="right")
+    ultima = np.searchsorted(v_ini, fin, side="left") - 1
+    cantidad = np.maximum(ultima - primera + 1, 0)
+    origen = np.repeat(np.arange(len(ini)), cantidad)
+    desplazamiento = np.arange(len(origen)) - np.repeat(np.cumsum(cantidad) - cantidad, cantidad)
+    ventana = primera[origen] + desplazamiento
+
+    r_ini = np.maximum(ini[origen], v_ini[ventana])
+    r_fin = np.minimum(fin[origen], v_fin[ventana])
+    validos = r_fin > r_ini
+    return r_ini[validos], r_fin[validos], origen[validos]
+
+
+# =========================================================
+# Turnos y calendario
+# =========================================================
+def _hhmm_min(s):
+    t = datetime.strptime(s, "%H:%M")
+    return t.hour * 60 + t.minute
+
+
+class Turno:
+    """
+    Un turno con horario "HH:MM". Si fin <= inicio el turno termina al día
+    siguiente (turno noche). Las pausas son (nombre, "HH:MM", "HH:MM"); una pausa
+    anterior al inicio del turno se interpreta en el día siguiente y lo que quede
+    fuera del turno se recorta. `limpieza_min` agrega la pausa "Limpieza" al final del turno.
+    """
+
+    def __init__(self, nombre, inicio, fin, pausas=(), limpieza_min=0):
+        self.nombre = nombre
+        self.inicio_min = _hhmm_min(inicio)
+        self.fin_min = _hhmm_min(fin)
+        if self.fin_min <= self.inicio_min:
+            self.fin_min += 24 * 60
+        self.pausas_min = []
+        for nombre_p, ps, pe in pausas:
+            ps_min, pe_min = _hhmm_min(ps), _hhmm_min(pe)
+            if ps_min < self.inicio_min:
+                ps_min += 24 * 60
+            if pe_min < ps_min:
+                pe_min += 24 * 60
+            self.pausas_min.append((nombre_p, ps_min, pe_min))
+        if limpieza_min:
+            self.pausas_min.append(("Limpieza", self.fin_min - limpieza_min, self.fin_min))
+        # Recortadas al turno y ordenadas; `pausas_unidas` (disjuntas) es la base de los cálculos
+        self.pausas_min = sorted(
+            [(n, max(ps, self.inicio_min), min(pe, self.fin_min)) for n, ps, pe in self.pausas_min
+             if min(pe, self.fin_min) > max(ps, self.inicio_min)],
+            key=lambda p: p[1])
+        ini, fin = unir_intervalos([p[1] for p in self.pausas_min], [p[2] for p in self.pausas_min])
+        self.pausas_unidas = list(zip(ini.tolist(), fin.tolist()))
+
+    def __repr__(self):
+        return f"Turno({self.nombre!r}, {self.inicio_min}–{self.fin_min} min)"
+
+    def en_fecha(self, fecha):
+        """Turno concreto de un día: dict con nombre, inicio, fin y pausas (datetimes)."""
+        base = datetime(fecha.year, fecha.month, fecha.day)
+        return dict(
+            nombre=self.nombre,
+            inicio=base + timedelta(minutes=self.inicio_min),
+            fin=base + timedelta(minutes=self.fin_min),
+            pausas=[(n, base + timedelta(minutes=ps), base + timedelta(minutes=pe))
+                    for n, ps, pe in self.pausas_min],
+        )
+
+
+class CalendarioTurnos:
+    """
+    Calendario de turnos configurable.
+
+    - semana: {weekday: [Turno, ...]} (0=lunes ... 6=domingo); un día sin entrada no se trabaja
+    - por_maquina: {maquina_id: {weekday: [Turno, ...]}} reemplaza a `semana` para esa máquina
+    - feriados: fechas sin turnos regulares
+    - extras: {fecha: [Turno, ...]} turnos adicionales (valen también en feriados)
+
+    Los turnos de una misma máquina no deben solaparse entre sí.
+    """
+
+    def __init__(self, semana, por_maquina=None, feriados=(), extras=None):
+        self.semana = {int(k): list(v) for k, v in semana.items()}
+        self.por_maquina = {m: {int(k): list(v) for k, v in s.items()}
+                            for m, s in (por_maquina or {}).items()}
+        self.feriados = {pd.Timestamp(f).date() for f in feriados}
+        self.extras = {pd.Timestamp(f).date(): list(v) for f, v in (extras or {}).items()}
+
+    def definiciones(self, fecha, maquina_id=None):
+        """Turnos (definición) que aplican a una máquina en una fecha, ordenados por inicio."""
+        semana = self.por_maquina.get(maquina_id, self.semana)
+        turnos = [] if fecha in self.feriados else list(semana.get(fecha.weekday(), []))
+        turnos += self.extras.get(fecha, [])
+        return sorted(turnos, key=lambda t: t.inicio_min)
+
+    def turnos(self, fecha, maquina_id=None):
+        """Turnos concretos (ver Turno.en_fecha) de una máquina en una fecha."""
+        return [t.en_fecha(fecha) for t in self.definiciones(fecha, maquina_id)]
+
+    def cruza_medianoche(self):
+        """True si algún turno termina después de las 24:00 de su día."""
+        todos = [t for s in [self.semana, *self.por_maquina.values()] for ts in s.values() for t in ts]
+        todos += [t for ts in self.extras.values() for t in ts]
+        return any(t.fin_min > 24 * 60 for t in todos)
+
+    def huella(self):
+        """Hash estable de la configuración (para claves de caché que sobreviven al proceso)."""
+        def firma(turnos):
+            return [(t.nombre, t.inicio_min, t.fin_min, t.pausas_min) for t in turnos]
+        datos = (
+            sorted((k, firma(v)) for k, v in self.semana.items()),
+            sorted((str(m), sorted((k, firma(v)) for k, v in s.items())) for m, s in self.por_maquina.items()),
+            sorted(self.feriados),
+            sorted((f, firma(v)) for f, v in self.extras.items()),
+        )
+        return hashlib.blake2b(repr(datos).encode("utf-8"), digest_size=8).hexdigest()
+
+    def fechas_fuente(self, fechas):
+        """
+        Días calendario cuyos eventos pueden caer en turnos de `fechas`: las mismas
+        fechas y, si hay turnos noche, también el día siguiente de cada una.
+        """
+        fechas = sorted(set(fechas))
+        if self.cruza_medianoche():
+            fechas = sorted(set(fechas) | {f + timedelta(days=1) for f in fechas})
+        return fechas
+
+    def tabla(self, maquinas, dias):
+        """
+        Expansión vectorizable del calendario para pares (máquina, día).
+        `maquinas` y `dias` (días desde epoch) son arrays paralelos.
+
+        Devuelve un dict de arrays:
+          - turno_par, turno_ini, turno_fin (ns): un registro por turno, ordenados
+            por (par, inicio); turno_par es el índice en los arrays de entrada
+          - pausa_turno, pausa_ini, pausa_fin (ns): pausas de cada turno, ya
+            recortadas al turno, unidas y ordenadas
+        """
+        t_par, t_ini, t_fin, p_tur, p_ini, p_fin = [], [], [], [], [], []
+        for i, (maquina, dia) in enumerate(zip(maquinas, dias)):
+            base = int(dia) * NS_DIA
+            fecha = (pd.Timestamp(0) + pd.Timedelta(days=int(dia))).date()
+            for t in self.definiciones(fecha, maquina):
+                ini, fin = base + t.inicio_min * NS_MIN, base + t.fin_min * NS_MIN
+                k = len(t_ini)
+                t_par.append(i)
+                t_ini.append(ini)
+                t_fin.append(fin)
+                for ps, pe in t.pausas_unidas:
+                    p_tur.append(k)
+                    p_ini.append(base + ps * NS_MIN)
+                    p_fin.append(base + pe * NS_MIN)
+        return dict(
+            turno_par=np.asarray(t_par, dtype="int64"),
+            turno_ini=np.asarray(t_ini, dtype="int64"),
+            turno_fin=np.asarray(t_fin, dtype="int64"),
+            pausa_turno=np.asarray(p_tur, dtype="int64"),
+            pausa_ini=np.asarray(p_ini, dtype="int64"),
+            pausa_fin=np.asarray(p_fin, dtype="int64"),
+        )
+
+
+# =========================================================
+# Calendario actual de planta
+# =========================================================
+# Turno: Lun–Jue 06:00–16:00, Vie (y fin de semana) 06:00–15:00
+# Pausas: 08:00–08:20, 12:00–12:40 y últimos 20 min del turno
+PAUSAS_FIJAS = [("Desayuno", "08:00", "08:20"), ("Almuerzo", "12:00", "12:40")]
+LIMPIEZA_MIN = 20
+TURNO_LUN_JUE = Turno("Turno", "06:00", "16:00", pausas=PAUSAS_FIJAS, limpieza_min=LIMPIEZA_MIN)
+TURNO_VIE = Turno("Turno", "06:00", "15:00", pausas=PAUSAS_FIJAS, limpieza_min=LIMPIEZA_MIN)
+
+CALENDARIO_POR_DEFECTO = CalendarioTurnos(
+    {0: [TURNO_LUN_JUE], 1: [TURNO_LUN_JUE], 2: [TURNO_LUN_JUE], 3: [TURNO_LUN_JUE],
+     4: [TURNO_VIE], 5: [TURNO_VIE], 6: [TURNO_VIE]}
+)
+
+
+# =========================================================
+# Configuración desde JSON
+# =========================================================
+# {
+#   "semana": {"0": [{"nombre": "Mañana", "inicio": "06:00", "fin": "14:00",
+#                     "pausas": [["Desayuno", "09:00", "09:15"]], "limpieza_min": 0}], ...},
+#   "por_maquina": {"12": {"0": [...], ...}},
+#   "feriados": ["2025-12-25"],
+#   "extras": {"2025-12-27": [{...}]}
+# }
+def _turnos_desde_config(lista):
+    return [Turno(t.get("nombre", "Turno"), t["inicio"], t["fin"],
+                  pausas=[tuple(p) for p in t.get("pausas", [])],
+                  limpieza_min=t.get("limpieza_min", 0))
+            for t in lista]
+
+def calendario_desde_config(config: dict) -> CalendarioTurnos:
+    """Arma un CalendarioTurnos desde un dict (formato JSON de arriba)."""
+    semana = {int(k): _turnos_desde_config(v) for k, v in config.get("semana", {}).items()}
+    por_maquina = {str(m): {int(k): _turnos_desde_config(v) for k, v in s.items()}
+                   for m, s in config.get("por_maquina", {}).items()}
+    extras = {f: _turnos_desde_config(v) for f, v in config.get("extras", {}).items()}
+    return CalendarioTurnos(semana, por_maquina=por_maquina,
+                            feriados=config.get("feriados", []), extras=extras)
+
+def cargar_calendario(ruta=None) -> CalendarioTurnos:
+    """Calendario desde un archivo JSON; sin ruta, el calendario de planta."""
+    if not ruta:
+        return CALENDARIO_POR_DEFECTO
+    with open(ruta, encoding="utf-8") as f:
+        return calendario_desde_config(json.load(f))
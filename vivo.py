@@ -0,0 +1,273 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from datos import cargar_excel_desde_sheet, normalizar_columnas
+from diagnostico import etapa
+from reloj_circular import (_asignar_turnos, _columna_parcial, _eventos_ordenados, completar_resultado,
+                            resultado_vacio, tabla_del_dia)
+from turnos import CALENDARIO_POR_DEFECTO, restar_intervalos
+
+
+# =========================================================
+# Fuente incremental
+# =========================================================
+class FuenteIncremental:
+    """
+    Lee de la fuente solo las filas nuevas.
+
+    - CSV local (p. ej. un archivo al que se le van agregando filas): retoma
+      desde el último byte leído; una línea incompleta al final queda para la
+      próxima lectura. Si el archivo se achica, se vuelve a leer desde el principio.
+    - Otra fuente (URL del sheet, .xlsx, .parquet o un fuentes.RegistroFuentes
+      con varias plantas): se relee completa.
+
+    Al releer completo se devuelven solo las filas con Fecha posterior al último
+    timestamp visto de su máquina (en el CSV el offset ya garantiza que son nuevas).
+
+    Los formatos de texto de Fecha se detectan en la primera lectura y quedan
+    fijos: un bloque de pocas filas nuevas no vuelve a decidir d/m vs m/d. Las
+    lecturas no pasan por la caché de fechas de datos.py (no se repiten y
+    desalojarían la columna del sheet principal).
+    """
+
+    def __init__(self, origen: str):
+        self.origen = origen
+        self.ultimo = {}  # Id Equipo -> último timestamp visto
+        self._offset = 0
+        self._columnas = None
+        self._formatos = None  # formatos de Fecha detectados en la primera lectura
+
+    def _es_csv(self) -> bool:
+        return (isinstance(self.origen, str) and os.path.exists(self.origen)
+                and os.path.splitext(self.origen)[1].lower() == ".csv")
+
+    def _leer_csv(self):
+        if os.path.getsize(self.origen) < self._offset:  # truncado o rotado
+            self._offset, self._columnas, self._formatos, self.ultimo = 0, None, None, {}
+        with open(self.origen, "rb") as f:
+            f.seek(self._offset)
+            datos = f.read()
+        completo = datos.rfind(b"\n") + 1
+        if completo == 0:
+            return None
+        datos = datos[:completo]
+        with etapa("parse_csv_incremental", bytes=completo) as e:
+            if self._columnas is None:
+                df = pd.read_csv(BytesIO(datos), header=1)
+                self._columnas = list(df.columns)
+            else:
+                df = pd.read_csv(BytesIO(datos), header=None, names=self._columnas)
+            e.anotar(filas=len(df))
+        self._offset += completo
+        return df
+
+    def leer_nuevas(self) -> pd.DataFrame:
+        """Filas nuevas normalizadas (ver datos.normalizar_columnas), ordenadas por Fecha."""
+        es_csv = self._es_csv()
+        if hasattr(self.origen, "leer"):  # registro de plantas: ya viene normalizado
+            df = self.origen.leer()
+        else:
+            crudo = self._leer_csv() if es_csv else cargar_excel_desde_sheet(self.origen)
+            if crudo is None or crudo.empty:
+                return pd.DataFrame(columns=["Fecha", "Id Equipo"])
+            df = normalizar_columnas(crudo, formatos=self._formatos, usar_cache=False)
+            if self._formatos is None:
+                self._formatos = df.attrs["informe_fechas"]["formatos"]
+        df = df[df["Fecha"].notna()]
+        if not es_csv:
+            corte = df["Id Equipo"].astype(str).map(self.ultimo).astype("datetime64[ns]")
+            df = df[corte.isna() | (df["Fecha"] > corte)]
+        if not df.empty:
+            for m, f in df.groupby(df["Id Equipo"].astype(str))["Fecha"].max().items():
+                self.ultimo[m] = f
+        return df.sort_values("Fecha", kind="stable")
+
+
+# =========================================================
+# Reloj incremental de un día
+# =========================================================
+class RelojEnVivo:
+    """
+    Estado incremental del reloj de una máquina en una fecha (normalmente el
+    turno en curso).
+
+    agregar() procesa solo las filas nuevas: cada evento cierra el gap abierto
+    desde el evento anterior de su turno, así que solo cambia el intervalo final
+    y no hace falta recalcular el día. resultado(ahora) devuelve el mismo dict
+    que calcular_reloj, con el gap abierto hasta `ahora` como provisorio; con el
+    turno terminado coincide exactamente con calcular_reloj.
+
+    Filas con Fecha anterior a la última procesada se descartan (llegaron tarde);
+    las de igual Fecha cuentan como duplicados, igual que en calcular_reloj.
+    """
+
+    def __init__(self, maquina_id, fecha, umbral_minutos=3, calendario=None):
+        self.maquina_id = maquina_id
+        self.fecha = fecha
+        self.umbral_minutos = umbral_minutos
+        self.calendario = calendario or CALENDARIO_POR_DEFECTO
+        self._tabla = tabla_del_dia(self.calendario, maquina_id, fecha)
+        n_turnos = len(self._tabla["turno_ini"])
+        self._codigo_turno = np.zeros(n_turnos, dtype="int64")
+        self._ultimo_evento = np.full(n_turnos, -1, dtype="int64")  # por turno; -1 = sin eventos
+        self._contador = np.zeros(n_turnos)
+        self._visto = None  # último timestamp procesado (cualquier fila)
+        self._pa, self._pb, self._seg = [], [], []  # gaps ya cerrados, en orden
+        self.filas = 0
+
+    def _restar_pausas(self, a, b):
+        """Resta las pausas y aplica el filtro >= umbral; devuelve (pa, pb, seg)."""
+        tabla = self._tabla
+        sel = (b - a) / 1e9 / 60.0 >= self.umbral_minutos
+        pa, pb, _ = restar_intervalos(a[sel], b[sel], tabla["pausa_ini"], tabla["pausa_fin"])
+        seg = (pb - pa) / 1e9
+        sel = seg / 60.0 >= self.umbral_minutos
+        return pa[sel], pb[sel], seg[sel]
+
+    def agregar(self, eventos: pd.DataFrame) -> int:
+        """Incorpora filas nuevas de esta máquina; devuelve cuántas se procesaron."""
+        if eventos.empty:
+            return 0
+        ts, parc = _eventos_ordenados(eventos, _columna_parcial(eventos.columns))
+        visto = self._visto
+        if visto is not None:
+            nuevas = ts >= visto
+            ts, parc = ts[nuevas], (parc[nuevas] if parc is not None else None)
+        if len(ts) == 0:
+            return 0
+        self._visto = ts[-1]
+        procesadas = len(ts)
+        self.filas += procesadas
+
+        tabla = self._tabla
+        turno = _asignar_turnos(ts, np.zeros(len(ts), dtype="int64"), self._codigo_turno,
+                                tabla["turno_ini"], tabla["turno_fin"])
+        en_turno = turno >= 0
+        primero = np.ones(len(ts), dtype=bool)
+        primero[1:] = ts[1:] != ts[:-1]
+        if visto is not None:
+            primero &= ts != visto  # ya se procesó una fila con ese timestamp
+        keep = en_turno & primero
+        if parc is not None:
+            usado = en_turno & (parc > 0)
+            self._contador += np.bincount(turno[usado], weights=parc[usado], minlength=len(self._contador))
+            keep &= parc > 0
+        ts, turno = ts[keep], turno[keep]
+        if len(ts) == 0:
+            return procesadas
+
+        # Cada evento cierra el gap que viene del anterior de su turno (o del inicio)
+        previo = np.empty_like(ts)
+        previo[1:] = ts[:-1]
+        nuevo = np.ones(len(ts), dtype=bool)
+        nuevo[1:] = turno[1:] != turno[:-1]
+        anterior = self._ultimo_evento[turno[nuevo]]
+        previo[nuevo] = np.where(anterior >= 0, anterior, tabla["turno_ini"][turno[nuevo]])
+        pa, pb, seg = self._restar_pausas(previo, ts)
+        self._pa.append(pa)
+        self._pb.append(pb)
+        self._seg.append(seg)
+        ultimo = np.ones(len(ts), dtype=bool)
+        ultimo[:-1] = turno[1:] != turno[:-1]
+        self._ultimo_evento[turno[ultimo]] = ts[ultimo]
+        return procesadas
+
+    def gap_abierto(self, ahora=None):
+        """Intervalo desde el último evento hasta `ahora` (o el fin del turno), o None."""
+        ahora = pd.Timestamp(ahora or datetime.now()).value
+        con_eventos = np.flatnonzero(self._ultimo_evento >= 0)
+        if len(con_eventos) == 0:
+            return None
+        t = con_eventos[-1]
+        desde, hasta = self._ultimo_evento[t], min(ahora, self._tabla["turno_fin"][t])
+        if hasta <= desde:
+            return None
+        return pd.Timestamp(desde), pd.Timestamp(hasta)
+
+    def resultado(self, ahora=None) -> dict:
+        """Mismo formato que calcular_reloj; incluye el gap abierto hasta `ahora`."""
+        resultado = resultado_vacio(self.maquina_id, self.fecha, self.calendario)
+        resultado["contador_total"] = float(self._contador.sum())
+        resultado["gap_abierto"] = self.gap_abierto(ahora)
+        con_eventos = self._ultimo_evento >= 0
+        if not con_eventos.any():
+            return resultado
+
+        # Gap final de cada turno con eventos: hasta su cierre o hasta `ahora`
+        ahora = pd.Timestamp(ahora or datetime.now()).value
+        desde = self._ultimo_evento[con_eventos]
+        hasta = np.minimum(self._tabla["turno_fin"][con_eventos], ahora)
+        abiertos = hasta > desde
+        pa, pb, seg = self._restar_pausas(desde[abiertos], hasta[abiertos])
+
+        pa = np.concatenate(self._pa + [pa])
+        pb = np.concatenate(self._pb + [pb])
+        seg = np.concatenate(self._seg + [seg])
+        orden = np.argsort(pa, kind="stable")  # los gaps no se solapan: orden = (turno, inicio)
+        return completar_resultado(resultado, self._tabla, con_eventos, pa[orden], pb[orden], seg[orden])
+
+
+# =========================================================
+# Monitor del turno en curso
+# =========================================================
+class MonitorVivo:
+    """
+    Consulta la fuente y mantiene un RelojEnVivo por máquina para el día del
+    turno en curso (y el anterior, por si sigue abierto un turno noche).
+    actualizar() se llama en cada sondeo; resultado() no vuelve a leer la fuente.
+    """
+
+    def __init__(self, origen: str, umbral_minutos=3, calendario=None):
+        self.fuente = FuenteIncremental(origen)
+        self.umbral_minutos = umbral_minutos
+        self.calendario = calendario or CALENDARIO_POR_DEFECTO
+        self.relojes = {}  # (Id Equipo, fecha) -> RelojEnVivo
+        self.ultima_actualizacion = None
+        self.ultimo_error = None
+        self._lock = threading.Lock()
+
+    def fecha_en_curso(self, maquina_id, ahora=None):
+        """Fecha del turno en curso: ayer si su turno noche sigue abierto, si no hoy."""
+        ahora = ahora or datetime.now()
+        ayer = ahora.date() - timedelta(days=1)
+        if any(t["fin"] > ahora for t in self.calendario.turnos(ayer, maquina_id)):
+            return ayer
+        return ahora.date()
+
+    def _reloj(self, maquina_id, fecha):
+        clave = (maquina_id, fecha)
+        if clave not in self.relojes:
+            self.relojes[clave] = RelojEnVivo(maquina_id, fecha, self.umbral_minutos, self.calendario)
+        return self.relojes[clave]
+
+    def actualizar(self, ahora=None) -> int:
+        """Lee las filas nuevas y las incorpora; devuelve cuántas llegaron."""
+        ahora = ahora or datetime.now()
+        hoy = ahora.date()
+        fechas = [hoy - timedelta(days=1), hoy]
+        with self._lock:
+            try:
+                nuevas = self.fuente.leer_nuevas()
+                self.ultimo_error = None
+            except Exception as e:  # fuente caída: se sigue mostrando lo último
+                self.ultimo_error = e
+                return 0
+            # Solo interesan el día en curso y el anterior
+            self.relojes = {k: r for k, r in self.relojes.items() if k[1] in fechas}
+            maquinas = nuevas["Id Equipo"].astype(str)
+            with etapa("vivo_incremental", filas=len(nuevas)):
+                for m, grupo in nuevas.groupby(maquinas, sort=False):
+                    for f in fechas:
+                        self._reloj(m, f).agregar(grupo)
+            self.ultima_actualizacion = ahora
+            return len(nuevas)
+
+    def resultado(self, maquina_id, ahora=None) -> dict:
+        ahora = ahora or datetime.now()
+        with self._lock:
+            return self._reloj(maquina_id, self.fecha_en_curso(maquina_id, ahora)).resultado(ahora)